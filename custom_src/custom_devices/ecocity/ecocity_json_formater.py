@@ -24,6 +24,12 @@
                 Parameter table must be of form {"frame_b64": "..."}} where the value us base64 encoded
                 {"publickKey":"sensor_ec_K1", "name":"FORWARD", "parameters" : {"frame_b64": "..."}}
 
+    Published readings
+        Each sample of the subscribed channels is published to the "json_data" channel
+        as a JSON document.  When the "batch_size" setting is above 1, the documents are
+        published as a JSON array of at most "batch_size" documents, at the latest
+        "batch_max_delay" seconds after its first reading.
+
 """
 __version__ = "$LastChangedRevision: 1427 $"
 VERSION_NUMBER = '$LastChangedRevision: 1427 $'[22:-2]
@@ -75,6 +81,9 @@ _PUSHJSON_TEMPLATE = string.Template("""
 }
 """)
 
+# domainId of the readings
+_ECN_DOMAIN_ID = 'SBI_ECN'
+
 # exception classes
 
 # interface functions
@@ -92,6 +101,9 @@ class EcocityJsonFormater(DeviceBase, threading.Thread):
         self.__cp = self.__cm.channel_publisher_get()
         self.__cdb = self.__cm.channel_database_get()
         self._ec_key_to_dia_command_channel_name_cache = {}
+        # per channel JSON templates, where only $timestamp and $value are left
+        self._channel_json_template_cache = {}
+        self._ec_access_point_pub_key = None
         
         self._logger = init_module_logger(name)
         self._subscribed_channels = []
@@ -100,9 +112,17 @@ class EcocityJsonFormater(DeviceBase, threading.Thread):
         self._dia_module_name_to_ec_device_public_key_setting_map = None
         self._sensor_channel_list_to_subscribe_to_setting = None
         self._incoming_command_channel_setting = None
+        self._batch_size_setting = None
+        self._batch_max_delay_setting = None
+        
+        # documents waiting to be published as a JSON array
+        self._json_data_batch = []
+        self._json_data_batch_deadline = None
         
         # semaphores and synchronization variables
         self._receive_sensor_data_callback_lock = threading.Lock()
+        # set when the first document of a batch is queued
+        self._json_data_batch_event = threading.Event()
         
         # will be appended to a DIA module name to get the name of the
         # channel to be used to send received commands
@@ -115,6 +135,8 @@ class EcocityJsonFormater(DeviceBase, threading.Thread):
             Setting(name='dia_channel_to_ec_sensor', type=dict, required=False, default_value={}),
             Setting(name='dia_module_to_ec_pub_key', type=dict, required=False, default_value={}),
             Setting(name='incoming_command_channel', type=str, required=False, default_value=''),
+            Setting(name='batch_size', type=int, required=False, default_value=1, verify_function=lambda x: x > 0),
+            Setting(name='batch_max_delay', type=int, required=False, default_value=10, verify_function=lambda x: x > 0),
 
             Setting(name='log_level', type=str, required=False, default_value='DEBUG', verify_function=check_debug_level_setting),
 
@@ -170,6 +192,12 @@ class EcocityJsonFormater(DeviceBase, threading.Thread):
         self._sensor_channel_list_to_subscribe_to_setting = SettingsBase.get_setting(self, 'channels')       
         self._ec_access_point_pub_key_setting = SettingsBase.get_setting(self, 'ec_access_point_pub_key')
         self._incoming_command_channel_setting = SettingsBase.get_setting(self, 'incoming_command_channel')
+        self._batch_size_setting = SettingsBase.get_setting(self, 'batch_size')
+        self._batch_max_delay_setting = SettingsBase.get_setting(self, 'batch_max_delay')
+        
+        # mappings may have changed
+        self._channel_json_template_cache = {}
+        self._ec_access_point_pub_key = None
         
         return (accepted, rejected, not_found)
 
@@ -217,98 +245,120 @@ class EcocityJsonFormater(DeviceBase, threading.Thread):
                 
         return "_UNDEFINED_"
 
-    def _build_json_data (self, ec_device_public_key, adapterId, float_ts, ec_accespoint_pub_key, ecn_sensor_name, value_object):
+    def _channel_json_template (self, channel_name):
+        """
+        Return the JSON template of the readings of a channel, where only $timestamp
+        and $value are left to substitute.
+        Templates are cached once the gateway id is known.
+        """
+        
+        template = self._channel_json_template_cache.get(channel_name)
+        if template:
+            return template
+            # NOT REACHED
+        
+        dia_module_name, dia_channel_name = channel_name.split ('.')
+        
+        # Compute the EC sensor name
+        # map dia channel name to ec sensor name
+        if self._dia_channel_name_to_ec_sensor_name_setting_map.has_key(dia_channel_name):
+            ecn_sensor_name = self._dia_channel_name_to_ec_sensor_name_setting_map.get(dia_channel_name)
+        else:
+            ecn_sensor_name = dia_channel_name
+        self._logger.debug('EC corresponding sensor name: %s' % ecn_sensor_name)
+        
+        # Compute the EC device public key
+        # map the dia module name to a key
+        if self._dia_module_name_to_ec_device_public_key_setting_map.has_key(dia_module_name):
+            ecn_device_public_key = self._dia_module_name_to_ec_device_public_key_setting_map.get(dia_module_name)
+        else:
+            # the key is the module mame          
+            ecn_device_public_key = dia_module_name
+        self._logger.debug('EC device public key: %s' % ecn_device_public_key)
+        
+        ec_accespoint_pub_key = self._get_cached_gw_id_for_ecn()
+        self._logger.debug('EC access point public key: %s' %(ec_accespoint_pub_key))
         
         # check each argument to prevent generating wrong Json
-        json_ec_device_public_key = self._valid_value_for_json_attribute(ec_device_public_key)
-        json_adapterId = self._valid_value_for_json_attribute(adapterId)
-        # currently, timestamps with millisecond accuracy are not supported by Ecocity
-        # round the timestamp to the second
-        json_ts = self._valid_value_for_json_attribute(str(int(float_ts)))
-        json_ec_accespoint_pub_key = self._valid_value_for_json_attribute(ec_accespoint_pub_key)
-        json_ecn_sensor_name = self._valid_value_for_json_attribute(ecn_sensor_name)
-        
-        value_object_type = type(value_object)
-        if (value_object_type == 'str'):
-            str_value_object = value_object
-        else :
-            str_value_object = str(value_object)
-        json_cv = self._valid_value_for_json_attribute(str_value_object)
-
         values = {
-            'accessPoint' : json_ec_accespoint_pub_key,
-            'device': json_ec_device_public_key,
-            'adapter': json_adapterId,
-            'timestamp': json_ts,
-            'sensor': json_ecn_sensor_name,
-            'value': json_cv
+            'accessPoint' : self._valid_value_for_json_attribute(ec_accespoint_pub_key),
+            'device': self._valid_value_for_json_attribute(ecn_device_public_key),
+            'adapter': self._valid_value_for_json_attribute(_ECN_DOMAIN_ID),
+            'sensor': self._valid_value_for_json_attribute(ecn_sensor_name)
         }
-
-        json_data = _PUSHJSON_TEMPLATE.substitute(values)
-
-        return json_data
+        # a '$' in a value must not be taken for a placeholder of the new template
+        for key, value in values.items():
+            values[key] = value.replace('$', '$$')
+        
+        template = string.Template(_PUSHJSON_TEMPLATE.safe_substitute(values))
+        
+        if self._ec_access_point_pub_key:
+            self._channel_json_template_cache[channel_name] = template
+        
+        return template
        
     # Called whenever there is a new sample
     # Keyword arguments:
     # channel -- the channel with the new sample
     #
     # This function handles reentrance, since sensors uploading data are acting in parallel.
-    # Indeed, the callback is called asynchronously
+    # Indeed, the callback is called asynchronously: documents are built in parallel,
+    # but published in a critical section
     # 
     def _receive_sensor_data_callback_synchronized(self, channel):
         
+        try:
+            sample = channel.get()
+            self._logger.debug('sample timestamps : %s' %(sample.timestamp))
+            
+            template = self._channel_json_template(channel.name())
+            
+            # currently, timestamps with millisecond accuracy are not supported by Ecocity
+            # round the timestamp to the second
+            json_data = template.substitute(timestamp=str(int(float(sample.timestamp))),
+                                            value=self._valid_value_for_json_attribute(str(sample.value)))
+            self._logger.debug('json_data is : %s' %(json_data))
+            
+        except :
+            self._logger.error('Unexpected error !!!')
+            self._logger.error(traceback.format_exc())
+            return
+        
         try:
             # critical section start
             self._receive_sensor_data_callback_lock.acquire()
             
-            try:
-                sample = channel.get()
-                # timestamp value
-                ts = sample.timestamp
-                self._logger.debug('sample timestamps : %s' %(ts))
-                # channel name (temperature, light, ...)
-                dia_module_name, dia_channel_name = channel.name().split ('.')
-                self._logger.debug('DIA channel name: %s' % dia_channel_name)
-                 
-                # Compute the EC sensor name
-                # map dia channel name to ec sensor name
-                if self._dia_channel_name_to_ec_sensor_name_setting_map.has_key(dia_channel_name):
-                    ecn_sensor_name = self._dia_channel_name_to_ec_sensor_name_setting_map.get(dia_channel_name)
-                else:
-                    ecn_sensor_name = dia_channel_name
-                self._logger.debug('EC corresponding sensor name: %s' % ecn_sensor_name)
-                
-                # Compute the EC device public key
-                # map the dia module name to a key
-                if self._dia_module_name_to_ec_device_public_key_setting_map.has_key(dia_module_name):
-                    ecn_device_public_key = self._dia_module_name_to_ec_device_public_key_setting_map.get(dia_module_name)
-                else:
-                    # the key is the module mame          
-                    ecn_device_public_key = dia_module_name
-                self._logger.debug('EC device public key: %s' % ecn_device_public_key)
-                
-                # channel value
-                cv = sample.value
-                
-                ec_accespoint_pub_key = self._get_gw_id_for_ecn()
-                self._logger.info('EC access point public key: %s' %(ec_accespoint_pub_key))
-                # domainId
-                dId = 'SBI_ECN'
-    
-                json_data = self._build_json_data (ecn_device_public_key, dId, ts, ec_accespoint_pub_key, ecn_sensor_name, cv)
-                self._logger.info('json_data is : %s' %(json_data))
-                
+            if self._batch_size_setting > 1:
+                self._json_data_batch.append(json_data)
+                if len(self._json_data_batch) == 1:
+                    self._json_data_batch_deadline = digitime.time() + self._batch_max_delay_setting
+                    self._json_data_batch_event.set()
+                if len(self._json_data_batch) >= self._batch_size_setting:
+                    self._publish_json_data_batch()
+            else:
                 self.property_set("json_data", Sample(0, json_data))
-                
-            except :
-                self._logger.error('Unexpected error !!!')
-                self._logger.error(traceback.format_exc())
-                return
             
         finally:
             # critical section end 
             self._receive_sensor_data_callback_lock.release()
             
+    def _publish_json_data_batch(self):
+        """
+        Publish the queued documents as a JSON array
+        Must be called in the critical section of the sensor data callback
+        """
+        
+        if not self._json_data_batch:
+            return
+            # NOT REACHED
+        
+        self._logger.debug('Publishing a batch of %d readings' % len(self._json_data_batch))
+        json_data = '[%s]' % ','.join(self._json_data_batch)
+        self._json_data_batch = []
+        self._json_data_batch_deadline = None
+        
+        self.property_set("json_data", Sample(0, json_data))
+            
     #################################################################################################
     def _new_ecocity_command_callback(self, command_channel):
         """
@@ -523,6 +573,21 @@ class EcocityJsonFormater(DeviceBase, threading.Thread):
                 
         return ecn_id
     
+    def _get_cached_gw_id_for_ecn (self):
+        """
+        Same as _get_gw_id_for_ecn, the id being computed once
+        """
+        
+        if self._ec_access_point_pub_key:
+            return self._ec_access_point_pub_key
+            # NOT REACHED
+        
+        ecn_id = self._get_gw_id_for_ecn()
+        if ecn_id != "__unknown__":
+            self._ec_access_point_pub_key = ecn_id
+        
+        return ecn_id
+    
     #
     # --
     #    
@@ -607,6 +672,8 @@ class EcocityJsonFormater(DeviceBase, threading.Thread):
             self._logger.info('Adding to channel manager subscription for channel %s.' % channel)
             self.__cp.subscribe(channel, new_sample_callback)
             self._subscribed_channels.append(channel)
+            # resolve the channel mapping once for all
+            self._channel_json_template(channel)
         else:
             self._logger.error('Channel %s already subscribed.' % (channel))
      
@@ -615,7 +682,25 @@ class EcocityJsonFormater(DeviceBase, threading.Thread):
         self._logger.debug("starting to run.")
         
         while not self.__stopevent.isSet():
-            digitime.sleep (60)
+            
+            # publish the pending batch when its delay expired
+            try:
+                self._receive_sensor_data_callback_lock.acquire()
+                
+                now = digitime.time()
+                if self._json_data_batch_deadline is not None and self._json_data_batch_deadline <= now:
+                    self._publish_json_data_batch()
+                # the event is set with the lock held: it cannot be missed
+                self._json_data_batch_event.clear()
+                if self._json_data_batch_deadline is None:
+                    timeout = 60
+                else:
+                    timeout = self._json_data_batch_deadline - now
+                
+            finally:
+                self._receive_sensor_data_callback_lock.release()
+                
+            self._json_data_batch_event.wait(timeout)
             
         self._logger.info("Out of run loop.  Shutting down...")
 
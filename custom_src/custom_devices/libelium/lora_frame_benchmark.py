@@ -0,0 +1,70 @@
+# $Id$
+
+"""
+    Replays a captured LoRa gateway serial stream through LoraFrameScanner
+
+    usage: python lora_frame_benchmark.py [capture.bin] [rounds]
+
+    The capture file holds the raw bytes read on the gateway serial port.
+    Without one, a stream of waspmote and gateway frames is generated.
+    The stream is fed one byte at a time, as the serial port used to be
+    read, and in larger chunks, as bulk reads return it.
+"""
+
+import os
+import sys
+import time
+
+# custom_src, where custom_lib and custom_devices are
+sys.path.insert(0, os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')))
+
+from custom_lib.commons.checksum import CRC16_MODBUS
+from custom_devices.libelium.lora_frame_scanner import LoraFrameScanner
+
+CHUNK_SIZES = (1, 16, 256, 4096)
+
+def make_stream():
+    frames = []
+    for i in range(200):
+        frames.append('<=>\x80\x03#35689722#node_%02d#%d#BAT:92#TCA:23.5#HUMA:45.2#\r\n'
+                      % (i % 10, i))
+        if i % 20 == 0:
+            payload = 'DATA:%d' % i
+            frames.append('\x01%s\r\n%04X\x04' % (payload, CRC16_MODBUS.compute(payload)))
+    return ''.join(frames)
+
+def replay(stream, chunk_size, rounds):
+    chunks = [stream[pos:pos + chunk_size]
+              for pos in range(0, len(stream), chunk_size)]
+    scanner = LoraFrameScanner()
+    start = time.time()
+    for i in range(rounds):
+        for chunk in chunks:
+            scanner.feed(chunk)
+    elapsed = time.time() - start
+    frames = scanner.frames_received
+    print '%6d byte reads: %7d frames %8.3f s %8.1f us/frame %8.2f MB/s' % (
+        chunk_size, frames, elapsed, elapsed * 1000000.0 / max(frames, 1),
+        scanner.bytes_received / max(elapsed, 1e-9) / 1000000.0)
+    return scanner
+
+def main():
+    rounds = 20
+    if len(sys.argv) > 2:
+        rounds = int(sys.argv[2])
+    if len(sys.argv) > 1:
+        capture = open(sys.argv[1], 'rb')
+        try:
+            stream = capture.read()
+        finally:
+            capture.close()
+    else:
+        stream = make_stream()
+
+    print 'replaying %d bytes %d times' % (len(stream), rounds)
+    for chunk_size in CHUNK_SIZES:
+        scanner = replay(stream, chunk_size, rounds)
+    print scanner.counters()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+# $Id$
+
+"""
+    Frame scanner for the serial stream of the Libelium LoRa gateway
+
+    Two types of frames may be received:
+    - gateway frames (delimited by SOH and EOT), as answer to frames sent
+      to the gateway: SOH payload CR LF crc EOT, where crc is the
+      CRC-16/MODBUS of the payload written as four hexadecimal digits
+    - waspmote frames (starting with <=>)
+
+    Bytes are appended in bulk to a receive buffer which is scanned for
+    delimiters with str.find, instead of running a state machine per byte.
+"""
+
+from custom_lib.commons.checksum import CRC16_MODBUS
+
+# Constants below are copied from FrameHandler.java
+# (project https://github.com/Orange-OpenSource/iot-libelium-lora-gateway)
+SOH = '\x01'
+CR = '\x0D'
+LF = '\x0A'
+EOT = '\x04'
+
+LETTER_HASH = '#'
+WASPMOTE_START = '<=>'
+
+# A waspmote ASCII frame starts with 4 hash separated header fields
+WASPMOTE_HEADER_HASHES = 4
+# Gateway frames end with 4 CRC digits and EOT after CR LF
+GATEWAY_TRAILER_SIZE = 7
+
+# Largest frame accepted, larger ones are dropped
+DEFAULT_MAX_FRAME_SIZE = 1024
+
+# classes
+
+class LoraFrameScanner:
+    """ Extracts frames from the bytes read on the LoRa gateway serial port.
+
+        feed() appends bytes to the receive buffer and returns the list of
+        frames completed by them.  A gateway frame is returned without its
+        delimiters, a waspmote frame from its '<=>' up to its final hash.
+    """
+
+    def __init__(self, logger=None, max_frame_size=DEFAULT_MAX_FRAME_SIZE):
+        self.__logger = logger
+        self.__max_frame_size = max_frame_size
+        self.__buffer = ''
+        # True while the buffer holds the start of an incomplete frame
+        self.__pending = False
+        self.reset_counters()
+
+    def reset(self):
+        """ Drops the bytes of the frame being assembled. """
+        self.__buffer = ''
+        self.__pending = False
+
+    def reset_counters(self):
+        self.bytes_received = 0
+        self.frames_received = 0
+        self.crc_errors = 0
+        self.framing_errors = 0
+        self.bytes_dropped = 0
+
+    def counters(self):
+        """ Returns the scanner counters as a dictionary. """
+        return {
+            'bytes_received': self.bytes_received,
+            'frames_received': self.frames_received,
+            'crc_errors': self.crc_errors,
+            'framing_errors': self.framing_errors,
+            'bytes_dropped': self.bytes_dropped,
+        }
+
+    def feed(self, data):
+        """ Returns the list of frames completed by the string data. """
+        self.bytes_received += len(data)
+        if self.__pending and data.find(LF) < 0 and data.find(EOT) < 0 and \
+                len(self.__buffer) + len(data) <= self.__max_frame_size:
+            # Every frame ends with LF or EOT, no need to scan again.
+            self.__buffer += data
+            return []
+        self.__pending = False
+        if self.__buffer:
+            buf = self.__buffer + data
+        else:
+            buf = data
+        frames = []
+        pos = 0
+        end = len(buf)
+
+        while pos < end:
+            # Skip to the next frame start.
+            soh = buf.find(SOH, pos)
+            lt = buf.find(WASPMOTE_START[0], pos)
+            if soh < 0 and lt < 0:
+                self.__drop(buf, pos, end)
+                pos = end
+                break
+            if soh < 0 or (lt >= 0 and lt < soh):
+                start = lt
+                scan = self.__scan_waspmote
+            else:
+                start = soh
+                scan = self.__scan_gateway
+            if start > pos:
+                self.__drop(buf, pos, start)
+                pos = start
+
+            frame, next_pos = scan(buf, pos, end)
+            if next_pos is None:
+                # Incomplete frame, wait for more bytes.
+                if end - pos > self.__max_frame_size:
+                    self.__error('frame larger than %d bytes' % self.__max_frame_size)
+                    pos = pos + 1
+                    continue
+                self.__pending = True
+                break
+            if frame is not None:
+                self.frames_received += 1
+                frames.append(frame)
+            pos = next_pos
+
+        self.__buffer = buf[pos:]
+        return frames
+
+    # Internal functions & classes
+
+    def __drop(self, buf, start, stop):
+        self.bytes_dropped += stop - start
+        if self.__logger is not None:
+            self.__logger.error('Incorrect bytes received: %s' % buf[start:stop].encode('hex'))
+
+    def __error(self, reason):
+        self.framing_errors += 1
+        if self.__logger is not None:
+            self.__logger.debug('Frame dropped, %s' % reason)
+
+    def __scan_gateway(self, buf, pos, end):
+        """ Scans the gateway frame starting at pos.
+
+            Returns (frame, next position), frame being None for an invalid
+            frame, or (None, None) if the frame is not complete.
+        """
+        cr = buf.find(CR, pos + 1)
+        if cr < 0 or cr + GATEWAY_TRAILER_SIZE > end:
+            return None, None
+        if buf[cr + 1] != LF:
+            self.__error('!= LF received: ' + hex(ord(buf[cr + 1])))
+            return None, cr + 1
+        if buf[cr + 6] != EOT:
+            self.__error('!= EOT received: ' + hex(ord(buf[cr + 6])))
+            return None, cr + 2
+        payload = buf[pos + 1:cr]
+        try:
+            crc = int(buf[cr + 2:cr + 6], 16)
+        except ValueError:
+            crc = None
+        if crc != CRC16_MODBUS.compute(payload):
+            self.crc_errors += 1
+            self.__error('bad CRC %r' % buf[cr + 2:cr + 6])
+            return None, cr + 7
+        return payload, cr + 7
+
+    def __scan_waspmote(self, buf, pos, end):
+        """ Scans the waspmote frame starting at pos, see __scan_gateway. """
+        if end - pos < 5:
+            if not WASPMOTE_START.startswith(buf[pos:pos + 3]):
+                self.__error('bad waspmote frame start')
+                return None, pos + 1
+            return None, None
+        if buf[pos:pos + 3] != WASPMOTE_START:
+            self.__error('bad waspmote frame start')
+            return None, pos + 1
+        if (ord(buf[pos + 3]) & 0x80) == 0:
+            # Binary frame.
+            self.__error('binary frame decoding not implemented yet')
+            return None, pos + 4
+
+        # ASCII frame, wait for the header hashes then one per field.
+        nb_hash = WASPMOTE_HEADER_HASHES + max(ord(buf[pos + 4]), 1)
+        last = pos + 4
+        while nb_hash:
+            last = buf.find(LETTER_HASH, last + 1)
+            if last < 0:
+                return None, None
+            nb_hash -= 1
+
+        # Undocumented trailing CR LF.
+        if last + 3 > end:
+            return None, None
+        if buf[last + 1] != CR:
+            self.__error('!= CR received: ' + hex(ord(buf[last + 1])))
+            return None, last + 1
+        if buf[last + 2] != LF:
+            self.__error('!= LF received: ' + hex(ord(buf[last + 2])))
+            return None, last + 2
+        return buf[pos:last + 1], last + 3
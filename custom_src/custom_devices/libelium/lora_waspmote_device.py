@@ -228,6 +228,7 @@ class LoraWaspmote(DeviceBase):
         self._logger.debug ('Found following information: %s' % str(io_sample))
           
         # route each information to its corresponding channel
+        samples = []
         for key in io_sample.keys():
             
             if libelium_to_dia_map.has_key(key):
@@ -269,7 +270,10 @@ class LoraWaspmote(DeviceBase):
                 
             # send the new sample
             self._logger.debug ('Put %s data to dia channel: %s' % (key, channel_name))
-            self.property_set(channel_name, sample)                
+            samples.append((channel_name, sample))
+
+        # send the new samples at once
+        self.property_set_many(samples)
                 
     def _send_command_to_sensor_cb(self, ecocity_command_sample):
         
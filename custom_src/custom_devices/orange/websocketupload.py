@@ -8,6 +8,12 @@ When a message is received it will by forwarded to the DIA channel named command
 It will subscribe to the read channel and forward to the WebSorcket server all the sample values
 received
 
+Sample values are queued by the channel publisher and sent by the driver thread, so
+that a slow or unreachable server does not stall the drivers publishing them.  While
+the server cannot be reached, reconnections are attempted with an increasing delay.
+The samples_queued, samples_sent, samples_dropped, samples_spilled and
+send_queue_length channels count the queued samples.
+
 Settings:
 
     server_port
@@ -24,6 +30,35 @@ Settings:
         Set to the desired WebSocket PING interval in seconds(default:120 = 2 minutes).
         If set to 0 (or negative), the WebSocket PING is disabled.         
         
+    send_queue_size
+        Maximum number of sample values waiting in memory to be sent (default: 256).
+        Taken into account at startup only.
+        
+    spill_file
+        When set, sample values which do not fit in the memory queue are appended to
+        this file and sent when the queue drains, even after a restart (default: none).
+        Otherwise, they are dropped.  Taken into account at startup only.
+        
+    spill_file_max_size
+        Maximum size in bytes of the spill file (default: 262144).
+        
+    samples_per_message
+        Number of queued sample values packed in one WebSocket message, separated by
+        sample_separator (default: 1, one message per sample value).
+        
+    sample_separator
+        Separator of the sample values packed in one message (default: line feed).
+        
+    permessage_deflate
+        If true, the permessage-compress extension is offered to the server, so that
+        messages are deflate compressed (default: false).  Messages are sent uncompressed
+        if the server declines it.  Mostly useful with samples_per_message above 1.
+        
+    deflate_window_bits
+        Size, in bits (9 to 15), of the deflate window used in both directions when
+        permessage_deflate is set (default: 15).  Smaller windows use less memory on the
+        gateway and on the server at the expense of the compression ratio.
+        
     log_level
         Defines the log level, with a string value compliant to the std logger package (ie. DEBUG, ERROR, ...)
 """
@@ -78,6 +113,8 @@ DYNDNS_PASSWORD     = 'pangoo'
 
 #--- Pangoo AO common definitions
 from custom_lib.commons.pangoolib import init_module_logger, check_debug_level_setting, update_logging_level
+from custom_lib.commons.send_queue import SendQueue
+from custom_lib.commons.event_loop import EventLoop
 
 TIMEOUT_INSTANTANEOUS = 0.1
 
@@ -88,9 +125,16 @@ MAIN_LOOP_IS_NOT_INSTANTANEOUS_WATCHDOG_DELAY = 60 * 30
 
 TIMEOUT_FOR_SERVER_TCP_SOCKET_CONNNECT = 10.0
 TIMEOUT_FOR_RW_TO_CONNECTED_WEBSOCKET = 1.5
-WAIT_TIME_BETWEEN_SUCCESSIVE_FAILD_SERVER_CONNECT = 30.0
 
-BLINK_TIME_BASE_SLEEP = 0.5
+# Delay before retrying a failed server connect, doubled after each failure
+MIN_WAIT_TIME_BETWEEN_SUCCESSIVE_FAILED_SERVER_CONNECT = 5.0
+MAX_WAIT_TIME_BETWEEN_SUCCESSIVE_FAILED_SERVER_CONNECT = 300.0
+
+# Maximum number of queued samples sent in one main loop iteration
+SEND_BATCH_MAX_SAMPLES = 64
+
+# Longest wait for server data, so that watchdogs are stroked in time
+MAIN_LOOP_MAX_WAIT = 60.0
 
 # classes
 
@@ -110,8 +154,23 @@ class websocketupload(DeviceBase, threading.Thread):
         self._server_conn_handle = None
         self._read_channel_name = None
         
-        self._keep_alive_timer = 0
-
+        # time of the last write to the server
+        self._last_write_time = 0
+        
+        # server socket, queued samples and timers events
+        self.__event_loop = EventLoop(self._logger)
+        self.__keep_alive_timer = None
+        self._websocket_ping_interval = 0
+        
+        # reconnection backoff
+        self.__reconnect_timer = None
+        self._reconnect_delay = MIN_WAIT_TIME_BETWEEN_SUCCESSIVE_FAILED_SERVER_CONNECT
+        
+        # samples waiting to be sent, created when the driver thread starts
+        self.__send_queue = None
+        self.__flush_scheduled = False
+        self.__samples_sent = 0
+        self.__published_counters = {}
         
         # stream used to communicate with websocket server
         self._websocket_stream = None
@@ -119,6 +178,8 @@ class websocketupload(DeviceBase, threading.Thread):
         self._server_port = None
         self._server_address = None
         self._activate_tcp_keepalive = None
+        self._permessage_deflate = None
+        self._deflate_window_bits = None
         self.__websocket_io_lock = threading.Lock()        
         
         # watchdogs
@@ -141,6 +202,24 @@ class websocketupload(DeviceBase, threading.Thread):
                 name='resource_uri', type=str, required=True),
             Setting(
                 name='websocket_ping_interval', type=int, required=False, default_value=120),
+            Setting(
+                name='send_queue_size', type=int, required=False, default_value=256,
+                verify_function=lambda x: x > 0),
+            Setting(
+                name='spill_file', type=str, required=False, default_value=''),
+            Setting(
+                name='spill_file_max_size', type=int, required=False, default_value=256 * 1024,
+                verify_function=lambda x: x >= 0),
+            Setting(
+                name='samples_per_message', type=int, required=False, default_value=1,
+                verify_function=lambda x: x > 0),
+            Setting(
+                name='sample_separator', type=str, required=False, default_value='\n'),
+            Setting(
+                name='permessage_deflate', type=bool, required=False, default_value=False),
+            Setting(
+                name='deflate_window_bits', type=int, required=False, default_value=15,
+                verify_function=lambda x: 9 <= x <= 15),
             Setting(
                 name='log_level', type=str, required=True, default_value='DEBUG', verify_function=check_debug_level_setting),                  
         ]
@@ -161,6 +240,31 @@ class websocketupload(DeviceBase, threading.Thread):
                 perms_mask= DPROP_PERM_GET,
                 options=DPROP_OPT_AUTOTIMESTAMP),                         
 
+            ChannelSourceDeviceProperty(name='samples_queued', type=int,
+                initial=Sample(timestamp=0, value=0),
+                perms_mask=DPROP_PERM_GET,
+                options=DPROP_OPT_AUTOTIMESTAMP),
+
+            ChannelSourceDeviceProperty(name='samples_sent', type=int,
+                initial=Sample(timestamp=0, value=0),
+                perms_mask=DPROP_PERM_GET,
+                options=DPROP_OPT_AUTOTIMESTAMP),
+
+            ChannelSourceDeviceProperty(name='samples_dropped', type=int,
+                initial=Sample(timestamp=0, value=0),
+                perms_mask=DPROP_PERM_GET,
+                options=DPROP_OPT_AUTOTIMESTAMP),
+
+            ChannelSourceDeviceProperty(name='samples_spilled', type=int,
+                initial=Sample(timestamp=0, value=0),
+                perms_mask=DPROP_PERM_GET,
+                options=DPROP_OPT_AUTOTIMESTAMP),
+
+            ChannelSourceDeviceProperty(name='send_queue_length', type=int,
+                initial=Sample(timestamp=0, value=0),
+                perms_mask=DPROP_PERM_GET,
+                options=DPROP_OPT_AUTOTIMESTAMP),
+
         ]        
         
         
@@ -196,11 +300,17 @@ class websocketupload(DeviceBase, threading.Thread):
         self._server_address = SettingsBase.get_setting(self, 'server_address')
         self._activate_tcp_keepalive = SettingsBase.get_setting(self, 'activate_tcp_keepalive')
         self._resource_uri = SettingsBase.get_setting(self, 'resource_uri')
+        self._samples_per_message = SettingsBase.get_setting(self, 'samples_per_message')
+        self._sample_separator = SettingsBase.get_setting(self, 'sample_separator')
+        self._permessage_deflate = SettingsBase.get_setting(self, 'permessage_deflate')
+        self._deflate_window_bits = SettingsBase.get_setting(self, 'deflate_window_bits')
         
         settings_needing_connection_reset = ['server_address',
                                              'server_port',
                                              'resource_uri',
-                                             'activate_tcp_keepalive']
+                                             'activate_tcp_keepalive',
+                                             'permessage_deflate',
+                                             'deflate_window_bits']
         
         # If intersection of "accepted" list and "settings_needing_connection_reset" list is not empty.
         # we need to reset the socket connection
@@ -245,12 +355,19 @@ class websocketupload(DeviceBase, threading.Thread):
 
         # Get settings to initialize local class variables
         
-        websocket_ping_interval = SettingsBase.get_setting(self, 'websocket_ping_interval')
-        websocket_ping_interval_timer_total_blinks = websocket_ping_interval*(1.0/BLINK_TIME_BASE_SLEEP)
-            
-        ao_server_connexion_timer_total_blinks = WAIT_TIME_BETWEEN_SUCCESSIVE_FAILD_SERVER_CONNECT*(1.0/BLINK_TIME_BASE_SLEEP)
+        self._websocket_ping_interval = SettingsBase.get_setting(self, 'websocket_ping_interval')
+        
+        spill_file = SettingsBase.get_setting(self, 'spill_file')
+        if not spill_file:
+            spill_file = None
+        self.__send_queue = SendQueue(SettingsBase.get_setting(self, 'send_queue_size'),
+                                      spill_file,
+                                      SettingsBase.get_setting(self, 'spill_file_max_size'),
+                                      self._logger)
+        if len(self.__send_queue):
+            self._logger.info('%d samples left in spill file %s' % (len(self.__send_queue), spill_file))
 
-        self._open_websocket_connection_synchronized()
+        self._try_to_open_websocket_connection()
         
         #subscribe to the response channels
         cm = self.__core.get_service("channel_manager")
@@ -265,22 +382,15 @@ class websocketupload(DeviceBase, threading.Thread):
         #
         # Loop body
         #
-      
-        
-        conn_cnt = 0
-        
-        blink_cnt = 0
-        mainloop_made_a_pause_strike_cnt = 0
-        
-        take_a_delay_in_next_loop_iteration = False
+        # Server messages are processed as soon as they are received,
+        # queued samples as soon as the publisher wakes the loop up and
+        # keep alives and reconnections are run from timers
         
         while(True):
             
-            if (take_a_delay_in_next_loop_iteration):
-                # take a rest
-                time.sleep(BLINK_TIME_BASE_SLEEP)
-                mainloop_made_a_pause_strike_cnt += 1
-                
+            events_count = self.__event_loop.run_once(MAIN_LOOP_MAX_WAIT)
+            
+            if (events_count == 0):
                 # WARNING: infinite active loop risk here
                 # To prevent this, we use a watchdog to check that to insure that this code
                 # is executed some times
@@ -290,84 +400,79 @@ class websocketupload(DeviceBase, threading.Thread):
             # Notify the watchdog that we are still looping
             if (self._mainloop_made_one_loop):
                 self._mainloop_made_one_loop.stroke()
-
-            blink_cnt += 1
-            if (blink_cnt > 50):
-                blink_cnt = 0
-                self._logger.debug('Blink after %d iterations' % mainloop_made_a_pause_strike_cnt)
-                mainloop_made_a_pause_strike_cnt = 0
                 
-            if (self._server_conn_handle):
-                
-                # Connected to AO server: we can process datas
-                
-
-                # WARNING: this may introduce an infinite loop
-                # The loop ends only if no more data are available for processing
-                #
-                # The watchdog is of this loop so that if this loop lasts to much time,
-                # the watchdog resets everything
-                
-                # poll for work
-                data_has_been_processed = self._websocket_server_poll()
-                if (data_has_been_processed):
-                    # _websocket_server_poll does not consume all available data
-                    # so, loop immediately as long as data are available
-                    take_a_delay_in_next_loop_iteration = False
-                else:
-                    # _websocket_server_poll processed no data, which means that no data is currently available.
-                    # so, in the next loop iteration, we tell to take a rest
-                    take_a_delay_in_next_loop_iteration = True
+            if (not self._server_conn_handle and not self.__reconnect_timer):
+                # Connection lost: try first to reopen it
+                self._logger.info('Retry to open TCP connection')
+                self.__reconnect_timer = self.__event_loop.call_soon(self._try_to_open_websocket_connection)
                     
-                if (websocket_ping_interval > 0):
-                    self._keep_alive_timer += 1
-                    if (self._keep_alive_timer >= websocket_ping_interval_timer_total_blinks):
-                        self._send_keep_alive_synchronized()
-                        self._keep_alive_timer = 0                 
-                
-            else:
-                
-                # Not connected to AO server: try first to connect to it
-                
-                take_a_delay_in_next_loop_iteration = True
-                
-                conn_cnt += 1
-                if (conn_cnt > ao_server_connexion_timer_total_blinks):
-                    
-                    self._logger.info('Retry to open TCP connection')
-                    
-                    conn_cnt = 0
-                    #open our server connection
-                    self._open_websocket_connection_synchronized()
+            self.__update_counters()
                     
-    def _write_payload_to_websocket_synchronized (self, payload, binary=False):
-        """Send a message to a supposed open socket connected to the WebSocket server"""
-
+    def _schedule_flush(self):
+        """Wake the driver thread up to send the queued samples"""
+        
+        if not self.__flush_scheduled:
+            self.__flush_scheduled = True
+            self.__event_loop.call_soon(self._flush_send_queue)
+        
+    def _flush_send_queue(self):
+        """Send queued samples to the WebSocket server.
+        Samples which could not be sent are put back in the queue.
+        Returns the number of samples sent"""
+        
+        self.__flush_scheduled = False
+        if not self._server_conn_handle:
+            # sent once connected
+            return 0
+        
+        samples = self.__send_queue.get_batch(SEND_BATCH_MAX_SAMPLES)
+        if not samples:
+            return 0
+        
+        sent = 0
+        
         try:
             # critical section start
-            self.__websocket_io_lock.acquire()  
+            self.__websocket_io_lock.acquire()
             
-            done = False
-        
-            try:
+            # check if the WebSocket client API considers that the connection is still in an "opened" state
+            if self._server_conn_handle and \
+                self._websocket_stream and \
+                self._websocket_stream._request and \
+                self._websocket_stream._request.client_terminated:
                 
-                self._logger.debug("Write payload to socket.")
-                self._server_conn_handle.settimeout(TIMEOUT_FOR_RW_TO_CONNECTED_WEBSOCKET)                
-                self._websocket_stream.send_message(message=payload, binary=binary)
-                done = True
-                
-            except Exception, msg:
-                self._logger.error('Exception raised during write operation to the socket connected to WebSocket server. Exception was: %s' % msg)
-                # FIXME: debug
-                traceback.print_exc()
+                self._logger.info('WebSocket has been closed by peer.')
                 self._release_socket_to_closed_websocket_connection()
                 
-            return done
-        
+            if self._server_conn_handle:
+                
+                try:
+                    self._logger.debug("Forward %d samples to WebSocket server." % len(samples))
+                    self._server_conn_handle.settimeout(TIMEOUT_FOR_RW_TO_CONNECTED_WEBSOCKET)
+                    while sent < len(samples):
+                        message = samples[sent:sent + self._samples_per_message]
+                        self._websocket_stream.send_message(message=self._sample_separator.join(message), binary=False)
+                        sent += len(message)
+                    
+                except Exception, msg:
+                    self._logger.error('Exception raised during write operation to the socket connected to WebSocket server. Exception was: %s' % msg)
+                    self._release_socket_to_closed_websocket_connection()
+                
         finally:
             # critical section end 
             self.__websocket_io_lock.release()
             
+        if sent:
+            self.__samples_sent += sent
+            # we interacted with the server
+            self._last_write_time = time.time()
+        if sent < len(samples):
+            self.__send_queue.unget_batch(samples[sent:])
+        elif len(self.__send_queue):
+            # let server messages be processed between batches
+            self._schedule_flush()
+            
+        return sent
             
     def _send_keep_alive_synchronized(self):
         """Send a PING message to a supposed open socket connected to the WebSocket server"""
@@ -378,7 +483,7 @@ class websocketupload(DeviceBase, threading.Thread):
             
             done = False       
         
-            self._keep_alive_timer = 0 # reset keep_alive timer
+            self._last_write_time = time.time() # reset keep_alive timer
             try:
                 self._logger.debug('Sends a WebSocket PING frame')
                 self._server_conn_handle.settimeout(TIMEOUT_FOR_RW_TO_CONNECTED_WEBSOCKET)                
@@ -398,48 +503,6 @@ class websocketupload(DeviceBase, threading.Thread):
             self.__websocket_io_lock.release()                       
 
             
-    def _send_payload_to_websocket_server (self, payload=None, reopen_closed_websocket=True, doPing=False):
-        """Send a payload to a WebSocket.
-        Try to reopen it if it is closed when repoen_if_closed is set
-        
-        WARNING: This method is call asynchronously. Indeed, we don't know in which state the WebSocket connection is.
-        """
-        
-        done = False
-                
-        # check if the WebSocket client API considers that the connection is still in an "opened" state
-        # we must check that all the objects are instantiated correctly before checking there attributes
-        if self._server_conn_handle and \
-            self._websocket_stream and \
-            self._websocket_stream._request and \
-            self._websocket_stream._request.client_terminated:
-            
-            self._logger.info('WebSocket has been closed by peer.')
-            self._release_socket_to_closed_websocket_connection()
-
-        if not self._server_conn_handle and reopen_closed_websocket:
-            # The WebScocket connection is currently closed
-            self._logger.info('The WebSocket connection is currently closed. Try to reopen it right now...')
-            self._open_websocket_connection_synchronized()
-            # If it did no work, self._server_conn_handle value remains None
-
-        if self._server_conn_handle:
-            # if the connection to the WebSocket server is opened, try to send this new data to it
-            
-            self._logger.debug("Forward sample to WebSocket server.")
-            if payload:
-                done = self._write_payload_to_websocket_synchronized(payload)
-                self._keep_alive_timer = 0 # Reset our keep alive timer because we interacted with the server
-            elif doPing:
-                done = self.__send_keep_alive_synchronized()
-            else:
-                self._logger.critical ("Bad parameters to _send_payload_to_websocket_server function")
-                
-        else:
-            self._logger.error("WebSocket connection closed. Sample not forwarded.")    
-            
-        return done                
-            
     def _receive_data_from_dia(self, channel):
         """A new sample has arrived on one of the response channels
         we are monitoring, send message to server"""
@@ -449,7 +512,20 @@ class websocketupload(DeviceBase, threading.Thread):
 
         self._logger.debug('Received the following new sample from channel %s: %s' % (channel.name(), payload))
         
-        self._send_payload_to_websocket_server (payload, reopen_closed_websocket=True)
+        # the driver thread sends it
+        if not self.__send_queue.put(payload):
+            self._logger.error('Send queue full. Sample not forwarded.')
+        self._schedule_flush()
+
+    def __update_counters(self):
+        """Publishes the send counters which changed"""
+        
+        counters = self.__send_queue.counters()
+        counters['samples_sent'] = self.__samples_sent
+        for name, value in counters.items():
+            if self.__published_counters.get(name) != value:
+                self.property_set(name, Sample(digitime.time(), value))
+                self.__published_counters[name] = value
 
     #-------------------------------------
     def _init_hardware_board_system_config(self):
@@ -485,8 +561,7 @@ class websocketupload(DeviceBase, threading.Thread):
                 # FIXME: no closing handshake
                 self._logger.error ('Should do closing handshake...')
                 
-                self._server_conn_handle.close()
-                self._server_conn_handle = None
+                self._release_socket_to_closed_websocket_connection()
         finally:
             # critical section start
             self.__websocket_io_lock.release()                
@@ -494,7 +569,11 @@ class websocketupload(DeviceBase, threading.Thread):
             
     def _release_socket_to_closed_websocket_connection(self):            
         """Close the tcp connection to the server"""
+        if self.__keep_alive_timer:
+            self.__keep_alive_timer.cancel()
+            self.__keep_alive_timer = None
         if self._server_conn_handle:
+            self.__event_loop.remove_reader(self._server_conn_handle)
             try:
                 self._server_conn_handle.close()
             except:
@@ -533,6 +612,8 @@ class websocketupload(DeviceBase, threading.Thread):
         options.ensure_value('version_header', -1)
         options.ensure_value('deflate_frame', False)
         options.ensure_value('deflate_stream', False)
+        options.ensure_value('permessage_deflate', self._permessage_deflate)
+        options.ensure_value('deflate_window_bits', self._deflate_window_bits)
          
         if (version == _PROTOCOL_VERSION_HYBI08 or
             version == _PROTOCOL_VERSION_HYBI13):
@@ -573,6 +654,12 @@ class websocketupload(DeviceBase, threading.Thread):
                 processor = self._options.deflate_frame
                 processor.setup_stream_options(stream_option)
 
+            if options.permessage_deflate is not False:
+                self._logger.info('Messages are deflate compressed')
+                options.permessage_deflate.setup_stream_options(stream_option)
+            elif self._permessage_deflate:
+                self._logger.info('Server declined message compression')
+
             self._websocket_stream = Stream(request, stream_option)
         elif version == _PROTOCOL_VERSION_HYBI00:
             self._websocket_stream = StreamHixie75(request, True)
@@ -580,6 +667,43 @@ class websocketupload(DeviceBase, threading.Thread):
         self._websocket_stream._logger = self._logger
        
 
+    def _try_to_open_websocket_connection(self):
+        """Establish the websocket connection to the server.
+        On failure, the delay before the next attempt is doubled"""
+        
+        self.__reconnect_timer = None
+        if self._server_conn_handle:
+            return
+        
+        self._open_websocket_connection_synchronized()
+        
+        if self._server_conn_handle:
+            self._reconnect_delay = MIN_WAIT_TIME_BETWEEN_SUCCESSIVE_FAILED_SERVER_CONNECT
+            self._last_write_time = time.time()
+            self.__event_loop.add_reader(self._server_conn_handle, self._websocket_server_poll)
+            if (self._websocket_ping_interval > 0):
+                self.__keep_alive_timer = self.__event_loop.call_later(self._websocket_ping_interval, self._keep_alive_check)
+            # send samples queued while disconnected
+            self._schedule_flush()
+        else:
+            self._logger.info('Will retry to connect in %d seconds' % self._reconnect_delay)
+            self.__reconnect_timer = self.__event_loop.call_later(self._reconnect_delay, self._try_to_open_websocket_connection)
+            self._reconnect_delay = min(self._reconnect_delay * 2,
+                                        MAX_WAIT_TIME_BETWEEN_SUCCESSIVE_FAILED_SERVER_CONNECT)
+
+    def _keep_alive_check(self):
+        """Timer callback sending a PING when nothing has been sent for websocket_ping_interval"""
+        
+        self.__keep_alive_timer = None
+        if not self._server_conn_handle:
+            return
+        idle_time = time.time() - self._last_write_time
+        if (idle_time >= self._websocket_ping_interval):
+            self._send_keep_alive_synchronized()
+            idle_time = 0
+        if self._server_conn_handle:
+            self.__keep_alive_timer = self.__event_loop.call_later(self._websocket_ping_interval - idle_time, self._keep_alive_check)
+
     def _open_websocket_connection_synchronized(self):
         
         """Establish the websocket connection to the server"""
@@ -614,7 +738,7 @@ class websocketupload(DeviceBase, threading.Thread):
                 self._logger.info('TCP socket successfully opened to %s:%d' % (ip, port))
                 
             except Exception, msg:
-                self._logger.critical('IP connect failed to %s:%d. Error was: %s. Will retry in %d seconds'%(ip, port, msg, WAIT_TIME_BETWEEN_SUCCESSIVE_FAILD_SERVER_CONNECT))
+                self._logger.critical('IP connect failed to %s:%d. Error was: %s.'%(ip, port, msg))
                 
                 # In some cases for SocketException, the msg is formated as a tuple, so that it contains an error code as first field.
                 # We get the first element and compare it to known errors
@@ -646,27 +770,14 @@ class websocketupload(DeviceBase, threading.Thread):
             
 
     def _websocket_server_poll(self):
-        ''' Poll for data from the server and WP DD to process.
-        When no data has been processed, return False
-        Return True in any data (from AO server or DD) has been processed
+        ''' Reader callback processing a message from the WebSocket server
         '''
         
-        # Give priority to DD response message.
-        # So, before checking for now messages from AO server,
-        # check (and process ALL) messages from DD
-        
-        any_data_has_been_processed = False
-
-       
         # handle socket requests from server
         websocket_packet = self._receive_websocketserver_message_synchronized(TIMEOUT_INSTANTANEOUS)
         
         if (websocket_packet):
-            
-            any_data_has_been_processed = True
             self._process_websocketserver_received_message(websocket_packet)
-            
-        return any_data_has_been_processed
     
     #-------------------------------------
     def _receive_websocketserver_message_synchronized(self, timeout):
@@ -694,8 +805,19 @@ class websocketupload(DeviceBase, threading.Thread):
      
             try:
                 self._server_conn_handle.settimeout(timeout)
+                
+                # the socket is readable: nothing to read means closed by peer
+                if not self._server_conn_handle.recv(1, socket.MSG_PEEK):
+                    self._logger.info('WebSocket has been closed by peer without closing handshake')
+                    self._release_socket_to_closed_websocket_connection()
+                    return None
+                
                 received = self._websocket_stream.receive_message()
                 
+            except socket.timeout:
+                # nothing to read
+                pass
+                
             except ConnectionTerminatedException :
                 # When method receive_message runs into a timeout, ConnectionTerminatedException exception is raised
                 pass
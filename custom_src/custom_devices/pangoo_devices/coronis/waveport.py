@@ -64,6 +64,7 @@ from settings.settings_base import SettingsBase, Setting
 from channels.channel_source_device_property import *
 
 from custom_lib.commons import PANGOO_STRING_SAMPLE_FOR_DD_ERROR
+from custom_lib.commons.checksum import CRC16_WAVENIS
 
 # constants
 # =========
@@ -94,6 +95,11 @@ TIMEOUT_WAVENIS_RADIO_RESPONSE = 40.000
 TIMEOUT_WAVEPORT_STX_LEN = 0.050
 TIMEOUT_WAVEPORT_BODY = 0.200
 
+# Size of the queue of frames received from the waveport and
+# maximum number of bytes read at once on the serial port
+WP_RECEIVED_FRAMES_QUEUE_SIZE = 64
+WP_MAX_READ_SIZE = 1024
+
 MAX_ACK_ATTEMPTS = 3
 
 WP_SYNC = '\xff'
@@ -180,6 +186,135 @@ MSG_TUPLE_MESSAGE = 2
 wavenis_frame_to_emit_channel_name = 'emit'
 received_wavenis_frame_channel_name = 'received'
 
+class WaveportReader(threading.Thread):
+    """Reads the waveport serial port into a rolling receive buffer and
+    delivers the valid frames found in it through the frames queue.
+
+    A frame is SYNC STX LEN CMD DATA CRC1 CRC2 ETX, LEN counting the bytes
+    from CMD to ETX.  When a frame is invalid, scanning resumes right after
+    its SYNC byte, so that the frames following it are kept.
+    """
+    def __init__(self, device, serial_handle, stopevent):
+        threading.Thread.__init__(self, name=device.get_name() + '_reader')
+        threading.Thread.setDaemon(self, True)
+
+        self.__device = device
+        self.__serial = serial_handle
+        self.__stopevent = stopevent
+        self.__buffer = ''
+        # time at which bytes were last appended to the buffer
+        self.__last_rx_time = 0
+
+        # items are (command, length, message) tuples
+        self.frames = Queue.Queue(WP_RECEIVED_FRAMES_QUEUE_SIZE)
+
+        # statistics
+        self.frames_received = 0
+        self.frames_lost = 0
+        self.crc_errors = 0
+        self.resyncs = 0
+        self.bytes_dropped = 0
+
+    def run(self):
+        logger = self.__device.logger
+        self.__serial.setTimeout(TIMEOUT_INSTANTANEOUS)
+
+        while not self.__stopevent.isSet():
+            try:
+                data = self.__serial.read(1)
+                if data:
+                    waiting = self.__serial.inWaiting()
+                    if waiting > 0:
+                        data += self.__serial.read(min(waiting, WP_MAX_READ_SIZE))
+            except Exception, msg:
+                logger.critical('Exception while reading waveport serial interface: %s' % msg)
+                time.sleep(TIMEOUT_INSTANTANEOUS)
+                continue
+
+            now = time.time()
+            if data:
+                self.__buffer += data
+                self.__last_rx_time = now
+            elif self.__buffer and now - self.__last_rx_time > TIMEOUT_WAVEPORT_BODY:
+                # the frame at the head of the buffer will not complete
+                logger.critical("Incomplete packet, len:%d" % len(self.__buffer))
+                self.resyncs += 1
+                self.bytes_dropped += 1
+                self.__buffer = self.__buffer[1:]
+            else:
+                continue
+
+            for message in self.extract_frames():
+                self.frames_received += 1
+                try:
+                    pkt_tuple = self.__device.process_received_frame(message)
+                    self.frames.put(pkt_tuple, False)
+                except Queue.Full:
+                    self.frames_lost += 1
+                    logger.critical('Received frames queue full, frame lost')
+                except Exception:
+                    logger.critical('Caught a critical unexpected exception: %s' % traceback.format_exc())
+
+    def extract_frames(self):
+        """Remove the complete frames from the receive buffer.
+
+        Returns the list of valid messages, each being LEN CMD DATA CRC1
+        CRC2 ETX.  Invalid frames are logged and dropped."""
+        logger = self.__device.logger
+        buf = self.__buffer
+        messages = []
+        pos = 0
+
+        while True:
+            start = buf.find(WP_SYNC + WP_STX, pos)
+            if start < 0:
+                # keep a trailing SYNC, STX may follow it
+                end = len(buf)
+                if buf.endswith(WP_SYNC):
+                    end = end - 1
+                self.bytes_dropped += end - pos
+                pos = end
+                break
+            self.bytes_dropped += start - pos
+            pos = start
+
+            if len(buf) < start + 3:
+                break
+            pkt_length = ord(buf[start + 2])
+            # at least CMD, CRC1, CRC2, ETX
+            if pkt_length < 4:
+                logger.critical("Invalid packet length:%d" % pkt_length)
+                self.resyncs += 1
+                pos = start + 1
+                continue
+            if len(buf) < start + 3 + pkt_length:
+                # wait for rest of packet
+                break
+
+            message = buf[start + 2:start + 3 + pkt_length] # want Len included
+
+            # now validate the CRC, include LEN, CMD to end of data
+            crc_calc = CRC16_WAVENIS.compute(message[:pkt_length - 2])
+            crc_in_pkt = struct.unpack('<H', message[pkt_length - 2:pkt_length])[0]
+            if (crc_calc != crc_in_pkt):
+                logger.critical("BAD CRC rx-crc:%04x calc:%04x" % (crc_in_pkt, crc_calc))
+                self.crc_errors += 1
+                self.resyncs += 1
+                pos = start + 1
+                continue
+
+            if (message[pkt_length] != WP_ETX):
+                logger.critical("Expected ETX")
+                self.resyncs += 1
+                pos = start + 1
+                continue
+
+            messages.append(message)
+            pos = start + 3 + pkt_length
+
+        self.__buffer = buf[pos:]
+        return messages
+
 class WaveportDevice(DeviceBase, threading.Thread):
     """The Waveport Device Driver class
     """
@@ -201,6 +336,9 @@ class WaveportDevice(DeviceBase, threading.Thread):
         
         self._min_delay_between_successive_exchanges_with_waveport = None
         self._time_of_last_exchange_with_waveport = 0
+        # serializes the writes of the reader thread (ACKs) and ours
+        self.__write_lock = threading.RLock()
+        self.__reader = None
         
         ## Settings Table Definition:
         settings_list = [
@@ -323,6 +461,9 @@ class WaveportDevice(DeviceBase, threading.Thread):
             self.logger.critical('Exception during serial port initialization. Error was: %s' % msg)
             return False
 
+        self.__reader = WaveportReader(self, self.waveport_handle, self.__stopevent)
+        self.__reader.start()
+
         # apply waveport system configuration, if requested
         if (SettingsBase.get_setting(self, 'do_waveport_initialization')):
             self.init_waveport_config()
@@ -455,88 +596,41 @@ class WaveportDevice(DeviceBase, threading.Thread):
         
     #-------------------------------------
     def read_packet_from_waveport(self, timeout):
-        """ Wait for a packet in comm rx-data, with timeout """
-
-        # see wp.py::wp_wait_pkt() for previous handler.
-        # Example: SERIAL_ACK_FRAME =  SYNC ETX LEN CMD.... CRC1 CRC2 ETX =
-        # WP_SYNC + WP_STX + '\x04' + SERIAL_ACK + '\x56' + '\x02' + WP_ETX
+        """ Wait for a packet delivered by the reader thread, with timeout """
 
-        # wait for header: SYNC byte.
-        self.waveport_handle.setTimeout(timeout)
-        header = self.waveport_handle.read(1)
-        if len(header) == 0:
+        try:
+            return self.__reader.frames.get(True, timeout)
+        except Queue.Empty:
             #nothing to read, so don't complain
             if (timeout != TIMEOUT_INSTANTANEOUS):
                 self.logger.critical("No receive data %f timeout" % timeout)
             return None
-        if len(header) != 1:
-            self.logger.critial("Unexpected Error on SYNC")
-            return None
-
-        self.logger.debug(self.ms_tstamp() + "rx SYNC")
-
-        # wait for rest of header: STX, LEN bytes
-        self.waveport_handle.setTimeout(TIMEOUT_WAVEPORT_STX_LEN)
-        header = self.waveport_handle.read(2)
-        if len(header) != 2:
-            self.logger.critical("Incomplete Header")
-            return None
-
-        if (header[0] != WP_STX):
-            self.logger.critical("Expected STX")
-            
-            # Make following into flush routine
-            self.waveport_handle.setTimeout(TIMEOUT_INSTANTANEOUS)
-            junk = self.waveport_handle.read(100)
-            
-            return None
-
-        self.logger.debug(self.ms_tstamp() + "STX,LEN")
-
-        pkt_stx = ord(header[0])
-        pkt_length = ord(header[1])
-
-        # wait for rest of packet based on hdr length: CMD,DATA,CRC1,CRC2,ETX
-        self.waveport_handle.setTimeout(TIMEOUT_WAVEPORT_BODY)
-        payload = self.waveport_handle.read(pkt_length)
-        if len(payload) != pkt_length:
-            self.logger.critical("Incomplete packet, len:%d wanted:%d" % (len(payload), pkt_length))
-            return None
-
-        message = header[1:] + payload # want Len included
-
-        self.logger.debug(self.ms_tstamp() + "RX")
-
-        # now validate the CRC, include LEN, CMD to end of data
-        crc_calc = self.wp_crc(message[:pkt_length - 2])
-
-        crc_in_pkt = struct.unpack('<H', message[pkt_length - 2:pkt_length])[0]
 
-        if (crc_calc != crc_in_pkt):
-            self.logger.critical("BAD CRC rx-crc:%04x calc:%04x" % (crc_in_pkt, crc_calc))
-            # FIXME: should send a NACK
-            return None
+    #-------------------------------------
+    def process_received_frame(self, message):
+        """ Called by the reader thread for each valid frame received.
+        Acknowledges the frame when required and returns the
+        (command, length, message) tuple to deliver """
 
-        if (message[pkt_length] != WP_ETX):
-            self.logger.critical("Expected ETX")
-            # FIXME: should send a NACK
-            return None
+        # Example: SERIAL_ACK_FRAME =  SYNC ETX LEN CMD.... CRC1 CRC2 ETX =
+        # WP_SYNC + WP_STX + '\x04' + SERIAL_ACK + '\x56' + '\x02' + WP_ETX
 
         # We have a validated packet.
-        self.logger.debug(self.ms_tstamp() + "RX Valid Message:%s" % ''.join('%02X ' % ord(x) for x in message))
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(self.ms_tstamp() + "RX Valid Message:%s" % ''.join('%02X ' % ord(x) for x in message))
 
         self._time_of_last_exchange_with_waveport = get_time_seconds_since_epoch()
 
-        frame_type = message[1]         
+        frame_type = message[1]
         if (frame_type == SERIAL_ACK or frame_type == SERIAL_NAK or frame_type == SERIAL_ERROR):
             self.logger.debug(self.ms_tstamp() + "ACK, NACK or ERROR reveived. Do not reply with ACK.")
         else:
             self.logger.debug(self.ms_tstamp() + "Packet not an ACK, NACK nore ERROR. Reply with ACK.")
             self.write_coronis_frame_to_waveport_with_delay(SERIAL_ACK_FRAME)
-            
-        
-        command = payload[0]
-                           
+
+        command = message[1]
+        pkt_length = ord(message[0])
+
         return (command, pkt_length, message[:-1]) # take off the ETX
 
     #-------------------------------------
@@ -765,6 +859,13 @@ class WaveportDevice(DeviceBase, threading.Thread):
         if (frame[0] != WP_STX and frame[-1] != WP_ETX):
             self.logger.error ('Function write_coronis_frame_to_waveport_with_delay should only be called with full wavenis frames')
 
+        self.__write_lock.acquire()
+        try:
+            self.__write_frame_with_delay(frame, additional_delay)
+        finally:
+            self.__write_lock.release()
+
+    def __write_frame_with_delay(self, frame, additional_delay):
         current_time_since_epoch = get_time_seconds_since_epoch()
         
         elapsed_time_since_last_write = current_time_since_epoch - self._time_of_last_exchange_with_waveport 
@@ -823,19 +924,7 @@ class WaveportDevice(DeviceBase, threading.Thread):
     def wp_crc(self, msg):
         """Compute the cyclic redundancy check, for a given message,
            conform to wawenis protocol """
-        poly = 0x8408
-        lg = len(msg)
-        crc = 0
-        for j in range(lg):
-            byte = ord(msg[j])
-            crc = crc ^ byte
-            for i in range(8):
-                carry = crc & 1
-                crc = crc / 2
-                if (carry != 0):
-                    crc = crc ^ poly
-        crc = crc & 0xffff
-        return crc
+        return CRC16_WAVENIS.compute(msg)
 
     #=============================
     def msec_str(self):
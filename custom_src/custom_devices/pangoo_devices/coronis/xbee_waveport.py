@@ -40,6 +40,7 @@ if on_digi_board():
     import digiwdog #@UnresolvedImport
 
 from custom_lib import logutils
+from custom_lib.commons.checksum import CRC16_WAVENIS
 
 from settings.settings_base import SettingsBase, Setting
 from channels.channel_source_device_property import *
@@ -653,19 +654,7 @@ class XBeeWaveportDevice(XBeeSerial, threading.Thread):
     def wp_crc(self, msg):
         """Compute the cyclic redundancy check, for a given message,
            conform to wawenis protocol """
-        poly = 0x8408
-        lg = len(msg)
-        crc = 0
-        for j in range(lg):
-            byte = ord(msg[j])
-            crc = crc ^ byte
-            for i in range(8):
-                carry = crc & 1
-                crc = crc / 2
-                if (carry != 0):
-                    crc = crc ^ poly
-        crc = crc & 0xffff
-        return crc
+        return CRC16_WAVENIS.compute(msg)
 
     #=============================
     def msec_str(self):
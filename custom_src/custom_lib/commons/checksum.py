@@ -0,0 +1,115 @@
+# $Id$
+"""
+    Checksums of the serial protocols used by the Pangoo drivers
+
+    All functions work on whole strings.  For streamed data, each has an
+    incremental form taking the value returned for the previous chunks:
+
+        crc = CRC16_MODBUS.init
+        for chunk in chunks:
+            crc = CRC16_MODBUS.update(crc, chunk)
+        crc = CRC16_MODBUS.finish(crc)
+
+    Bytes are iterated from an array('B') of the string, CRCs are table
+    driven (one lookup per byte) and Fletcher sums are reduced once at the
+    end instead of once per byte.
+"""
+
+import array
+
+class Crc16:
+    """ A table driven CRC-16.
+
+        poly is the polynomial in the bit order of the computation: for a
+        reflected CRC, give the reversed polynomial (0x8408 for 0x1021).
+    """
+
+    def __init__(self, poly, init=0, reflected=True, xorout=0):
+        self.poly = poly
+        self.init = init
+        self.reflected = reflected
+        self.xorout = xorout
+        self.table = self.__make_table()
+
+    def __make_table(self):
+        table = []
+        for byte in range(256):
+            if self.reflected:
+                crc = byte
+                for i in range(8):
+                    if crc & 1:
+                        crc = (crc >> 1) ^ self.poly
+                    else:
+                        crc = crc >> 1
+            else:
+                crc = byte << 8
+                for i in range(8):
+                    if crc & 0x8000:
+                        crc = ((crc << 1) ^ self.poly) & 0xFFFF
+                    else:
+                        crc = (crc << 1) & 0xFFFF
+            table.append(crc)
+        return table
+
+    def update(self, crc, data):
+        """ Returns the CRC register after processing the string data. """
+        table = self.table
+        if self.reflected:
+            for byte in array.array('B', data):
+                crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+        else:
+            for byte in array.array('B', data):
+                crc = ((crc << 8) & 0xFFFF) ^ table[((crc >> 8) ^ byte) & 0xFF]
+        return crc
+
+    def finish(self, crc):
+        """ Returns the CRC value of a register returned by update(). """
+        return crc ^ self.xorout
+
+    def compute(self, data):
+        """ Returns the CRC of the string data. """
+        return self.update(self.init, data) ^ self.xorout
+
+# Wavenis (Coronis Waveport) frames
+CRC16_WAVENIS = Crc16(0x8408)
+# Libelium LoRa gateway frames
+CRC16_MODBUS = Crc16(0xA001, init=0xFFFF)
+CRC16_CCITT_FALSE = Crc16(0x1021, init=0xFFFF, reflected=False)
+CRC16_XMODEM = Crc16(0x1021, reflected=False)
+
+def fletcher_update(sums, data, modulus=256):
+    """ Returns the Fletcher (sum1, sum2) pair after processing the string
+        data, sums being the pair of the previous data ((0, 0) at start).
+    """
+    sum1, sum2 = sums
+    for byte in array.array('B', data):
+        sum1 += byte
+        sum2 += sum1
+    return sum1 % modulus, sum2 % modulus
+
+def fletcher16(data):
+    """ Returns the Fletcher-16 checksum of the string data. """
+    sum1, sum2 = fletcher_update((0, 0), data, 255)
+    return (sum2 << 8) | sum1
+
+def fletcher_check_bytes(data, modulus=256):
+    """ Returns the two check bytes to append to data for the Fletcher
+        sums of the whole message to be zero, as a string. """
+    sum1, sum2 = fletcher_update((0, 0), data, modulus)
+    check1 = -(sum1 + sum2) % modulus
+    check2 = -(sum1 + check1) % modulus
+    return chr(check1) + chr(check2)
+
+def byte_sum(data, total=0):
+    """ Returns total plus the sum of the bytes of the string data. """
+    return total + sum(array.array('B', data))
+
+def xbee_api_checksum(data):
+    """ Returns the checksum byte value of the XBee API frame data (the
+        bytes between the length and the checksum). """
+    return 0xFF - (byte_sum(data) & 0xFF)
+
+def xbee_api_checksum_valid(data):
+    """ Returns True if the frame data followed by its checksum byte is
+        valid. """
+    return (byte_sum(data) & 0xFF) == 0xFF
@@ -0,0 +1,107 @@
+# $Id$
+"""
+    Compares the checksum module with the per protocol implementations it
+    replaced, on frame sizes seen on the Wavenis, Orbcomm, LoRa and XBee
+    serial links.
+
+    usage: python checksum_benchmark.py [rounds]
+"""
+
+import os
+import random
+import sys
+import time
+
+# custom_src, where custom_lib is
+sys.path.insert(0, os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')))
+
+from custom_lib.commons.checksum import \
+    CRC16_WAVENIS, CRC16_MODBUS, fletcher_check_bytes, xbee_api_checksum
+
+FRAME_SIZES = (8, 32, 75, 255, 1024)
+
+# Former implementations
+
+def legacy_wp_crc(msg):
+    """ WaveportDevice.wp_crc """
+    poly = 0x8408
+    lg = len(msg)
+    crc = 0
+    for j in range(lg):
+        byte = ord(msg[j])
+        crc = crc ^ byte
+        for i in range(8):
+            carry = crc & 1
+            crc = crc / 2
+            if (carry != 0):
+                crc = crc ^ poly
+    crc = crc & 0xffff
+    return crc
+
+def legacy_fletcher_crc(msg):
+    """ m10_sc_api.fletcher_crc, without its chr(256) failure """
+    sum1 = 0
+    sum2 = 0
+    lg = len(msg)
+    for j in range(lg):
+        byte = ord(msg[j])
+        sum1 = (sum1 + byte) % 256
+        sum2 = (sum2 + sum1) % 256
+    check1 = 256 - ((sum1 + sum2) % 256);
+    check2 = 256 - ((sum1 + check1) % 256);
+    return chr(check1 % 256) + chr(check2 % 256)
+
+def bitwise_crc16_modbus(msg):
+    """ bit by bit CRC-16/MODBUS, as the LoRa gateway documents it """
+    crc = 0xFFFF
+    for c in msg:
+        crc = crc ^ ord(c)
+        for i in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc = crc >> 1
+    return crc
+
+def loop_xbee_checksum(msg):
+    total = 0
+    for c in msg:
+        total = total + ord(c)
+    return 0xFF - (total & 0xFF)
+
+CASES = (
+    ('wavenis crc', legacy_wp_crc, CRC16_WAVENIS.compute),
+    ('modbus crc', bitwise_crc16_modbus, CRC16_MODBUS.compute),
+    ('orbcomm fletcher', legacy_fletcher_crc, fletcher_check_bytes),
+    ('xbee api', loop_xbee_checksum, xbee_api_checksum),
+)
+
+def time_function(function, frames, rounds):
+    start = time.time()
+    for i in range(rounds):
+        for frame in frames:
+            function(frame)
+    return (time.time() - start) * 1000000.0 / (rounds * len(frames))
+
+def main():
+    rounds = 200
+    if len(sys.argv) > 1:
+        rounds = int(sys.argv[1])
+    random.seed(0)
+
+    print '%-18s %6s %12s %12s %8s' % ('checksum', 'bytes', 'former us', 'table us', 'speedup')
+    for name, former, current in CASES:
+        for size in FRAME_SIZES:
+            frames = []
+            for i in range(16):
+                frames.append(''.join([chr(random.randint(0, 255)) for j in range(size)]))
+            for frame in frames:
+                if former(frame) != current(frame):
+                    raise ValueError('%s differs on %r' % (name, frame))
+            former_time = time_function(former, frames, rounds)
+            current_time = time_function(current, frames, rounds)
+            print '%-18s %6d %12.1f %12.1f %7.1fx' % (
+                name, size, former_time, current_time, former_time / current_time)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+# $Id$
+"""
+    Event loop for the drivers maintaining a connection to a server
+
+    The thread owning the connection calls run_once() in its main loop.
+    run_once() blocks in select() until a registered socket is readable, a
+    timer expires or another thread wakes the loop up, then runs the
+    callbacks of these events in the loop thread:
+
+        loop = EventLoop()
+        loop.add_reader(sock, on_readable)
+        keep_alive = loop.call_later(600.0, send_keep_alive)
+        while True:
+            loop.run_once(60.0)
+
+    Readers and timers may be added or removed from any thread: callbacks of
+    other threads (e.g. channel subscribers) use call_soon() to hand work to
+    the loop thread, the loop being woken up through an internal pipe.
+"""
+
+import heapq
+import os
+import select
+import socket
+import threading
+import time
+import traceback
+
+class Timer:
+    """ A callback scheduled by EventLoop.call_later(). """
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class EventLoop:
+    """ A select() based loop of socket readers and timers. """
+
+    def __init__(self, logger=None):
+        self.__logger = logger
+        self.__lock = threading.Lock()
+        self.__readers = {}
+        # heap of (deadline, sequence number, Timer)
+        self.__timers = []
+        self.__sequence = 0
+        self.__wakeup_pending = False
+        self.__open_wakeup_channel()
+
+    def close(self):
+        """ Releases the wakeup channel. """
+        for fd in (self.__wakeup_read, self.__wakeup_write):
+            try:
+                if hasattr(fd, 'close'):
+                    fd.close()
+                else:
+                    os.close(fd)
+            except (OSError, socket.error):
+                pass
+
+    def add_reader(self, sock, callback, *args):
+        """ Calls callback(*args) each time sock is readable. """
+        self.__lock.acquire()
+        try:
+            self.__readers[sock] = (callback, args)
+        finally:
+            self.__lock.release()
+        self.wakeup()
+
+    def remove_reader(self, sock):
+        self.__lock.acquire()
+        try:
+            if sock in self.__readers:
+                del self.__readers[sock]
+        finally:
+            self.__lock.release()
+        self.wakeup()
+
+    def call_later(self, delay, callback, *args):
+        """ Calls callback(*args) in delay seconds.  Returns a Timer. """
+        timer = Timer(time.time() + delay, callback, args)
+        self.__lock.acquire()
+        try:
+            self.__sequence += 1
+            heapq.heappush(self.__timers, (timer.deadline, self.__sequence, timer))
+        finally:
+            self.__lock.release()
+        self.wakeup()
+        return timer
+
+    def call_soon(self, callback, *args):
+        """ Calls callback(*args) in the loop thread as soon as possible. """
+        return self.call_later(0, callback, *args)
+
+    def wakeup(self):
+        """ Makes the pending run_once() call return as soon as possible. """
+        self.__lock.acquire()
+        try:
+            if not self.__wakeup_pending:
+                self.__wakeup_pending = True
+                try:
+                    self.__wakeup_send('x')
+                except (OSError, socket.error):
+                    pass
+        finally:
+            self.__lock.release()
+
+    def run_once(self, max_wait=None):
+        """ Waits for events at most max_wait seconds (None: no limit) and
+            runs their callbacks.  Returns the number of callbacks run. """
+        self.__lock.acquire()
+        try:
+            timeout = max_wait
+            if self.__timers:
+                delay = max(self.__timers[0][0] - time.time(), 0)
+                if timeout is None or delay < timeout:
+                    timeout = delay
+            readers = self.__readers.copy()
+        finally:
+            self.__lock.release()
+
+        try:
+            readable = select.select([self.__wakeup_read] + readers.keys(), [], [], timeout)[0]
+        except (select.error, socket.error, ValueError), msg:
+            # A socket has been closed by another thread, it should be
+            # removed before the next call.
+            if self.__logger is not None:
+                self.__logger.debug('select() failed: %s' % (msg,))
+            readable = []
+
+        count = 0
+        for sock in readable:
+            if sock == self.__wakeup_read:
+                self.__drain_wakeup_channel()
+                continue
+            self.__lock.acquire()
+            try:
+                entry = self.__readers.get(sock)
+            finally:
+                self.__lock.release()
+            # Skip readers removed by a previous callback.
+            if entry is not None:
+                self.__run_callback(entry[0], entry[1])
+                count += 1
+
+        for timer in self.__expired_timers():
+            self.__run_callback(timer.callback, timer.args)
+            count += 1
+        return count
+
+    # Internal functions & classes
+
+    def __run_callback(self, callback, args):
+        try:
+            callback(*args)
+        except Exception:
+            # Log and go on: an exception must not stop the loop thread.
+            if self.__logger is not None:
+                self.__logger.critical('Caught a critical unexpected exception: %s' % traceback.format_exc())
+
+    def __expired_timers(self):
+        now = time.time()
+        expired = []
+        self.__lock.acquire()
+        try:
+            timers = self.__timers
+            while timers and timers[0][0] <= now:
+                timer = heapq.heappop(timers)[2]
+                if not timer.cancelled:
+                    expired.append(timer)
+        finally:
+            self.__lock.release()
+        return expired
+
+    def __open_wakeup_channel(self):
+        """ Uses a pipe or, where the platform lacks one, a pair of loopback
+            UDP sockets. """
+        try:
+            self.__wakeup_read, self.__wakeup_write = os.pipe()
+            self.__wakeup_send = lambda data: os.write(self.__wakeup_write, data)
+            self.__wakeup_receive = lambda: os.read(self.__wakeup_read, 512)
+            return
+        except (AttributeError, OSError):
+            pass
+        self.__wakeup_read = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.__wakeup_read.bind(('127.0.0.1', 0))
+        self.__wakeup_write = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.__wakeup_write.connect(self.__wakeup_read.getsockname())
+        self.__wakeup_read.setblocking(0)
+        self.__wakeup_send = self.__wakeup_write.send
+        self.__wakeup_receive = lambda: self.__wakeup_read.recv(512)
+
+    def __drain_wakeup_channel(self):
+        self.__lock.acquire()
+        try:
+            self.__wakeup_pending = False
+            try:
+                self.__wakeup_receive()
+            except (OSError, socket.error):
+                pass
+        finally:
+            self.__lock.release()
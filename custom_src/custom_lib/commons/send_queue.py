@@ -0,0 +1,267 @@
+# $Id$
+"""
+    Bounded queue of payloads waiting to be sent to a server
+
+    Producers (typically channel publisher callbacks) put() payloads without
+    blocking; the thread owning the server connection takes them back with
+    get_batch() and gives back with unget_batch() the ones it could not send.
+
+    When the memory queue is full, payloads may be spilled to a file and read
+    back, in order, as the memory queue drains.  Without a spill file, or once
+    the payloads waiting in the spill file reach its maximum size, new
+    payloads are dropped.
+
+    The spill file holds records made of the payload length in decimal, a
+    line feed and the payload.  Unicode payloads are spilled, and read back,
+    UTF-8 encoded.  The records read back are removed from the file by
+    rewriting it, once they take half of it or room is needed for a new
+    record, and the offset of the first record not read back is saved in
+    a file named after the spill file, with a '.pos' suffix.  A spill file
+    left by a previous run is read back first, from that offset: only the
+    payloads taken by get_batch() right before a reset may be sent again.
+"""
+
+import os
+import threading
+from collections import deque
+
+class SendQueue:
+    """ A thread safe bounded FIFO of strings, optionally spilled to disk. """
+
+    def __init__(self, max_length, spill_file_name=None, max_spill_size=0, logger=None):
+        self.__max_length = max_length
+        self.__spill_file_name = spill_file_name
+        self.__max_spill_size = max_spill_size
+        self.__logger = logger
+        self.__lock = threading.Lock()
+        self.__queue = deque()
+        # Payloads in the spill file, where the next one starts, and the
+        # size of the file
+        self.__spilled = 0
+        self.__spill_read_pos = 0
+        self.__spill_size = 0
+        self.reset_counters()
+        if spill_file_name and os.path.exists(spill_file_name):
+            self.__recover_spill_file()
+
+    def reset_counters(self):
+        self.queued = 0
+        self.dropped = 0
+        self.spilled = 0
+
+    def counters(self):
+        """ Returns the queue counters as a dictionary. """
+        return {
+            'samples_queued': self.queued,
+            'samples_dropped': self.dropped,
+            'samples_spilled': self.spilled,
+            'send_queue_length': len(self),
+        }
+
+    def __len__(self):
+        return len(self.__queue) + self.__spilled
+
+    def put(self, payload):
+        """ Appends payload to the queue.  Returns False if it was dropped. """
+        self.__lock.acquire()
+        try:
+            if not self.__spilled and len(self.__queue) < self.__max_length:
+                self.__queue.append(payload)
+            elif not self.__spill(payload):
+                self.dropped += 1
+                return False
+            self.queued += 1
+            return True
+        finally:
+            self.__lock.release()
+
+    def get_batch(self, max_count):
+        """ Removes and returns the list of the (up to max_count) oldest
+            payloads. """
+        self.__lock.acquire()
+        try:
+            if self.__spilled and len(self.__queue) < self.__max_length:
+                self.__unspill()
+            batch = []
+            queue = self.__queue
+            while queue and len(batch) < max_count:
+                batch.append(queue.popleft())
+            return batch
+        finally:
+            self.__lock.release()
+
+    def unget_batch(self, batch):
+        """ Puts back payloads returned by get_batch() at the head of the
+            queue, in the same order. """
+        self.__lock.acquire()
+        try:
+            batch = list(batch)
+            batch.reverse()
+            self.__queue.extendleft(batch)
+        finally:
+            self.__lock.release()
+
+    # Internal functions & classes
+
+    def __error(self, message):
+        if self.__logger is not None:
+            self.__logger.error(message)
+
+    def __spill(self, payload):
+        """ Appends payload to the spill file.  Returns False if there is no
+            room for it. """
+        if not self.__spill_file_name:
+            return False
+        if isinstance(payload, unicode):
+            payload = payload.encode('utf-8')
+        record = '%d\n%s' % (len(payload), payload)
+        if self.__spill_size + len(record) > self.__max_spill_size:
+            # Reclaim the room of the records read back
+            if not self.__spill_read_pos or not self.__compact_spill_file() \
+                    or self.__spill_size + len(record) > self.__max_spill_size:
+                return False
+        try:
+            spill_file = open(self.__spill_file_name, 'ab')
+            try:
+                spill_file.write(record)
+            finally:
+                spill_file.close()
+        except IOError, msg:
+            self.__error('Cannot write spill file %s: %s' % (self.__spill_file_name, msg))
+            return False
+        self.__spill_size += len(record)
+        self.__spilled += 1
+        self.spilled += 1
+        return True
+
+    def __unspill(self):
+        """ Moves spilled payloads to the memory queue, as long as it has
+            room for them. """
+        try:
+            spill_file = open(self.__spill_file_name, 'rb')
+            try:
+                spill_file.seek(self.__spill_read_pos)
+                while self.__spilled and len(self.__queue) < self.__max_length:
+                    payload = self.__read_record(spill_file)
+                    if payload is None:
+                        self.__error('Truncated spill file %s, %d payloads lost'
+                                     % (self.__spill_file_name, self.__spilled))
+                        self.__spilled = 0
+                        break
+                    self.__queue.append(payload)
+                    self.__spilled -= 1
+                self.__spill_read_pos = spill_file.tell()
+            finally:
+                spill_file.close()
+        except IOError, msg:
+            self.__error('Cannot read spill file %s: %s' % (self.__spill_file_name, msg))
+            self.__spilled = 0
+        if not self.__spilled:
+            self.__remove_spill_file()
+        elif self.__spill_read_pos * 2 >= self.__spill_size:
+            self.__compact_spill_file()
+        else:
+            self.__save_read_pos()
+
+    def __read_record(self, spill_file):
+        """ Returns the payload of the next record, None at the end of the file
+            or on a truncated record. """
+        header = spill_file.readline()
+        try:
+            length = int(header)
+        except ValueError:
+            return None
+        payload = spill_file.read(length)
+        if len(payload) != length:
+            return None
+        return payload
+
+    def __compact_spill_file(self):
+        """ Rewrites the spill file without the records read back.  Returns
+            False if it could not be rewritten. """
+        compact_file_name = self.__spill_file_name + '.tmp'
+        try:
+            spill_file = open(self.__spill_file_name, 'rb')
+            try:
+                spill_file.seek(self.__spill_read_pos)
+                records = spill_file.read()
+            finally:
+                spill_file.close()
+            compact_file = open(compact_file_name, 'wb')
+            try:
+                compact_file.write(records)
+            finally:
+                compact_file.close()
+            # Without an offset, a reset before the rename replays the
+            # records read back rather than skipping unread ones.
+            self.__remove_read_pos()
+            os.rename(compact_file_name, self.__spill_file_name)
+        except (IOError, OSError), msg:
+            self.__error('Cannot rewrite spill file %s: %s' % (self.__spill_file_name, msg))
+            self.__save_read_pos()
+            return False
+        self.__spill_read_pos = 0
+        self.__spill_size = len(records)
+        return True
+
+    def __save_read_pos(self):
+        try:
+            pos_file = open(self.__spill_file_name + '.pos', 'wb')
+            try:
+                pos_file.write('%d\n' % self.__spill_read_pos)
+            finally:
+                pos_file.close()
+        except IOError, msg:
+            self.__error('Cannot write spill file offset %s.pos: %s' % (self.__spill_file_name, msg))
+
+    def __load_read_pos(self):
+        """ Returns the offset saved by __save_read_pos(), 0 if there is
+            none. """
+        try:
+            pos_file = open(self.__spill_file_name + '.pos', 'rb')
+            try:
+                return int(pos_file.read())
+            finally:
+                pos_file.close()
+        except (IOError, ValueError):
+            return 0
+
+    def __remove_read_pos(self):
+        try:
+            os.remove(self.__spill_file_name + '.pos')
+        except OSError:
+            pass
+
+    def __recover_spill_file(self):
+        """ Counts the payloads left in the spill file by a previous run,
+            after its saved offset. """
+        try:
+            spill_file = open(self.__spill_file_name, 'r+b')
+            try:
+                spill_file.seek(0, 2)
+                read_pos = self.__load_read_pos()
+                if read_pos < 0 or read_pos > spill_file.tell():
+                    read_pos = 0
+                spill_file.seek(read_pos)
+                self.__spill_read_pos = self.__spill_size = read_pos
+                while self.__read_record(spill_file) is not None:
+                    self.__spilled += 1
+                    self.__spill_size = spill_file.tell()
+                # Drop a record truncated by a reset while it was written.
+                spill_file.truncate(self.__spill_size)
+            finally:
+                spill_file.close()
+        except IOError, msg:
+            self.__error('Cannot read spill file %s: %s' % (self.__spill_file_name, msg))
+            self.__spilled = 0
+        if not self.__spilled:
+            self.__remove_spill_file()
+
+    def __remove_spill_file(self):
+        self.__spill_read_pos = 0
+        self.__spill_size = 0
+        self.__remove_read_pos()
+        try:
+            os.remove(self.__spill_file_name)
+        except OSError:
+            pass
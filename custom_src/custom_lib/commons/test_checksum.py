@@ -0,0 +1,77 @@
+# $Id$
+"""
+    Known answer tests of the checksum module.
+
+    usage: python test_checksum.py
+"""
+
+import os
+import sys
+import unittest
+
+# custom_src, where custom_lib is
+sys.path.insert(0, os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')))
+
+from custom_lib.commons.checksum import \
+    CRC16_WAVENIS, CRC16_MODBUS, CRC16_CCITT_FALSE, CRC16_XMODEM, \
+    fletcher_update, fletcher16, fletcher_check_bytes, byte_sum, \
+    xbee_api_checksum, xbee_api_checksum_valid
+
+# the usual CRC check string
+CHECK = "123456789"
+
+class Crc16Test(unittest.TestCase):
+
+    def test_check_values(self):
+        self.assertEqual(CRC16_WAVENIS.compute(CHECK), 0x2189)
+        self.assertEqual(CRC16_MODBUS.compute(CHECK), 0x4B37)
+        self.assertEqual(CRC16_CCITT_FALSE.compute(CHECK), 0x29B1)
+        self.assertEqual(CRC16_XMODEM.compute(CHECK), 0x31C3)
+
+    def test_empty(self):
+        self.assertEqual(CRC16_MODBUS.compute(""), 0xFFFF)
+        self.assertEqual(CRC16_XMODEM.compute(""), 0)
+
+    def test_incremental(self):
+        for crc16 in (CRC16_WAVENIS, CRC16_MODBUS, CRC16_CCITT_FALSE,
+                      CRC16_XMODEM):
+            crc = crc16.init
+            for chunk in ("1", "2345", "", "6789"):
+                crc = crc16.update(crc, chunk)
+            self.assertEqual(crc16.finish(crc), crc16.compute(CHECK))
+
+class FletcherTest(unittest.TestCase):
+
+    def test_fletcher16(self):
+        self.assertEqual(fletcher16("abcde"), 0xC8F0)
+        self.assertEqual(fletcher16("abcdef"), 0x2057)
+        self.assertEqual(fletcher16("abcdefgh"), 0x0627)
+
+    def test_check_bytes(self):
+        for data in ("", "\x00", CHECK, "\xff" * 300):
+            check = fletcher_check_bytes(data)
+            self.assertEqual(len(check), 2)
+            self.assertEqual(fletcher_update((0, 0), data + check), (0, 0))
+
+    def test_incremental(self):
+        sums = (0, 0)
+        for chunk in ("abc", "", "def"):
+            sums = fletcher_update(sums, chunk, 255)
+        self.assertEqual((sums[1] << 8) | sums[0], fletcher16("abcdef"))
+
+class XBeeTest(unittest.TestCase):
+
+    # AT command NI, frame id 1: 7E 00 04 08 01 4E 49 5F
+    FRAME_DATA = "\x08\x01\x4e\x49"
+
+    def test_byte_sum(self):
+        self.assertEqual(byte_sum(""), 0)
+        self.assertEqual(byte_sum("\x01\x02\xff", 3), 261)
+
+    def test_checksum(self):
+        self.assertEqual(xbee_api_checksum(self.FRAME_DATA), 0x5F)
+        self.failUnless(xbee_api_checksum_valid(self.FRAME_DATA + "\x5f"))
+        self.failIf(xbee_api_checksum_valid(self.FRAME_DATA + "\x5e"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+# $Id$
+"""
+    Unit tests of the send queue and its spill file.
+
+    usage: python test_send_queue.py
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+# custom_src, where custom_lib is
+sys.path.insert(0, os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')))
+
+from custom_lib.commons.send_queue import SendQueue
+
+class SendQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.spill_file_name = tempfile.mkstemp()
+        os.close(handle)
+        os.remove(self.spill_file_name)
+
+    def tearDown(self):
+        for name in (self.spill_file_name, self.spill_file_name + '.pos'):
+            if os.path.exists(name):
+                os.remove(name)
+
+    def drain(self, queue):
+        payloads = []
+        while len(queue):
+            payloads.extend(queue.get_batch(2))
+        return payloads
+
+    def test_order(self):
+        queue = SendQueue(3, self.spill_file_name, 1000)
+        payloads = ['p%d\nx' % i for i in range(10)]
+        for payload in payloads:
+            self.failUnless(queue.put(payload))
+        self.assertEqual(queue.counters()['samples_spilled'], 7)
+        batch = queue.get_batch(2)
+        queue.unget_batch(batch[1:])
+        self.assertEqual([batch[0]] + self.drain(queue), payloads)
+        self.failIf(os.path.exists(self.spill_file_name))
+
+    def test_no_spill_file(self):
+        queue = SendQueue(2)
+        self.assertEqual([queue.put('a'), queue.put('b'), queue.put('c')],
+                         [True, True, False])
+        self.assertEqual(queue.counters()['samples_dropped'], 1)
+
+    def test_unicode(self):
+        queue = SendQueue(1, self.spill_file_name, 1000)
+        for payload in (u'first', u'caf\xe9 \u20ac', u'last'):
+            self.failUnless(queue.put(payload))
+        # Only the spilled payloads come back encoded:
+        self.assertEqual(queue.get_batch(1), [u'first'])
+        self.assertEqual(self.drain(queue),
+                         ['caf\xc3\xa9 \xe2\x82\xac', 'last'])
+
+    def test_spill_size_reused(self):
+        # Room for two spilled records of 2 + 8 bytes:
+        queue = SendQueue(1, self.spill_file_name, 20)
+        for i in range(3):
+            self.failUnless(queue.put('payload%d' % i))
+        self.failIf(queue.put('payload3'))
+        # Reading back one record makes room for another one, the spill
+        # file is kept until it is drained:
+        self.assertEqual(queue.get_batch(1), ['payload0'])
+        self.assertEqual(queue.get_batch(1), ['payload1'])
+        self.failUnless(os.path.exists(self.spill_file_name))
+        self.failUnless(queue.put('payload4'))
+        self.assertEqual(self.drain(queue), ['payload2', 'payload4'])
+
+    def test_recover(self):
+        queue = SendQueue(1, self.spill_file_name, 1000)
+        for i in range(4):
+            queue.put('r%d' % i)
+        del queue
+        # A record truncated by a reset is dropped:
+        spill_file = open(self.spill_file_name, 'ab')
+        spill_file.write('12\nabc')
+        spill_file.close()
+        queue = SendQueue(3, self.spill_file_name, 1000)
+        self.assertEqual(len(queue), 3)
+        self.assertEqual(self.drain(queue), ['r1', 'r2', 'r3'])
+
+    def test_recover_after_read_back(self):
+        queue = SendQueue(1, self.spill_file_name, 1000)
+        for i in range(6):
+            queue.put('r%d' % i)
+        self.assertEqual(queue.get_batch(1), ['r0'])
+        self.assertEqual(queue.get_batch(1), ['r1'])
+        del queue
+        # Only the records not read back are sent again:
+        queue = SendQueue(10, self.spill_file_name, 1000)
+        self.assertEqual(self.drain(queue), ['r2', 'r3', 'r4', 'r5'])
+        self.failIf(os.path.exists(self.spill_file_name + '.pos'))
+
+    def test_spill_file_bounded(self):
+        # A producer keeping pace with the consumer never drains the
+        # spill file, which must not grow past its maximum size:
+        queue = SendQueue(2, self.spill_file_name, 100)
+        sent = []
+        for i in range(6):
+            queue.put('payload%d' % i)
+        for i in range(6, 500):
+            self.failUnless(queue.put('payload%d' % i))
+            sent.extend(queue.get_batch(1))
+            self.failUnless(os.path.getsize(self.spill_file_name) <= 100)
+        sent.extend(self.drain(queue))
+        self.assertEqual(sent, ['payload%d' % i for i in range(500)])
+
+if __name__ == '__main__':
+    unittest.main()
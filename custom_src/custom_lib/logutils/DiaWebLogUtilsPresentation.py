@@ -1,5 +1,9 @@
 """This module contains a Dia presentation driver capable of serving a web
 page containing the log messages in the :class:`logging.SmartHandler` buffer.
+
+Log records are formatted once for the web page: the formatted lines are kept
+between requests, and only the records logged since the previous request are
+formatted.
 """
 
 # imports
@@ -7,6 +11,7 @@ from settings.settings_base import SettingsBase, Setting
 from presentations.presentation_base import PresentationBase
 from custom_lib import logutils
 import logging
+import threading
 
 logutils.basicConfig(filename='WEB/python/log.txt')
 logger = logging.getLogger()
@@ -34,11 +39,22 @@ class WebLogUtils(PresentationBase):
     
         None
 
+    The page ends with a ``<!-- last index: N -->`` comment, N being the
+    index of the newest record. Requesting the page with a ``since=N``
+    argument returns only the lines of the records newer than the record
+    of index N, followed by the same comment. Each handler counts its own
+    records: with several handlers, N is the comma separated list of the
+    indexes of their newest records, in the order of the handlers.
+
     """
     def __init__(self, name, core_services):
         self.__name = name
         self.__core = core_services
         self.web_cb_handle = None
+        self.formatter = logging.Formatter('<div class="%(levelname)s">%(asctime)s - %(name)s - %(message)s</div>')
+        # the (index, formatted line) tuples of the records of each handler
+        self.formatted_lines = {}
+        self.formatted_lines_lock = threading.Lock()
 
         settings_list = [
             Setting(
@@ -86,22 +102,71 @@ class WebLogUtils(PresentationBase):
     def log_page(self, type, path, headers, args):
         """Prepares the HTML log page.
         """
+        if args and args.has_key('since'):
+            try:
+                since = [int(index) for index in args['since'].split(',')]
+            except (AttributeError, ValueError):
+                since = []
+            log, last_index = self.format_log(since)
+            return (digiweb.TextHtml, "%s<!-- last index: %s -->" % (log, last_index))
+        
         refresh_rate = SettingsBase.get_setting(self, 'refresh_rate')
-        log = self.format_log()
+        log, last_index = self.format_log()
         my_html = """<HTML><HEAD><TITLE>Gateway Log File</TITLE><META http-equiv="refresh" content="%d">
     <STYLE TYPE="text/css">div.DEBUG{color:C0C0C0}div.INFO{color:0000FF}div.WARNING{color:FFFF00}
     div.ERROR{color:FFA500}div.CRITICAL{color:FF0000}</STYLE></HEAD>
-    <BODY><H1>Log Info</H1><P>%s</P></BODY></HTML>""" % (refresh_rate, log)
+    <BODY><H1>Log Info</H1><P>%s</P></BODY></HTML><!-- last index: %s -->""" % (refresh_rate, log, last_index)
         return (digiweb.TextHtml, my_html)
         
-    def format_log(self):
+    def smart_handlers(self):
+        """Returns the list of the installed :class:`SmartHandler` handlers.
+        """
+        return [handler for handler in logger.handlers
+                if handler.__class__ == logutils.SmartHandler]
+
+    def format_log(self, since=()):
         """Formats the buffer of log messages in the :class:`SmartHandler`
-        handler, if there is one installed.
+        handlers, if there are any installed. *since* is the list of the
+        indexes, one per handler, of the newest records already displayed:
+        only the records newer than them are returned.
+
+        Returns the formatted lines, and the comma separated list of the
+        indexes of the newest records they include (-1 if there is no
+        handler), to be given as *since* to get the following records.
+        """
+        lines = []
+        last_indexes = []
+        for position, handler in enumerate(self.smart_handlers()):
+            handler_since = -1
+            if position < len(since):
+                handler_since = since[position]
+            last_index = handler_since
+            for index, line in self.update_formatted_lines(handler):
+                if index > handler_since:
+                    lines.append(line)
+                    last_index = index
+            last_indexes.append(str(last_index))
+        return ''.join(lines), ','.join(last_indexes) or '-1'
+
+    def update_formatted_lines(self, handler):
+        """Formats the records logged by *handler* since the previous call,
+        forgets the lines of the records which left its buffer and returns
+        the list of (index, formatted line) tuples of its buffer.
         """
-        rstr = ""
-        formatter = logging.Formatter('<div class="%(levelname)s">%(asctime)s - %(name)s - %(message)s</div>')
-        for handler in logger.handlers:
-            if handler.__class__ == logutils.SmartHandler:
-                for line in handler.get_formatted_buffer(formatter):
-                    rstr += line
-        return rstr
+        self.formatted_lines_lock.acquire()
+        try:
+            lines = self.formatted_lines.get(handler, [])
+            last_index = -1
+            if lines:
+                last_index = lines[-1][0]
+            first_index = handler.first_index()
+            start = 0
+            while start < len(lines) and lines[start][0] < first_index:
+                start += 1
+            lines = lines[start:]
+            for index, record in handler.get_records_since(last_index):
+                lines.append((index, self.formatter.format(record)))
+            self.formatted_lines[handler] = lines
+            return lines
+        finally:
+            self.formatted_lines_lock.release()
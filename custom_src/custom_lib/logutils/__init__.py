@@ -6,7 +6,7 @@ on multiple projects.
 import sys
 import os
 import logging
-import cStringIO
+import time
 
 try:
     _fsync = os.fsync
@@ -82,7 +82,8 @@ class SmartHandler(logging.Handler):
                  buffer_size=50, 
                  filename=None, max_bytes=512*2*32, max_backups=5, 
                  flush_level=logging.ERROR,
-                 flush_window=300):
+                 flush_window=300,
+                 fsync_interval=5):
         """Initialize the SmartHandler. It optionally logs records to an
         in-memory buffer and/or to file with automatic backups.
         
@@ -130,116 +131,226 @@ class SmartHandler(logging.Handler):
         to debug a exception or otherwise better understand a 
         problem. Set *flush_window* to 0 or None to flush all
         the records in the buffer to the file.
+        
+        The log file is kept open between flushes. Each flush writes
+        the records to the file, but they are only synced to the
+        file system (with :func:`os.fsync`) if *fsync_interval*
+        seconds elapsed since the last sync, so that a burst of
+        records does not cost a sync each. The file is always synced
+        before a rollover and when the handler is closed. Set
+        *fsync_interval* to 0 or `None` to sync on every flush.
         """
         logging.Handler.__init__(self)
         self.filename = filename
         self.max_bytes = max_bytes
         self.max_backups = max_backups
         self.buffer_size = buffer_size
-        self.last_flushed_index = -1
-        self.buffer = []
         self.flush_level = flush_level
         self.flush_window = flush_window
+        self.fsync_interval = fsync_interval
+        
+        # The buffer is a ring of (record, formatted message) entries. Records
+        # are identified by their index, the number of records emitted before
+        # them: the entry of the record of index i is at i % len(self.entries).
+        # An unlimited buffer is a list which only grows.
+        if buffer_size:
+            self.entries = [None] * buffer_size
+        elif buffer_size is None:
+            # The buffer only holds the record being emitted
+            self.entries = [None]
+        else:
+            self.entries = []
+        self.record_count = 0
+        self.last_flushed_index = -1
+        
+        self.stream = None
+        self.stream_size = 0
+        self.last_fsync_time = 0
         
     def emit(self, record):
         # Always put the record in the buffer, even if buffer is
         # disabled, because flush works on the buffer.
-        self.buffer.append(record)
+        try:
+            msg = "%s\n" % self.format(record)
+        except:
+            self.handleError(record)
+            return
+        if self.buffer_size == 0:
+            self.entries.append((record, msg))
+        else:
+            # Once the buffer is full, this overwrites the oldest entry.
+            self.entries[self.record_count % len(self.entries)] = (record, msg)
+        self.record_count += 1
+        # Records overwritten before being flushed are lost.
+        self.last_flushed_index = max(self.last_flushed_index, self.first_index() - 1)
+        
         if self.should_flush(record):
             self.flush()
-        # If buffering is disabled, effectively remove the item
-        # from the buffer by reinitializing the buffer.
+        # If buffering is disabled, consider the record is no longer in
+        # the buffer.
         if self.buffer_size is None:
-            self.buffer = []
-        # Otherwise, if the buffer has a limited size, pop items
-        # off the left until it is the correct size. This will
-        # usually pop a single item once the buffer reaches capacity.
-        elif self.buffer_size > 0:
-            while len(self.buffer) > self.buffer_size:
-                self.buffer.pop(0)
-                self.last_flushed_index -= 1
+            self.last_flushed_index = self.record_count - 1
             
     def should_flush(self, record):
         return record.levelno >= self.flush_level
     
+    def first_index(self):
+        """Returns the index of the oldest record in the buffer.
+        """
+        if self.buffer_size == 0:
+            return 0
+        return max(0, self.record_count - len(self.entries))
+    
+    def get_entry(self, index):
+        """Returns the (record, formatted message) tuple of the record of index
+        *index*, which must be in the buffer.
+        """
+        if self.buffer_size == 0:
+            return self.entries[index]
+        return self.entries[index % len(self.entries)]
+    
     def flush(self):
         """Flush the records in the buffer to the log file if file logging
         is enabled.
         """
         record = None
         try:      
-            if self.file_logging_enabled():
+            if self.file_logging_enabled() and self.record_count > 0:
+                record = self.get_entry(self.record_count - 1)[0]
                 retries_left = 3
                 while True:
                     try:
-                        log_file = open(self.filename, 'a')
-                        try:
-                            available_bytes = self.max_file_size() - self.get_file_length(log_file)
-                            msg_buffer = cStringIO.StringIO()
-                            for index, record in self.records_to_flush():
-                                msg = "%s\n" % self.format(record)
-                                # Check to see if there is enough room in the file to fit another message
-                                if len(msg) > available_bytes:
-                                    # There isn't enough room in the file for any more messages, so write
-                                    # all the messages in the message buffer into the file, flush it and
-                                    # fsync it to make sure it is actually written to the file system.
-                                    msgs = msg_buffer.getvalue()
-                                    msg_buffer.close()
-                                    log_file.write(msgs)
-                                    log_file.flush()
-                                    _fsync(log_file)
-                                    log_file.close()
-         
-                                    # Now that the records have been flushed we can update
-                                    # the last flushed index
-                                    self.last_flushed_index = index
-                                    
-                                    # Now do the rolloever of the backup copies, if enabled.
-                                    self.do_rollover()
-                                    
-                                    # Now start a new log file and reinitialize the important vars. 
-                                    log_file = open(self.filename, 'w')
-                                    msg_buffer = cStringIO.StringIO()
-                                    available_bytes = self.max_file_size()
-        
-                                msg_buffer.write(msg)
-                                available_bytes -= len(msg)
-                                
-                            msgs = msg_buffer.getvalue()
-                            msg_buffer.close()
-                            log_file.write(msgs)
-                            
-                            # Now that we are finished flushing the buffer, update the
-                            # last_flushed_index to indicate the entire buffer has been
-                            # flushed.
-                            self.last_flushed_index = len(self.buffer) - 1
-                            
-                            break # Break out of retry loop since we didn't get any IO errors
-                        finally:
-                            log_file.flush()
-                            _fsync(log_file)
-                            log_file.close()
+                        self.write_records(self.records_to_flush())
+                        break
                     except (OSError, IOError):
+                        # Reopen the file on the next attempt.
+                        self.close_stream()
                         retries_left -= 1
                         if retries_left == 0:
                             raise
-                    else:
-                        break                    
         except:
             self.handleError(record)
+    
+    def write_records(self, records):
+        """Append the formatted messages of *records*, a list of (index, record)
+        tuples, to the log file, rolling it over when it is full.
+        """
+        log_file = self.open_stream()
+        available_bytes = self.max_file_size() - self.stream_size
+        msgs = []
+        for index, record in records:
+            msg = self.get_entry(index)[1]
+            # Check to see if there is enough room in the file to fit another message
+            if len(msg) > available_bytes and self.stream_size > 0:
+                # There isn't enough room in the file for any more messages, so write
+                # all the pending messages into the file and close it: this syncs it
+                # to make sure it is actually written to the file system.
+                log_file.write(''.join(msgs))
+                self.close_stream()
+                
+                # Now that the records have been flushed we can update
+                # the last flushed index
+                self.last_flushed_index = index - 1
+                
+                # Now do the rolloever of the backup copies, if enabled.
+                self.do_rollover()
+                
+                # Now start a new log file and reinitialize the important vars. 
+                log_file = self.open_stream('w')
+                msgs = []
+                available_bytes = self.max_file_size()
+            
+            msgs.append(msg)
+            available_bytes -= len(msg)
+            self.stream_size += len(msg)
+        
+        log_file.write(''.join(msgs))
+        log_file.flush()
+        self.sync_stream()
+        
+        # Now that we are finished flushing the buffer, update the
+        # last_flushed_index to indicate the entire buffer has been
+        # flushed.
+        self.last_flushed_index = self.record_count - 1
+    
+    def open_stream(self, mode='a'):
+        """Return the log file, opened if it is not.
+        """
+        if self.stream is None:
+            self.stream = open(self.filename, mode)
+            self.stream_size = self.get_file_length(self.stream)
+        return self.stream
+    
+    def sync_stream(self, force=False):
+        """Sync the log file to the file system if *fsync_interval* seconds
+        elapsed since the last sync, or if *force* is `True`.
+        """
+        now = time.time()
+        if (force or not self.fsync_interval or
+            now - self.last_fsync_time >= self.fsync_interval or
+            now < self.last_fsync_time):
+            _fsync(self.stream)
+            self.last_fsync_time = now
+    
+    def close_stream(self):
+        """Sync and close the log file, if it is open.
+        """
+        if self.stream is not None:
+            try:
+                try:
+                    self.stream.flush()
+                    self.sync_stream(force=True)
+                finally:
+                    self.stream.close()
+            except (OSError, IOError):
+                pass
+            self.stream = None
+    
+    def close(self):
+        self.acquire()
+        try:
+            self.close_stream()
+        finally:
+            self.release()
+        logging.Handler.close(self)
                 
     def records_to_flush(self):
         """Return a list of tuples, each containing the index of the record and
         the record itself for the records that should be flushed.
         """
         records = []
-        for index, record in enumerate(self.buffer[self.last_flushed_index+1:]):
+        if self.last_flushed_index + 1 >= self.record_count:
+            return records
+        newest_created = self.get_entry(self.record_count - 1)[0].created
+        for index in xrange(self.last_flushed_index + 1, self.record_count):
+            record = self.get_entry(index)[0]
             if (self.flush_window is None or
                 self.flush_window == 0 or 
-                (self.buffer[-1].created - record.created) <= self.flush_window):
-                records.append((index + self.last_flushed_index + 1, record))        
+                (newest_created - record.created) <= self.flush_window):
+                records.append((index, record))        
         return records
     
+    def get_records_since(self, index=-1):
+        """Return a list of tuples, each containing the index of the record and
+        the record itself for the records of the buffer newer than the record
+        of index *index*, so that a display can only process new records.
+        The index of the newest record is ``record_count - 1``.
+        """
+        return [(i, entry[0]) for i, entry in self.get_entries_since(index)]
+    
+    def get_entries_since(self, index=-1):
+        """Same as :meth:`get_records_since`, with the (record, formatted message)
+        tuples of the records.
+        """
+        if self.buffer_size is None:
+            return []
+        self.acquire()
+        try:
+            return [(i, self.get_entry(i))
+                    for i in xrange(max(index + 1, self.first_index()), self.record_count)]
+        finally:
+            self.release()
+    
     def get_file_length(self, open_file):
         open_file.seek(0, 2)
         return open_file.tell()
@@ -286,7 +397,10 @@ class SmartHandler(logging.Handler):
         specified by *formatter* or the default Formatter if *formatter* is
         `None`.
         """
-        if formatter is None:
-            formatter = self.formatter
-        for record in self.buffer[:]:
-            yield formatter.format(record)
+        if formatter is None or formatter is self.formatter:
+            # Messages are formatted with the default Formatter when emitted
+            for index, (record, msg) in self.get_entries_since():
+                yield msg[:-1]
+        else:
+            for index, (record, msg) in self.get_entries_since():
+                yield formatter.format(record)
@@ -5,6 +5,7 @@ import sys
 
 import serial
 from custom_lib import logutils
+from custom_lib.commons.checksum import fletcher_check_bytes
 
 TIMEOUT_INSTANTANEOUS = 0.001
 TIMEOUT_ACK = 1.900
@@ -199,23 +200,7 @@ def fletcher_crc(msg):
     """
     Checksum Fletcher's algorithm 
     """
-    sum1 = 0
-    sum2 = 0
-    lg = len(msg)
-    
-    for j in range(lg):
-        byte = ord(msg[j])
-        sum1 = (sum1 + byte) % 256
-        sum2 = (sum2 + sum1) % 256
-        
-    check1 = 256 - ((sum1 + sum2) % 256);
-    check2 = 256 - ((sum1 + check1) % 256);
-    
-    c1 = chr(check1) #formatting decimal value to hex with correct format \x00
-    c2 = chr(check2)
-     
-    #msgWithCrc = msg + c1 + c2
-    return c1 + c2
+    return fletcher_check_bytes(msg)
 
 def encode_size(size):
     """
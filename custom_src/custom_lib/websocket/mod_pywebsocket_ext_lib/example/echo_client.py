@@ -66,6 +66,8 @@ import sys
 
 from mod_pywebsocket import common
 from mod_pywebsocket.extensions import DeflateFrameExtensionProcessor
+from mod_pywebsocket.extensions import create_permessage_deflate_offer
+from mod_pywebsocket.extensions import get_accepted_permessage_deflate
 from mod_pywebsocket.stream import Stream
 from mod_pywebsocket.stream import StreamHixie75
 from mod_pywebsocket.stream import StreamOptions
@@ -411,6 +413,14 @@ class ClientHandshakeProcessor(ClientHandshakeBase):
             extensions_to_request.append(
                 common.ExtensionParameter(common.DEFLATE_FRAME_EXTENSION))
 
+        permessage_deflate = getattr(self._options, 'permessage_deflate',
+                                     False)
+        deflate_window_bits = getattr(self._options, 'deflate_window_bits',
+                                      None)
+        if permessage_deflate:
+            extensions_to_request.append(
+                create_permessage_deflate_offer(deflate_window_bits))
+
         if len(extensions_to_request) != 0:
             fields.append(
                 '%s: %s\r\n' %
@@ -510,7 +520,8 @@ class ClientHandshakeProcessor(ClientHandshakeBase):
             common.SEC_WEBSOCKET_EXTENSIONS_HEADER.lower())
         accepted_extensions = []
         if extensions_header is not None and len(extensions_header) != 0:
-            accepted_extensions = common.parse_extensions(extensions_header[0])
+            accepted_extensions = common.parse_extensions(
+                extensions_header[0], allow_quoted_string=True)
         # TODO(bashi): Support the new style perframe compression extension.
         for extension in accepted_extensions:
             extension_name = extension.name()
@@ -528,6 +539,17 @@ class ClientHandshakeProcessor(ClientHandshakeBase):
                 self._options.deflate_frame = processor
                 continue
 
+            if (extension_name == common.PERMESSAGE_COMPRESSION_EXTENSION and
+                permessage_deflate):
+                processor = get_accepted_permessage_deflate(
+                    extension, deflate_window_bits)
+                if processor is None:
+                    raise ClientHandshakeError(
+                        'Invalid %s response: %r' %
+                        (extension_name, common.format_extension(extension)))
+                self._options.permessage_deflate = processor
+                continue
+
             raise ClientHandshakeError(
                 'Unexpected extension %r' % extension_name)
 
@@ -541,6 +563,13 @@ class ClientHandshakeProcessor(ClientHandshakeBase):
                 'Requested %s, but the server rejected it' %
                 common.DEFLATE_FRAME_EXTENSION)
 
+        # Unlike the extensions above, the server may decline to compress
+        # messages: they are then sent uncompressed.
+        if permessage_deflate and self._options.permessage_deflate is True:
+            self._logger.debug('Server declined %s',
+                               common.PERMESSAGE_COMPRESSION_EXTENSION)
+            self._options.permessage_deflate = False
+
         # TODO(tyoshino): Handle Sec-WebSocket-Protocol
         # TODO(tyoshino): Handle Cookie, etc.
 
@@ -881,6 +910,10 @@ class EchoClient(object):
                     processor = self._options.deflate_frame
                     processor.setup_stream_options(stream_option)
 
+                if self._options.permessage_deflate is not False:
+                    processor = self._options.permessage_deflate
+                    processor.setup_stream_options(stream_option)
+
                 self._stream = Stream(request, stream_option)
             elif version == _PROTOCOL_VERSION_HYBI00:
                 self._stream = StreamHixie75(request, True)
@@ -998,6 +1031,18 @@ def main():
                       help='use deflate-frame extension. This value will be '
                       'ignored if used with protocol version that doesn\'t '
                       'support deflate-frame.')
+    parser.add_option('--permessage-deflate', '--permessage_deflate',
+                      dest='permessage_deflate',
+                      action='store_true', default=False,
+                      help='offer permessage-compress extension with the '
+                      'deflate method. Messages are sent uncompressed if '
+                      'the server declines it.')
+    parser.add_option('--deflate-window-bits', '--deflate_window_bits',
+                      dest='deflate_window_bits',
+                      type='int', default=None,
+                      help='LZ77 window size, in bits (8 to 15), of the '
+                      'permessage deflate compression, in both '
+                      'directions.')
     parser.add_option('--log-level', '--log_level', type='choice',
                       dest='log_level', default='warn',
                       choices=['debug', 'info', 'warn', 'error', 'critical'],
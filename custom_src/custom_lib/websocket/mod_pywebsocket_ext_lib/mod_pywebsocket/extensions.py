@@ -452,6 +452,8 @@ class DeflateMessageProcessor(ExtensionProcessorInterface):
             self._S2C_MAX_WINDOW_BITS_PARAM)
         if not _validate_window_bits(s2c_max_window_bits):
             return None
+        if s2c_max_window_bits is not None:
+            s2c_max_window_bits = int(s2c_max_window_bits)
 
         s2c_no_context_takeover = self._request.has_parameter(
             self._S2C_NO_CONTEXT_TAKEOVER_PARAM)
@@ -659,6 +661,93 @@ _available_processors[common.PERMESSAGE_COMPRESSION_EXTENSION] = (
     PerMessageCompressionExtensionProcessor)
 
 
+class ClientDeflateMessageProcessor(DeflateMessageProcessor):
+    """Per-message deflate processor for the client side of a connection.
+
+    The request is the deflate method accepted by the server. Outgoing
+    messages are compressed with a window of at most window_bits bits,
+    lowered to the c2s_max_window_bits value the server may have set.
+    """
+
+    def __init__(self, request, window_bits=None):
+        DeflateMessageProcessor.__init__(self, request)
+        self._window_bits = window_bits
+
+    def _get_extension_response_internal(self):
+        c2s_max_window_bits = self._request.get_parameter_value(
+            self._C2S_MAX_WINDOW_BITS_PARAM)
+        if not _validate_window_bits(c2s_max_window_bits):
+            return None
+
+        window_bits = self._window_bits
+        if (c2s_max_window_bits is not None and
+            (window_bits is None or int(c2s_max_window_bits) < window_bits)):
+            window_bits = int(c2s_max_window_bits)
+
+        c2s_no_context_takeover = self._request.has_parameter(
+            self._C2S_NO_CONTEXT_TAKEOVER_PARAM)
+
+        self._deflater = util._RFC1979Deflater(
+            window_bits, c2s_no_context_takeover)
+
+        self._inflater = util._RFC1979Inflater()
+
+        self._compress_outgoing_enabled = True
+
+        self._logger.debug(
+            'Enable %s extension (c2s window bits=%s; '
+            'c2s_no_context_takeover=%r)' %
+            (self._request.name(), window_bits, c2s_no_context_takeover))
+
+        return self._request
+
+
+def create_permessage_deflate_offer(window_bits=None):
+    """Returns the ExtensionParameter a client sends to offer the
+    permessage-compress extension with the deflate method. When window_bits
+    is given, the server is asked to compress with a window of at most
+    window_bits bits.
+    """
+
+    method_params = []
+    if window_bits is not None:
+        method_params.append(
+            (DeflateMessageProcessor._S2C_MAX_WINDOW_BITS_PARAM,
+             str(window_bits)))
+
+    offer = common.ExtensionParameter(common.PERMESSAGE_COMPRESSION_EXTENSION)
+    offer.add_parameter(
+        CompressionExtensionProcessorBase._METHOD_PARAM,
+        _create_accepted_method_desc(
+            PerMessageCompressionExtensionProcessor._DEFLATE_METHOD,
+            method_params))
+    return offer
+
+
+def get_accepted_permessage_deflate(extension, window_bits=None):
+    """Returns a ClientDeflateMessageProcessor set up from the
+    permessage-compress extension accepted by the server, or None if the
+    server did not accept the deflate method.
+    """
+
+    method_list = extension.get_parameter_value(
+        CompressionExtensionProcessorBase._METHOD_PARAM)
+    if method_list is None:
+        return None
+    methods = _parse_compression_method(method_list)
+    if methods is None or len(methods) != 1:
+        return None
+    method_desc = methods[0]
+    if (method_desc.name() !=
+        PerMessageCompressionExtensionProcessor._DEFLATE_METHOD):
+        return None
+
+    processor = ClientDeflateMessageProcessor(method_desc, window_bits)
+    if processor.get_extension_response() is None:
+        return None
+    return processor
+
+
 # Adding vendor-prefixed permessage-compress extension.
 # TODO(bashi): Remove this after WebKit stops using vendor prefix.
 _available_processors[common.X_WEBKIT_PERMESSAGE_COMPRESSION_EXTENSION] = (
@@ -34,6 +34,7 @@
 
 import array
 import errno
+import itertools
 
 # Import hash classes from a module available and recommended for each Python
 # version and re-export those symbol. Use sha and md5 module in Python 2.4, and
@@ -50,9 +51,11 @@ except ImportError:
 
 import StringIO
 import logging
+import operator
 import os
 import re
 import socket
+import struct
 import traceback
 import zlib
 
@@ -174,10 +177,29 @@ class RepeatedXorMasker(object):
     ended and resumes from that point on the next mask method call.
     """
 
+    # The widest array type code whose items are a whole number of masking
+    # key repetitions (8 bytes on LP64 platforms, 4 bytes otherwise).
+    _WORD_TYPECODE = 'L'
+    if array.array('L').itemsize not in (4, 8):
+        _WORD_TYPECODE = 'I'
+
     def __init__(self, masking_key):
         self._masking_key = masking_key
         self._masking_key_index = 0
 
+        # For each key index, the key rotated to start at that index and
+        # repeated over a word, as a native integer.
+        word_size = array.array(self._WORD_TYPECODE).itemsize
+        self._word_size = word_size
+        self._masking_key_words = None
+        if masking_key and word_size % len(masking_key) == 0:
+            repeat = word_size / len(masking_key)
+            self._masking_key_words = []
+            for index in xrange(len(masking_key)):
+                rotated_key = masking_key[index:] + masking_key[:index]
+                self._masking_key_words.append(array.array(
+                        self._WORD_TYPECODE, rotated_key * repeat)[0])
+
     def _mask_using_swig(self, s):
         masked_data = fast_masking.mask(
                 s, self._masking_key, self._masking_key_index)
@@ -203,10 +225,32 @@ class RepeatedXorMasker(object):
 
         return result.tostring()
 
+    def _mask_using_words(self, s):
+        """Applies the mask on whole words, then on the remaining bytes."""
+
+        if self._masking_key_words is None:
+            return self._mask_using_array(s)
+
+        word_size = self._word_size
+        aligned_size = len(s) - len(s) % word_size
+        if aligned_size == 0:
+            return self._mask_using_array(s)
+
+        # The key index does not change over the aligned part as its size is
+        # a multiple of the key length.
+        key_word = self._masking_key_words[self._masking_key_index]
+        words = array.array(self._WORD_TYPECODE)
+        words.fromstring(s[:aligned_size])
+        words = array.array(self._WORD_TYPECODE,
+                            map(operator.xor, words,
+                                itertools.repeat(key_word, len(words))))
+
+        return words.tostring() + self._mask_using_array(s[aligned_size:])
+
     if 'fast_masking' in globals():
         mask = _mask_using_swig
     else:
-        mask = _mask_using_array
+        mask = _mask_using_words
 
 
 class DeflateRequest(object):
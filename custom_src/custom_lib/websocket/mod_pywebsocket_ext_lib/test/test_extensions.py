@@ -34,11 +34,16 @@
 
 
 import unittest
+import zlib
 
 import set_sys_path  # Update sys.path to locate mod_pywebsocket module.
 
 from mod_pywebsocket import common
 from mod_pywebsocket import extensions
+from mod_pywebsocket import msgutil
+from mod_pywebsocket.stream import Stream
+from mod_pywebsocket.stream import StreamOptions
+from test import mock
 
 
 class CompressionMethodParameterParserTest(unittest.TestCase):
@@ -114,6 +119,174 @@ class CompressionMethodParameterParserTest(unittest.TestCase):
         self.assertEqual('foo; x="Hello, World"; y=10', desc)
 
 
+def _accept_offer(offer, hook=None):
+    """Returns the server-side processor and response to a client offer,
+    going through the header format as a handshake does.
+    """
+
+    offer = common.parse_extensions(common.format_extension(offer),
+                                    allow_quoted_string=True)[0]
+    processor = extensions.PerMessageCompressionExtensionProcessor(offer)
+    if hook is not None:
+        processor.set_compression_processor_hook(hook)
+    response = processor.get_extension_response()
+    if response is not None:
+        response = common.parse_extensions(
+            common.format_extension(response), allow_quoted_string=True)[0]
+    return processor, response
+
+
+def _create_response(method_desc):
+    response = common.ExtensionParameter(
+        common.PERMESSAGE_COMPRESSION_EXTENSION)
+    if method_desc is not None:
+        response.add_parameter('method', method_desc)
+    return response
+
+
+class PermessageDeflateNegotiationTest(unittest.TestCase):
+    """A unittest for the client side negotiation of the
+    permessage-compress extension with the deflate method.
+    """
+
+    def test_offer(self):
+        offer = extensions.create_permessage_deflate_offer()
+        self.assertEqual(common.PERMESSAGE_COMPRESSION_EXTENSION,
+                         offer.name())
+        self.assertEqual('deflate', offer.get_parameter_value('method'))
+
+    def test_offer_with_window_bits(self):
+        offer = extensions.create_permessage_deflate_offer(10)
+        self.assertEqual('deflate; s2c_max_window_bits=10',
+                         offer.get_parameter_value('method'))
+
+        server, response = _accept_offer(offer)
+        self.assertEqual(10, server.get_compression_processor()
+                         ._deflater._window_bits)
+
+    def test_accept(self):
+        server, response = _accept_offer(
+            extensions.create_permessage_deflate_offer())
+        processor = extensions.get_accepted_permessage_deflate(response)
+        self.assertTrue(
+            isinstance(processor, extensions.ClientDeflateMessageProcessor))
+        self.assertEqual(zlib.MAX_WBITS, processor._deflater._window_bits)
+
+    def test_accept_with_window_bits(self):
+        server, response = _accept_offer(
+            extensions.create_permessage_deflate_offer(12))
+        processor = extensions.get_accepted_permessage_deflate(response, 12)
+        self.assertEqual(12, processor._deflater._window_bits)
+
+    def test_accept_lowered_window_bits(self):
+        def _hook(compression_processor):
+            compression_processor.set_c2s_max_window_bits(9)
+            compression_processor.set_c2s_no_context_takeover(True)
+
+        server, response = _accept_offer(
+            extensions.create_permessage_deflate_offer(), _hook)
+        self.assertEqual(
+            'deflate; c2s_max_window_bits=9; c2s_no_context_takeover',
+            response.get_parameter_value('method'))
+        processor = extensions.get_accepted_permessage_deflate(response, 12)
+        self.assertEqual(9, processor._deflater._window_bits)
+        self.assertTrue(processor._deflater._no_context_takeover)
+
+        # A smaller window given by the client is kept.
+        processor = extensions.get_accepted_permessage_deflate(response, 8)
+        self.assertEqual(8, processor._deflater._window_bits)
+
+    def test_decline(self):
+        # The server answers without the extension when it declines, the
+        # client then keeps permessage_deflate True and sends messages
+        # uncompressed. Responses it cannot use are rejected:
+        for method_desc in (None, 'foo', 'deflate, foo',
+                            'deflate; c2s_max_window_bits=16',
+                            'deflate; c2s_max_window_bits=x'):
+            self.assertEqual(
+                None,
+                extensions.get_accepted_permessage_deflate(
+                    _create_response(method_desc)),
+                method_desc)
+
+    def test_server_declines_unknown_method(self):
+        offer = common.ExtensionParameter(
+            common.PERMESSAGE_COMPRESSION_EXTENSION)
+        offer.add_parameter('method', 'foo')
+        server, response = _accept_offer(offer)
+        self.assertEqual(None, response)
+
+
+class ClientDeflateMessageProcessorTest(unittest.TestCase):
+    """A unittest for ClientDeflateMessageProcessor, exchanging messages
+    with the server side processor.
+    """
+
+    def _connect(self, window_bits=None, hook=None):
+        server, response = _accept_offer(
+            extensions.create_permessage_deflate_offer(window_bits), hook)
+        client = extensions.get_accepted_permessage_deflate(
+            response, window_bits)
+
+        client_options = StreamOptions()
+        client_options.mask_send = True
+        client_options.unmask_receive = False
+        client.setup_stream_options(client_options)
+        client_request = mock.MockRequest(connection=mock.MockBlockingConn())
+        client_request.ws_version = common.VERSION_HYBI_LATEST
+        client_request.ws_stream = Stream(client_request, client_options)
+        return client_request, server
+
+    def _receive_on_server(self, server, data):
+        server_options = StreamOptions()
+        server.setup_stream_options(server_options)
+        request = mock.MockRequest(connection=mock.MockConn(data))
+        request.ws_version = common.VERSION_HYBI_LATEST
+        request.ws_stream = Stream(request, server_options)
+        return request
+
+    def test_send_compressed(self):
+        client_request, server = self._connect()
+        payload = 'Hello, permessage deflate. ' * 20
+        msgutil.send_message(client_request, payload)
+        data = client_request.connection.written_data()
+
+        # FIN, RSV1 (compressed) and text opcode:
+        self.assertEqual(0xc1, ord(data[0]))
+        self.assertTrue(len(data) < len(payload))
+
+        request = self._receive_on_server(server, data)
+        self.assertEqual(payload, msgutil.receive_message(request))
+
+    def test_send_with_small_window(self):
+        def _hook(compression_processor):
+            compression_processor.set_c2s_max_window_bits(9)
+
+        client_request, server = self._connect(15, _hook)
+        payloads = ['abcdefgh' * 40, 'ijklmnop' * 40, 'abcdefgh' * 40]
+        for payload in payloads:
+            msgutil.send_message(client_request, payload)
+
+        request = self._receive_on_server(
+            server, client_request.connection.written_data())
+        for payload in payloads:
+            self.assertEqual(payload, msgutil.receive_message(request))
+
+    def test_receive_compressed(self):
+        client_request, server = self._connect()
+        payload = 'From the server. ' * 20
+        server_request = mock.MockRequest(connection=mock.MockBlockingConn())
+        server_request.ws_version = common.VERSION_HYBI_LATEST
+        server_options = StreamOptions()
+        server.setup_stream_options(server_options)
+        server_request.ws_stream = Stream(server_request, server_options)
+        msgutil.send_message(server_request, payload)
+
+        client_request.connection.put_bytes(
+            server_request.connection.written_data())
+        self.assertEqual(payload, msgutil.receive_message(client_request))
+
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -129,6 +129,24 @@ class RepeatedXorMaskerTest(unittest.TestCase):
                 "\x05s\x1f%\x04s\x0f,\x152K9\x132\x05>\x076\x19c",
                 result)
 
+    def test_mask_words(self):
+        # Compare with the byte by byte result for sizes around the word size
+        # and all key positions.
+        masking_key = '\x12\x9a\xff\x40'
+        original = ''.join([chr((i * 37) % 256) for i in xrange(40)])
+        for offset in xrange(4):
+            for size in xrange(len(original) + 1):
+                masker = util.RepeatedXorMasker(masking_key)
+                masker.mask('\x00' * offset)
+                expected = ''.join(
+                        [chr(ord(original[i]) ^
+                             ord(masking_key[(offset + i) % 4]))
+                         for i in xrange(size)])
+                self.assertEqual(expected, masker.mask(original[:size]))
+                # The key index goes on from where the data ended.
+                self.assertEqual(masking_key[(offset + size) % 4],
+                                 masker.mask('\x00'))
+
 
 if __name__ == '__main__':
     unittest.main()
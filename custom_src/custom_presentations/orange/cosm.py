@@ -3,18 +3,42 @@
 """
 COSM Presentation: https://cosm.com
 
+Sample values of channel0 are queued by the channel publisher and uploaded by the
+presentation thread, several datapoints per request, over a kept-alive HTTP
+connection.  A batch is posted as soon as batch_size datapoints are queued, or
+flush_interval seconds after the previous upload.  When an upload fails, it is
+retried with an increasing delay, the datapoints being kept in the queue.
+
+Settings:
+
+    batch_size
+        Maximum number of datapoints posted in one request (default: 20).
+
+    flush_interval
+        Maximum time in seconds a datapoint waits before being posted (default: 30).
+
+    send_queue_size
+        Maximum number of datapoints waiting to be posted (default: 500).  When the
+        queue is full, new datapoints are dropped.
 """
 # imports
 import threading
 import digitime
 import digi_httplib as httplib
+import socket
 import urllib
 
 from settings.settings_base import SettingsBase, Setting
 from presentations.presentation_base import PresentationBase
+from custom_lib.commons.send_queue import SendQueue
 
 # constants
 
+HTTP_TIMEOUT = 30.0
+
+MIN_WAIT_TIME_BETWEEN_FAILED_UPLOADS = 5.0
+MAX_WAIT_TIME_BETWEEN_FAILED_UPLOADS = 300.0
+
 # classes
 class Cosm(PresentationBase, threading.Thread):
     
@@ -32,6 +56,8 @@ class Cosm(PresentationBase, threading.Thread):
         self.__core = core_services
      
         self.__stopevent = threading.Event()
+        # set when a batch is ready, or to stop
+        self.__wakeup_event = threading.Event()
         
         from core.tracing import get_tracer
         self.__tracer = get_tracer(name)
@@ -39,6 +65,12 @@ class Cosm(PresentationBase, threading.Thread):
         self.use_proxy = None
         self.proxy_host = None
         self.proxy_port = None
+
+        self.__send_queue = None
+        self.__conn = None
+        # requests sent over the current connection
+        self.__conn_requests = 0
+        self.__retry_delay = MIN_WAIT_TIME_BETWEEN_FAILED_UPLOADS
         
         # Configuration Settings:
 
@@ -51,6 +83,12 @@ class Cosm(PresentationBase, threading.Thread):
                 Setting(name="use_proxy", type=bool, required=False, default_value=False),
                 Setting(name="proxy_host", type=str, required=False),                   
                  Setting(name="proxy_port", type=int, required=False, default_value=3128),              
+                Setting(name="batch_size", type=int, required=False, default_value=20,
+                        verify_function=lambda x: x > 0),
+                Setting(name="flush_interval", type=int, required=False, default_value=30,
+                        verify_function=lambda x: x > 0),
+                Setting(name="send_queue_size", type=int, required=False, default_value=500,
+                        verify_function=lambda x: x > 0),
         ]
                                                  
         PresentationBase.__init__(self, name=name, settings_list=settings_list)
@@ -63,6 +101,21 @@ class Cosm(PresentationBase, threading.Thread):
                 self.__tracer.warning("proxy_host configuration parameter not set. Will ignore use_proxy to false")
                 self.use_proxy = False
 
+        # settings used for each upload
+        self.cosm_host = SettingsBase.get_setting (self, "cosm_host")
+        self.cosm_key = SettingsBase.get_setting (self, 'cosm_key')
+        self.batch_size = SettingsBase.get_setting (self, 'batch_size')
+        self.flush_interval = SettingsBase.get_setting (self, 'flush_interval')
+
+        feed_uri = "v2/feeds/%s/datastreams/%s/datapoints.csv" % (SettingsBase.get_setting (self, 'cosm_feed_id0'),
+                                                                 SettingsBase.get_setting (self, 'cosm_datastream0'))
+        if self.use_proxy:
+            self.cosm_update_url = "http://%s/%s" % (self.cosm_host, feed_uri)
+        else:
+            self.cosm_update_url = "/%s" % feed_uri
+
+        self.__send_queue = SendQueue(SettingsBase.get_setting (self, 'send_queue_size'), logger=self.__tracer)
+
         threading.Thread.__init__(self, name=name)
         threading.Thread.setDaemon(self, True)
         
@@ -75,14 +128,40 @@ class Cosm(PresentationBase, threading.Thread):
  
     def stop(self):
         self.__stopevent.set()
+        self.__wakeup_event.set()
         return True
 
     def run(self):
 
         self.subscribe_write_channels()
                
+        next_upload_time = digitime.time() + self.flush_interval
+        retrying = False
+
         while not self.__stopevent.isSet():
-            digitime.sleep(3.0)
+
+            # a full batch does not shorten the delay before a retry
+            delay = next_upload_time - digitime.time()
+            if delay > 0 and (retrying or not self.__batch_ready()):
+                self.__wakeup_event.wait(delay)
+            self.__wakeup_event.clear()
+            if self.__stopevent.isSet():
+                break
+
+            if digitime.time() < next_upload_time and (retrying or not self.__batch_ready()):
+                continue
+
+            if self.__upload_send_queue():
+                retrying = False
+                self.__retry_delay = MIN_WAIT_TIME_BETWEEN_FAILED_UPLOADS
+                next_upload_time = digitime.time() + self.flush_interval
+            else:
+                retrying = True
+                self.__tracer.info("Next upload attempt in %d seconds, %d datapoints queued" % (self.__retry_delay, len(self.__send_queue)))
+                next_upload_time = digitime.time() + self.__retry_delay
+                self.__retry_delay = min(self.__retry_delay * 2, MAX_WAIT_TIME_BETWEEN_FAILED_UPLOADS)
+
+        self.__close_connection()
             
         return
 
@@ -105,18 +184,14 @@ class Cosm(PresentationBase, threading.Thread):
                         
         if monitored_sample.value:
             
-            self.send_to_cosm (channel.name(), monitored_sample.value)
+            self.send_to_cosm (channel.name(), monitored_sample.value, monitored_sample.timestamp)
             
         return
             
-    def send_to_cosm (self, channel_name, value):
+    def send_to_cosm (self, channel_name, value, timestamp=None):
+        """ Queues a datapoint, to be posted by the presentation thread. """
         
         self.__tracer.debug("Reveived a new sample from channel: %s" % channel_name)        
-
-        cosm_host = SettingsBase.get_setting (self, "cosm_host")        
-        cosm_key = SettingsBase.get_setting (self, 'cosm_key')
-        cosm_feed_id0 = SettingsBase.get_setting (self, 'cosm_feed_id0')
-        cosm_datastream0 = SettingsBase.get_setting(self, 'cosm_datastream0')
         
         if type(value) == type(float()):
             cosm_value = str(value)
@@ -130,39 +205,104 @@ class Cosm(PresentationBase, threading.Thread):
             self.__tracer.error("Value type not handled: %s" % type(value))
             return
 
-        feed_uri = "v2/feeds/%s/datastreams/%s/datapoints.csv" % (cosm_feed_id0, cosm_datastream0)
+        if not timestamp:
+            timestamp = digitime.time()
 
-        if self.use_proxy:
-            conn = httplib.HTTPConnection(host=self.proxy_host, port=self.proxy_port)
-            cosm_update_url = "http://%s/%s" % (cosm_host, feed_uri)
-            self.__tracer.info("Calling COSM with URL %s over http proxy %s:%d" % (cosm_update_url, self.proxy_host, self.proxy_port))
+        if not self.__send_queue.put("%s,%s\n" % (digitime.form_iso_date_str(timestamp), cosm_value)):
+            self.__tracer.warning("Upload queue full, datapoint dropped (%d dropped so far)" % self.__send_queue.dropped)
+        elif len(self.__send_queue) >= self.batch_size:
+            self.__wakeup_event.set()
+        
+        return
+    # Internal functions & classes
+
+    def __batch_ready(self):
+        return len(self.__send_queue) >= self.batch_size
+
+    def __upload_send_queue(self):
+        """ Posts the queued datapoints, batch_size at a time.  Returns False
+        if a batch could not be posted: it is left in the queue. """
+
+        while True:
+            batch = self.__send_queue.get_batch(self.batch_size)
+            if not batch:
+                return True
+            if not self.__post_datapoints(batch):
+                self.__send_queue.unget_batch(batch)
+                return False
+
+    def __post_datapoints(self, batch):
+        """ Posts a batch of CSV datapoints.  Returns False if it should be
+        posted again later. """
+
+        body = ''.join(batch)
+
+        # A kept-alive connection may have been closed by the server while
+        # idle: in that case, the request is sent once again on a new one.
+        for attempt in (0, 1):
+            reused_connection = self.__conn_requests > 0
+            try:
+                errcode, errmsg = self.__post(body)
+            except (socket.error, httplib.HTTPException), msg:
+                self.__close_connection()
+                if reused_connection and attempt == 0:
+                    self.__tracer.debug("Request on kept-alive connection failed (%s), reconnecting" % msg)
+                    continue
+                self.__tracer.error("Exception raised during request. Exception was: %s" % msg)
+                return False
+            except Exception, msg:
+                # not a network failure, posting them again would fail again
+                self.__close_connection()
+                self.__tracer.error("Exception raised during request. Exception was: %s, %d datapoints dropped" % (msg, len(batch)))
+                return True
+            break
+
+        if errcode == 200 or errcode == 201:
+            self.__tracer.info("Request result: %s (%d datapoints)" % (errmsg, len(batch)))
+        elif errcode >= 500:
+            self.__tracer.error("Request ERROR: %d %s" % (errcode, errmsg))
+            return False
         else:
-            conn = httplib.HTTPConnection(host=cosm_host)
-            cosm_update_url = "/%s" % feed_uri
-            self.__tracer.info("Calling COSM with URL: %s" % cosm_update_url)                   
-            
-        try:
-            conn.putrequest('POST', url = cosm_update_url)
-    
-            conn.putheader('X-ApiKey', cosm_key)
-            clen = len(cosm_value)
-            conn.putheader('Content-Length', `clen`)
-            conn.endheaders()
-            
+            # the server will reject these datapoints again
+            self.__tracer.error("Request ERROR: %d %s, %d datapoints dropped" % (errcode, errmsg, len(batch)))
+        return True
 
-            conn.send(cosm_value)
-        
-            response = conn.getresponse()
-            errcode = response.status
-            errmsg = response.reason
-            headers = response.msg
-            conn.close()
-        
-            if errcode != 200 and errcode != 201:  
-                self.__tracer.error("Request ERROR: %d %s" % (errcode, errmsg))
+    def __post(self, body):
+        """ Sends a request over the kept-alive connection, opened if needed.
+        Returns the status code and reason of the response. """
+
+        if self.__conn is None:
+            if self.use_proxy:
+                self.__tracer.info("Connecting to COSM with URL %s over http proxy %s:%d" % (self.cosm_update_url, self.proxy_host, self.proxy_port))
+                self.__conn = httplib.HTTPConnection(host=self.proxy_host, port=self.proxy_port, timeout=HTTP_TIMEOUT)
             else:
-                self.__tracer.info("Request result: %s" % errmsg)
-        except Exception, msg:
-            self.__tracer.error ('Exception raised during request. Exception was: %s'%(msg))
-        
-        return
\ No newline at end of file
+                self.__tracer.info("Connecting to COSM with URL: %s" % self.cosm_update_url)
+                self.__conn = httplib.HTTPConnection(host=self.cosm_host, timeout=HTTP_TIMEOUT)
+            self.__conn_requests = 0
+
+        conn = self.__conn
+        conn.putrequest('POST', url = self.cosm_update_url)
+        conn.putheader('X-ApiKey', self.cosm_key)
+        conn.putheader('Content-Type', 'text/csv')
+        conn.putheader('Content-Length', str(len(body)))
+        conn.endheaders()
+        conn.send(body)
+        self.__conn_requests += 1
+
+        response = conn.getresponse()
+        # the response must be read for the connection to be reused
+        response.read()
+        if response.will_close:
+            self.__close_connection()
+
+        return response.status, response.reason
+
+    def __close_connection(self):
+        if self.__conn is not None:
+            try:
+                self.__conn.close()
+            except:
+                # ignore any fault
+                pass
+            self.__conn = None
+        self.__conn_requests = 0
@@ -68,6 +68,7 @@ from channels.channel_source_device_property import *
 
 # TODO: http://s-polarion-pangoov4/polarion/redirect/project/PangooDiaGW/workitem?id=DiaGW-33
 from custom_lib import logutils
+from custom_lib.commons.event_loop import EventLoop
 
 # Commons
 from custom_lib.commons import PANGOO_STRING_SAMPLE_FOR_DD_ERROR
@@ -110,7 +111,8 @@ WAIT_TIME_BETWEEN_SUCCESSIVE_FAILD_SERVER_CONNECT = 30.0
 TIMEOUT_ALWAYS_ON_PACKET_BODY = 2.0
 TIMEOUT_FOR_WAVEPORT_DD_LOCAL_REQUEST = 10.0
 
-BLINK_TIME_BASE_SLEEP = 0.5
+# Longest wait for server data, so that watchdogs are stroked in time
+MAIN_LOOP_MAX_WAIT = 60.0
 
 
 
@@ -136,7 +138,10 @@ class AlwaysOn(PresentationBase, threading.Thread):
         
         self.gateway_id = None
         self.server_conn_handle = None
-        self.keep_alive_timer = 0
+        self.last_send_time = 0
+        self.keep_alive_interval = 0
+        self.keep_alive_timer = None
+        self.reconnect_timer = None
         self.waiting_for_reply = False
         self.gateway_v1_backward_compatibility = False
         self.ao_msg_size_on_7_bits = True
@@ -145,6 +150,9 @@ class AlwaysOn(PresentationBase, threading.Thread):
         # watchdogs
         self.mainloop_made_a_pause = None
         self.mainloop_made_one_loop = None
+        
+        # server socket, DD messages and timers events
+        self.event_loop = EventLoop(self.logger)
 
         settings_list = [
             Setting(
@@ -270,27 +278,22 @@ class AlwaysOn(PresentationBase, threading.Thread):
 
         # Get settings to initialize local class variables
         
-        keep_alive_interval = SettingsBase.get_setting(self, 'keep_alive_interval')
-        keep_alive_interval_timer_total_blinks = keep_alive_interval*60*(1.0/BLINK_TIME_BASE_SLEEP)
-        
-        ao_server_connexion_timer_total_blinks = WAIT_TIME_BETWEEN_SUCCESSIVE_FAILD_SERVER_CONNECT*(1.0/BLINK_TIME_BASE_SLEEP)
+        self.keep_alive_interval = SettingsBase.get_setting(self, 'keep_alive_interval') * 60
 
         self.open_tcp_connection()
         
-        conn_cnt = 0
-        
-        blink_cnt = 0
-        mainloop_made_a_pause_strike_cnt = 0
-        
-        take_a_delay_in_next_loop_iteration = False
+        #===============================================================
+        #
+        # Loop body
+        #
+        # Server messages are processed as soon as they are received,
+        # keep alives and reconnections are run from timers
         
         while(True):
             
-            if (take_a_delay_in_next_loop_iteration):
-                # take a rest
-                time.sleep(BLINK_TIME_BASE_SLEEP)
-                mainloop_made_a_pause_strike_cnt += 1
-                                
+            events_count = self.event_loop.run_once(MAIN_LOOP_MAX_WAIT)
+            
+            if (events_count == 0):
                 # WARNING: infinite active loop risk here
                 # To prevent this, we use a watchdog to check that to insure that this code
                 # is executed some times
@@ -300,54 +303,6 @@ class AlwaysOn(PresentationBase, threading.Thread):
             # Notify the watchdog that we are still looping
             if (self.mainloop_made_one_loop):
                 self.mainloop_made_one_loop.stroke()
-
-            blink_cnt += 1
-            if (blink_cnt > 50):
-                self.logger.debug('Blink (Nb pauses: %d)' % mainloop_made_a_pause_strike_cnt)
-                mainloop_made_a_pause_strike_cnt = 0
-                blink_cnt = 0
-       
-            if (self.server_conn_handle):
-                
-                # Connected to AO server: we can process datas
-                
-
-                # WARNING: this may introduce an infinite loop
-                # The loop ends only if no more data are available for processing
-                #
-                # The watchdog is of this loop so that if this loop lasts to much time,
-                # the watchdog resets everything
-                
-                # poll for work
-                data_has_been_processed = self.aos_poll()
-                if (data_has_been_processed):
-                    # aos_poll does not consume all available data
-                    # so, loop immediately as long as data are available
-                    take_a_delay_in_next_loop_iteration = False
-                else:
-                    # aos_poll processed no data, which means that no data is currently available.
-                    # so, in the next loop iteration, we tell to take a rest
-                    take_a_delay_in_next_loop_iteration = True
-                
-                if (keep_alive_interval > 0):
-                    self.keep_alive_timer += 1
-                    if (self.keep_alive_timer >= keep_alive_interval_timer_total_blinks):
-                        self.send_keep_alive()
-
-            else:
-                
-                # Not connected to AO server: try first to connect to it
-                
-                take_a_delay_in_next_loop_iteration = True
-                
-                conn_cnt += 1
-                if (conn_cnt > ao_server_connexion_timer_total_blinks):
-                    
-                    self.logger.info('Retry to open TCP connection')
-                    
-                    conn_cnt = 0
-                    #open our server connection
-                    self.open_tcp_connection()
             
     def receive_response_cb(self, channel):
         """A new sample has arrived on one of the response channels
@@ -369,6 +324,9 @@ class AlwaysOn(PresentationBase, threading.Thread):
             self.radio_responses.put(sample.value, False)
         except Exception, msg:
             self.logger.critical("Fatal error while writing new sample to radio_responses queue: %s" % msg)
+            
+        # unsolicited packets are sent by the main thread
+        self.event_loop.call_soon(self.process_dd_messages)
 
     #-------------------------------------
     def init_hardware_board_system_config(self):
@@ -411,10 +369,37 @@ class AlwaysOn(PresentationBase, threading.Thread):
   
             
     def close_tcp_connection(self):
-        """Close the tcp connection to the server"""
+        """Close the tcp connection to the server, and schedule a new connection"""
         if self.server_conn_handle:
+            self.event_loop.remove_reader(self.server_conn_handle)
             self.server_conn_handle.close()
             self.server_conn_handle = None
+            self.schedule_reconnection()
+
+    def schedule_reconnection(self):
+        """Retry to connect to the server later"""
+        if self.keep_alive_timer:
+            self.keep_alive_timer.cancel()
+            self.keep_alive_timer = None
+        if not self.reconnect_timer:
+            self.logger.info('Will retry to connect in %d seconds' % WAIT_TIME_BETWEEN_SUCCESSIVE_FAILD_SERVER_CONNECT)
+            self.reconnect_timer = self.event_loop.call_later(WAIT_TIME_BETWEEN_SUCCESSIVE_FAILD_SERVER_CONNECT,
+                                                              self.reconnect)
+
+    def reconnect(self):
+        """Timer callback opening the connection to the server"""
+        self.reconnect_timer = None
+        if not self.server_conn_handle:
+            self.logger.info('Retry to open TCP connection')
+            self.open_tcp_connection()
+
+    def connection_opened(self):
+        """Start to process server messages and to send keep alives"""
+        self.event_loop.add_reader(self.server_conn_handle, self.server_readable)
+        if (self.keep_alive_interval > 0):
+            self.keep_alive_timer = self.event_loop.call_later(self.keep_alive_interval, self.keep_alive_check)
+        # process messages queued by device drivers while disconnected
+        self.event_loop.call_soon(self.process_dd_messages)
 
     def open_tcp_connection(self):
         """Establish the tcp connection to the server"""
@@ -442,7 +427,7 @@ class AlwaysOn(PresentationBase, threading.Thread):
             
             self.logger.info('IP connect successfull to %s:%d'%(ip, port))
         except Exception, msg:
-            self.logger.critical('IP connect failed to %s:%d. Error was: %s. Will retry in %d seconds'%(ip, port, msg, WAIT_TIME_BETWEEN_SUCCESSIVE_FAILD_SERVER_CONNECT))
+            self.logger.critical('IP connect failed to %s:%d. Error was: %s.'%(ip, port, msg))
             
             # In some cases for SocketException, the msg is formated as a tuple, so that it contains an error code as first field.
             # We get the first element and compare it to known errors
@@ -452,10 +437,27 @@ class AlwaysOn(PresentationBase, threading.Thread):
                 self.logger.info('    The connection will probably succeed later...')
             self.server_conn_handle.close()
             self.server_conn_handle = None
+            self.schedule_reconnection()
+            
+        if self.server_conn_handle:
+            # send_id_pkt did not close it
+            self.connection_opened()
+        
+    def keep_alive_check(self):
+        """Timer callback sending a keep alive when nothing has been sent for keep_alive_interval"""
+        self.keep_alive_timer = None
+        if not self.server_conn_handle:
+            return
+        idle_time = time.time() - self.last_send_time
+        if (idle_time >= self.keep_alive_interval):
+            self.send_keep_alive()
+            idle_time = 0
+        if self.server_conn_handle:
+            self.keep_alive_timer = self.event_loop.call_later(self.keep_alive_interval - idle_time, self.keep_alive_check)
         
     def send_keep_alive(self):
         """Sends a keep alive message over the TCP connection"""
-        self.keep_alive_timer = 0
+        self.last_send_time = time.time()
         try:
             self.logger.info('Sends a keep alive command')
     
@@ -465,35 +467,31 @@ class AlwaysOn(PresentationBase, threading.Thread):
             self.logger.error('Send keep alive socket error. Error was: %s'%(msg))
             self.close_tcp_connection()
 
-    def aos_poll(self):
-        ''' Poll for data from the server and WP DD to process.
-        When no data has been processed, return False
-        Return True in any data (from AO server or DD) has been processed
-        '''
+    def server_readable(self):
+        ''' Reader callback processing a message from the AO server '''
         
         # Give priority to DD response message.
         # So, before checking for now messages from AO server,
         # check (and process ALL) messages from DD
+        self.process_dd_messages()
         
-        any_data_has_been_processed = False
+        if (self.server_conn_handle):
+            # handle socket requests from server
+            ao_message = self.receive_ao_message(TIMEOUT_INSTANTANEOUS)
+            if (ao_message):
+                self.process_ao_received_message(ao_message)
 
-        # Check first for unsolicited WP datas to empty response queue
+    def process_dd_messages(self):
+        ''' Sends the unsolicited packets queued by the device drivers to the AO server '''
+        
         # handle ALL unsolicited packets from waveport
-        unsolicitedWPPacket = self.receive_dd_message(TIMEOUT_INSTANTANEOUS)
-        while (unsolicitedWPPacket):
-                any_data_has_been_processed = True
-                self.process_unsolicited_waveport_packet(unsolicitedWPPacket)
-                unsolicitedWPPacket = self.receive_dd_message (TIMEOUT_INSTANTANEOUS)
-                
-        # Now the DD response message queue is considered empty
-            
-        # handle socket requests from server
-        ao_message = self.receive_ao_message(TIMEOUT_INSTANTANEOUS)
-        if (ao_message):
-            any_data_has_been_processed = True
-            self.process_ao_received_message(ao_message)
-            
-        return any_data_has_been_processed
+        while (self.server_conn_handle):
+            try:
+                unsolicitedWPPacket = self.radio_responses.get_nowait()
+            except Queue.Empty:
+                # not more messages available in queue
+                return
+            self.process_unsolicited_waveport_packet(unsolicitedWPPacket)
 
     #-------------------------------------
     def receive_ao_message(self, timeout):
@@ -506,16 +504,18 @@ class AlwaysOn(PresentationBase, threading.Thread):
             self.server_conn_handle.settimeout(timeout)
             header = self.server_conn_handle.recv(3)
         except socket.timeout:
-            header = ""
+            #nothing to read, so don't complain
+            if (timeout != TIMEOUT_INSTANTANEOUS):
+                self.logger.critical("No receive data from AO server, %f timeout", timeout)
+            return None
         except Exception, msg:
             self.logger.error('Exception raised during during message reception for server: %s'%(msg))
             self.close_tcp_connection()
             return None
             
         if len(header) == 0:
-            #nothing to read, so don't complain
-            if (timeout != TIMEOUT_INSTANTANEOUS):
-                self.logger.critical("No receive data from AO server, %f timeout", timeout)
+            self.logger.error('Connection closed by AO server')
+            self.close_tcp_connection()
             return None
         if len(header) != 3:
             self.logger.critical("Incomplete AO HDR")
@@ -686,17 +686,10 @@ class AlwaysOn(PresentationBase, threading.Thread):
         # first two bytes will be command and flags.
         self.generic_radio_pkt(payload[1:], 0)
 
-        ticks = 0.0
-        while (ticks < timeout) and (self.radio_responses.empty()):
-            ticks += BLINK_TIME_BASE_SLEEP
-            time.sleep(BLINK_TIME_BASE_SLEEP)
-        
-        if (self.radio_responses.empty()):
+        pkt = self.receive_dd_message(timeout)
+        if (pkt is None):
             self.logger.critical("Timeout waiting for Request reply %f", timeout)
             return
-
-        # radio_responses is considered to be non empty (see test above)
-        pkt = self.radio_responses.get_nowait()
         if (not pkt):
             self.logger.critical ("During transparent_request, radio_responses message happened to be empty, but should not be. Race problem?")
             return
@@ -710,7 +703,7 @@ class AlwaysOn(PresentationBase, threading.Thread):
         except Exception, msg:
             self.logger.error('Exception raised during send transparent_request. Exception was: %s'%(msg))
             self.close_tcp_connection()
-        self.keep_alive_timer = 0 # Reset our keep alive timer
+        self.last_send_time = time.time() # Reset our keep alive timer
         return
 
     #-------------------------------------
@@ -848,7 +841,7 @@ class AlwaysOn(PresentationBase, threading.Thread):
             self.logger.error('Exception raised during send to AO server. Exception was: %s'%(msg))
             self.close_tcp_connection()
 
-        self.keep_alive_timer = 0 # Reset our keep alive timer
+        self.last_send_time = time.time() # Reset our keep alive timer
         
     #-------------------------------------
     def process_gateway_command_pkt(self, gw_command):
@@ -1119,7 +1112,7 @@ class AlwaysOn(PresentationBase, threading.Thread):
                 self.logger.error('Exception raised during sending of unsilicited waveport packet. Exception was: %s'%(msg))
                 self.close_tcp_connection()
     
-            self.keep_alive_timer = 0 # Reset our keep alive timer
+            self.last_send_time = time.time() # Reset our keep alive timer
             
         except Exception:
             
@@ -1191,7 +1184,7 @@ class AlwaysOn(PresentationBase, threading.Thread):
             self.logger.error('Exception raised during send to ID packet. Exception was: %s'%(msg))
             self.close_tcp_connection()
             
-        self.kalive_timer = 0 # Reset our keep alive timer
+        self.last_send_time = time.time() # Reset our keep alive timer
         
     #=============================
     def retreive_phone_number_from_sim (self, max_tries = 1, retry_delay = 2):    
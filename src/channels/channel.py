@@ -162,6 +162,29 @@ class Channel:
     	self.__channel_source.producer_set(sample)
     	self.__on_new_sample()
 
+    def producer_convert(self, sample, timestamp=None):
+        """
+        Returns the sample :meth:`producer_set` would store for the
+        given one, stamped with *timestamp* if it has no timestamp.
+        Raises ValueError if the value does not fit the channel type.
+
+        """
+        return self.__channel_source.producer_convert(sample, timestamp)
+
+    def producer_store(self, sample):
+        """
+        Sets a sample returned by :meth:`producer_convert` as the new
+        value, without notifying the new sample callbacks.
+
+        Used to update several channels at once: the caller then
+        notifies the
+        :class:`~channels.channel_publisher.ChannelPublisher` of all
+        of them with
+        :meth:`~channels.channel_publisher.ChannelPublisher.new_samples_cb`.
+
+        """
+        self.__channel_source.producer_store(sample)
+
     def consumer_get(self):
         """
         Retrieves the current value as a
@@ -0,0 +1,100 @@
+# $Id$
+"""
+    Compares the sample storage of ChannelSourceDeviceProperty with the
+    former one, which copied each sample under a reentrant lock when it
+    was set and again each time it was read.
+
+    usage: python channel_benchmark.py [rounds]
+
+    Each round is a set followed by reads of the same channel, through the
+    Channel object as drivers and presentations use it.
+"""
+
+import os
+import sys
+import threading
+import time
+from copy import copy
+
+# src, where channels and samples are, and lib, where digitime is
+_src_dir = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, _src_dir)
+sys.path.insert(0, os.path.join(os.path.dirname(_src_dir), 'lib'))
+
+import digitime
+from channels.channel import Channel
+from channels.channel_source import ChannelSource
+from channels.channel_source_device_property import \
+    ChannelSourceDeviceProperty, DPROP_PERM_GET, DPROP_OPT_AUTOTIMESTAMP
+from samples.sample import Sample
+
+READS_PER_SET = (1, 4)
+
+# Former implementation
+
+class LegacyDeviceProperty(ChannelSourceDeviceProperty):
+    """ ChannelSourceDeviceProperty before samples were immutable """
+
+    def __init__(self, *args, **kwargs):
+        ChannelSourceDeviceProperty.__init__(self, *args, **kwargs)
+        self.legacy_rlock = threading.RLock()
+        self.legacy_sample = ChannelSourceDeviceProperty.producer_get(self)
+
+    def producer_get(self):
+        return self.legacy_sample
+
+    def producer_set(self, sample):
+        sample = ChannelSource._type_remap_and_check(self, self.type, sample)
+        self.legacy_rlock.acquire()
+        try:
+            if sample.timestamp == 0 and self.options & DPROP_OPT_AUTOTIMESTAMP:
+                sample.timestamp = digitime.time()
+            self.legacy_sample = copy(sample)
+        finally:
+            self.legacy_rlock.release()
+
+    def consumer_get(self):
+        return copy(self.legacy_sample)
+
+CASES = (
+    ('former', LegacyDeviceProperty),
+    ('immutable', ChannelSourceDeviceProperty),
+)
+
+def create_channel(property_class):
+    return Channel('benchmark.value', property_class(name='value', type=float,
+        initial=Sample(timestamp=0, value=0.0),
+        perms_mask=DPROP_PERM_GET, options=DPROP_OPT_AUTOTIMESTAMP))
+
+def time_channel(channel, rounds, reads):
+    start = time.time()
+    for i in xrange(rounds):
+        channel.producer_set(Sample(i, float(i), 'C'))
+        for j in xrange(reads):
+            channel.get()
+    return (time.time() - start) * 1000000.0 / rounds
+
+def main():
+    rounds = 100000
+    if len(sys.argv) > 1:
+        rounds = int(sys.argv[1])
+
+    channels = []
+    for name, property_class in CASES:
+        channel = create_channel(property_class)
+        channel.producer_set(Sample(0, 21.5, 'C'))
+        channels.append(channel)
+    for channel in channels[1:]:
+        sample, expected = channel.get(), channels[0].get()
+        if (sample.value, sample.unit) != (expected.value, expected.unit):
+            raise ValueError('%r differs from %r' % (sample, expected))
+
+    print '%-6s %12s %12s %8s' % ('reads', 'former us', 'current us', 'speedup')
+    for reads in READS_PER_SET:
+        former_time, current_time = [time_channel(channel, rounds, reads)
+                                     for channel in channels]
+        print '%-6d %12.2f %12.2f %7.1fx' % (
+            reads, former_time, current_time, former_time / current_time)
+
+if __name__ == '__main__':
+    main()
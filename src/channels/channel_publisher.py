@@ -32,7 +32,8 @@ from copy import copy
 
 from channels.channel import Channel, OPT_DONOTLOG
 from channels.logging.logging_events import \
-    LoggingEventNewSample, LoggingEventChannelNew, LoggingEventChannelRemove
+    LoggingEventNewSample, LoggingEventChannelNew, LoggingEventChannelRemove, \
+    LoggingEventNewSamples
 
 # constants
 
@@ -76,6 +77,8 @@ class ChannelPublisher:
     * :meth:`unsubscribe_from_all`
     * :meth:`subscribe_new_channels`
     * :meth:`unsubscribe_new_channels`
+    * :meth:`subscribe_sample_batches`
+    * :meth:`unsubscribe_sample_batches`
 
     All other routines help integrate the :class:`ChannelPublisher`
     into other components in the system
@@ -86,6 +89,7 @@ class ChannelPublisher:
         self.__core = core_services
         self.__new_channel_listeners = set()
         self.__channel_listeners = {}
+        self.__batch_listeners = set()
         self.__rlock = threading.RLock()
         self.__logging_manager = None
 		
@@ -234,6 +238,48 @@ class ChannelPublisher:
             self.__rlock.release()
 
 
+    def subscribe_sample_batches(self, callback):
+        """
+        Subscribe to get a callback with the list of the
+        :class:`~channels.channel.Channel` objects updated together
+        each time new samples are published.  Samples published one at
+        a time come as lists of one channel.
+
+        Parameters:
+
+        * `callback`: Callable object to be called
+
+        """
+
+        self.__rlock.acquire()
+
+        try:
+            self.__batch_listeners.add(callback)
+        finally:
+            self.__rlock.release()
+
+
+    def unsubscribe_sample_batches(self, callback):
+        """
+        Unsubscribe callback from sample batches.
+
+        Parameters:
+
+        * `callback`:  Callable previously registered
+
+        """
+
+        self.__rlock.acquire()
+
+        try:
+            if callback not in self.__batch_listeners:
+                raise SubscriberNotFound, "Subscriber not found."
+
+            self.__batch_listeners.remove(callback)
+        finally:
+            self.__rlock.release()
+
+
     def set_logging_manager(self, logging_manager):
     	"""
     	Sets the
@@ -269,7 +315,8 @@ class ChannelPublisher:
     def __dispatch_logging_event(self, logging_event):
         # dispatches all events to the logging manager.
 
-        if logging_event.channel.options_mask() & OPT_DONOTLOG:
+        if logging_event.channel is not None and \
+                logging_event.channel.options_mask() & OPT_DONOTLOG:
             return
         
         if self.__logging_manager is None:
@@ -328,22 +375,60 @@ class ChannelPublisher:
         
         """
         self.__dispatch_logging_event(LoggingEventNewSample(channel))
-        self.__notify(channel)
+        self.__notify([channel])
+
+    def new_samples_cb(self, channels):
+        """
+        Callback to receive new samples from several channels at once.
+
+        Part of an interface provided to the
+        :class:`~devices.device_base.DeviceBase`, which stores the new
+        samples of the channels before calling this method once.  A
+        single logging event is dispatched for the channels, then the
+        subscribers of each channel are called in turn, and the sample
+        batch subscribers once.
+
+        Parameter:
+
+        * `channels`:  the list of the channels with a new sample
 
-    def __notify(self, channel):
+        """
+        logged_channels = [channel for channel in channels
+                           if not channel.options_mask() & OPT_DONOTLOG]
+        if logged_channels:
+            self.__dispatch_logging_event(
+                LoggingEventNewSamples(logged_channels))
+        self.__notify(channels)
+
+    def __notify(self, channels):
+        # the subscribers are copied once, for all the channels
         self.__rlock.acquire()
         try:
-            channel_listeners = copy(self.__channel_listeners)
+            channel_listeners = self.__channel_listeners
+            notifications = [ ]
+            for channel in channels:
+                callbacks = channel_listeners.get(channel.name())
+                if callbacks:
+                    notifications.append((channel, list(callbacks)))
+            batch_listeners = list(self.__batch_listeners)
         finally:
             self.__rlock.release()
-        try:
-            if channel.name() in channel_listeners:
-                for callback in copy(channel_listeners[channel.name()]):
+
+        for channel, callbacks in notifications:
+            try:
+                for callback in callbacks:
                     callback(channel)
-        except Exception, e:
-            self.__tracer.error("exception during channel" +
+            except Exception, e:
+                self.__tracer.error("exception during channel" +
 								" notification: %s", traceback.format_exc())
 
+        for callback in batch_listeners:
+            try:
+                callback(channels)
+            except Exception, e:
+                self.__tracer.error("exception during sample batch" +
+                                    " notification: %s", traceback.format_exc())
+
     def __notify_new_channel(self, channel):
         self.__rlock.acquire()
         try:
@@ -75,31 +75,41 @@ class ChannelSource(object):
             return type_obj
 
     def _type_remap_and_check(self, target_type, sample):
+        sample.value = self._type_remap_value(target_type, sample.value)
+
+        return sample
+
+    def _type_remap_value(self, target_type, value):
+        """
+        Returns value converted to target_type, as
+        :meth:`_type_remap_and_check` does for a sample.
+
+        """
         mapped_type = target_type
         
         # special treatment of zero, so 0 = 0.0, etc.
-        if sample.value == 0:
-            sample.value = mapped_type(0)
+        if value == 0:
+            value = mapped_type(0)
         
-        if type(sample.value) in TYPE_MAP:
-            mapped_type = TYPE_MAP[type(sample.value)]
+        if type(value) in TYPE_MAP:
+            mapped_type = TYPE_MAP[type(value)]
             try:
                 # type re-mapping
-                sample.value = mapped_type(sample.value)
+                value = mapped_type(value)
             except:
                 raise ValueError, \
                     "(ChannelSource): unable to remap value '%s' from %s to %s" % \
-                        (str(sample.value),
-                            self._instance_type_name(sample.value),
+                        (str(value),
+                            self._instance_type_name(value),
                             str(mapped_type))
 
-        if not isinstance(sample.value, mapped_type):
+        if not isinstance(value, mapped_type):
             raise ValueError, \
                 "(ChannelSource): sample type/property type mis-match ('%s' != '%s')" % \
-                    (self._instance_type_name(sample.value),
+                    (self._instance_type_name(value),
                      str(mapped_type))
 
-        return sample
+        return value
 
     def producer_get(self):
         """
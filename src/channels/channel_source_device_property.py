@@ -52,10 +52,15 @@ be one or more of the following:
    These are the same as the :ref:`permissions <permissions>` and
    :ref:`options <options>` in :mod:`~channels.channel`
 
+Samples are immutable once stored: the property keeps its own
+:class:`~samples.sample.Sample`, built when the producer sets it, and
+hands out that same object to every reader.  A new sample replaces it
+by a single reference assignment, so reads take no lock and make no
+copy.  Readers must not modify the samples they get.
+
 """
 
 # imports
-from copy import copy
 from exceptions import Exception
 import threading
 import digitime
@@ -152,7 +157,7 @@ class ChannelSourceDeviceProperty(ChannelSource):
 
     def producer_get(self):
         """
-        Return a copy of the current sample object.
+        Return the current sample object, which must not be modified.
         
         This function should only be called by a DeviceProperties object.
         """
@@ -162,28 +167,48 @@ class ChannelSourceDeviceProperty(ChannelSource):
         """
         Update the current sample object.
         
+        The property stores a new sample built from the given one, which
+        the producer may then reuse.
+        
         This function should only be called by a DeviceProperties object.
         """
-        sample = ChannelSource._type_remap_and_check(self, self.type, sample)
-        self.__rlock.acquire()
-        try:
-            if sample.timestamp == 0 and self.options & DPROP_OPT_AUTOTIMESTAMP:
-                sample.timestamp = digitime.time()
-            self.__sample = copy(sample)
-        finally:
-            self.__rlock.release()
+        self.__sample = self.producer_convert(sample)
+
+    def producer_convert(self, sample, timestamp=None):
+        """
+        Return the sample :meth:`producer_set` would store for the given
+        one, without storing it.  Raises ValueError if the value cannot
+        be converted to the type of the property.
+
+        *timestamp*, if given, is stamped on a sample without one instead
+        of the current time.
+        """
+        value = ChannelSource._type_remap_value(self, self.type, sample.value)
+        if sample.timestamp == 0 and self.options & DPROP_OPT_AUTOTIMESTAMP:
+            if timestamp is None:
+                timestamp = digitime.time()
+        else:
+            timestamp = sample.timestamp
+        return Sample(timestamp, value, sample.unit, sample.status)
+
+    def producer_store(self, sample):
+        """
+        Update the current sample object with a sample returned by
+        :meth:`producer_convert`, which is stored as is.
+        """
+        self.__sample = sample
 
 
     def consumer_get(self):
         """
         Called from a channel wishing to read this property's data.
 
-        Returns a copy of the current sample value.
+        Returns the current sample object, which must not be modified.
         """
         if not self.perms_mask & DPROP_PERM_GET:
             raise DevicePropertyPermError, "get permission denied"
 
-        return copy(self.__sample)
+        return self.__sample
 
     def consumer_set(self, sample):
         """
@@ -75,6 +75,17 @@ class LoggerBase(SettingsBase):
         """Handle a new event notification"""
         raise NotImplementedError, "virtual function"
 
+    def log_event_group(self, logging_event):
+        """\
+            Handle a notification of new samples in several channels,
+            a :class:`~channels.logging.logging_events.LoggingEventNewSamples`.
+
+            By default, the event of each channel is handled in turn
+            by log_event().
+        """
+        for event in logging_event.events():
+            self.log_event(event)
+
     def channel_database_get(self):
         """Return a reference to the channel database."""
         raise NotImplementedError, "virtual function"
@@ -90,6 +90,33 @@ class LoggingEventNewSample(LoggingEventBase):
     __slots__ = []
 
 
+class LoggingEventNewSamples(LoggingEventBase):
+    """
+    New data published at once to several channels, listed by
+    `channels`
+
+    """
+    __slots__ = ["channels"]
+
+    def __init__(self, channels, record=None):
+        self.channels = channels
+        LoggingEventBase.__init__(self, channel=None, record=record)
+
+    def __repr__(self):
+        return "<%s record=%s channels=%s>" % (
+            self.__class__.__name__,
+            repr(self.record),
+            ", ".join([channel.name() for channel in self.channels]))
+
+    def events(self):
+        """
+        Returns the :class:`LoggingEventNewSample` of each channel.
+
+        """
+        return [LoggingEventNewSample(channel, self.record)
+                for channel in self.channels]
+
+
 class LoggingEventChannelNew(LoggingEventBase):
     """
     A new channel created in the
@@ -29,7 +29,8 @@
 import sys, traceback
 
 from common.abstract_service_manager import AbstractServiceManager
-from channels.logging.logging_events import LoggingEventBase
+from channels.logging.logging_events import LoggingEventBase, \
+    LoggingEventNewSamples
 
 # classes
 class LoggingManager(AbstractServiceManager):
@@ -81,10 +82,14 @@ class LoggingManager(AbstractServiceManager):
         if not isinstance(logging_event, LoggingEventBase):
             raise TypeError, "LoggingManager: logging_event TypeError"
 
+        group = isinstance(logging_event, LoggingEventNewSamples)
         for name in AbstractServiceManager.instance_list(self):
             logger_instance = AbstractServiceManager.instance_get(self, name)
             try:
-                logger_instance.log_event(logging_event)
+                if group:
+                    logger_instance.log_event_group(logging_event)
+                else:
+                    logger_instance.log_event(logging_event)
             except Exception, e:
                 self.__tracer.error("exception during log_event dispatch: %s",
                                     str(e))
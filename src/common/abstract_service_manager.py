@@ -39,11 +39,18 @@ child services.
 
 # imports
 import traceback
+import threading
 
-from common.classloader import classloader
+import digitime
+from common.classloader import classloader, lazy_classloader, LazyClass
 from settings.settings_base import SettingsBase, Setting
 
 # constants
+STARTUP_SEQUENTIAL = 'sequential'
+STARTUP_PARALLEL = 'parallel'
+
+DEFAULT_STARTUP_WORKERS = 4
+DEFAULT_STARTUP_TIMEOUT = 30.0
 
 # exception classes
 class ASMClassLoadError(Exception):
@@ -94,6 +101,10 @@ class AbstractServiceManager(SettingsBase):
         self._name_instance_map = {}
         # Maps service name (str) -> service instance (object)
         self._loaded_services = {}
+        # Maps instance name (str) -> seconds spent in its start() method
+        self._start_latencies = {}
+        # Changed each time an instance is added or removed
+        self._instance_generation = 0
 
         from core.tracing import get_tracer
         self.__tracer = get_tracer('AbstractServiceManager')
@@ -147,7 +158,10 @@ class AbstractServiceManager(SettingsBase):
             # no instances found
             return
 
+        mode, workers, timeout = self._startup_options()
+
         service_names = set()
+        new_services = []
         for service in services:
             if "driver" in service and "name" in service:
                 if service['name'] in service_names:
@@ -158,10 +172,225 @@ class AbstractServiceManager(SettingsBase):
                     self.service_load(service["driver"])
                 if not self.instance_exists(service["name"]):
                     self.instance_new(service["driver"], service["name"])
-                    self.instance_start(service["name"])
+                    if mode == STARTUP_PARALLEL:
+                        new_services.append(service)
+                    else:
+                        self.__timed_instance_start(service["name"])
 
                 service_names.add(service['name'])
 
+        if new_services:
+            # Their start() methods may apply settings, which they could
+            # not do from other threads while settings are being applied:
+            SettingsBase.call_when_applied(self, self.__parallel_start,
+                                           new_services, workers, timeout)
+
+    def _startup_options(self):
+        """
+        Return the (mode, workers, timeout) start up options.
+
+        They are given by the optional `startup` dictionary at the root
+        of the settings, e.g.::
+
+            startup:
+                mode: parallel
+                workers: 4
+                timeout: 30
+                lazy_import: true
+                profile_imports: true
+
+        `mode` is either 'sequential' (the default: each instance is
+        started as soon as it is created, in the order of the instance
+        list) or 'parallel'.  `profile_imports` is read by the core, see
+        :mod:`common.import_profiler`.
+        """
+        mode = STARTUP_SEQUENTIAL
+        workers = DEFAULT_STARTUP_WORKERS
+        timeout = DEFAULT_STARTUP_TIMEOUT
+
+        options = self.__startup_settings()
+        try:
+            mode = str(options.get('mode', mode))
+            workers = int(options.get('workers', workers))
+            timeout = float(options.get('timeout', timeout))
+        except (TypeError, ValueError), e:
+            self.__tracer.error("invalid startup options %s: %s", options, e)
+            return (STARTUP_SEQUENTIAL, DEFAULT_STARTUP_WORKERS,
+                    DEFAULT_STARTUP_TIMEOUT)
+        if mode not in (STARTUP_SEQUENTIAL, STARTUP_PARALLEL) or workers < 1:
+            self.__tracer.error("invalid startup options %s", options)
+            return (STARTUP_SEQUENTIAL, DEFAULT_STARTUP_WORKERS,
+                    DEFAULT_STARTUP_TIMEOUT)
+
+        return (mode, workers, timeout)
+
+    def _lazy_import(self):
+        """
+        Return True if driver modules should only be imported when the
+        first instance of one of their classes is created, as requested
+        by the optional `lazy_import` entry of the root `startup`
+        settings.
+        """
+        lazy_import = self.__startup_settings().get('lazy_import', False)
+        if isinstance(lazy_import, str):
+            return lazy_import.lower() in ('true', 'yes', 'on', '1')
+        return bool(lazy_import)
+
+    def __startup_settings(self):
+        try:
+            options = self._core.get_setting('startup')
+        except Exception:
+            return { }
+        if not isinstance(options, dict):
+            return { }
+        return options
+
+    def _instance_dependencies(self, instance_settings):
+        """
+        Return the names of the instances the instance described by the
+        instance list entry `instance_settings` must be started after.
+
+        The default implementation returns the optional `depends_on`
+        entry (a name or a list of names).  Managers may extend it with
+        dependencies implied by their instances' settings.
+        """
+        depends_on = instance_settings.get('depends_on', [])
+        if isinstance(depends_on, str):
+            return [ depends_on ]
+        return list(depends_on)
+
+    def __timed_instance_start(self, instancename):
+        started = digitime.time()
+        try:
+            self.instance_start(instancename)
+        finally:
+            self.__record_start_latency(instancename,
+                                        digitime.time() - started)
+
+    def __record_start_latency(self, instancename, latency):
+        self._start_latencies[instancename] = latency
+        self.__tracer.info("started '%s' in %.3fs", instancename, latency)
+
+    def __parallel_start(self, services, workers, timeout):
+        """
+        Start the instances described by the instance list entries
+        `services`, running at most `workers` start() methods at once
+        and each instance after the instances it depends on.
+
+        An instance whose start() does not return within its timeout
+        (its `start_timeout` entry, or `timeout`) is reported and no
+        longer waited for: its dependents are started and its worker
+        slot is given to the next instance.
+        """
+        names = [ service['name'] for service in services ]
+        pending = {}        # name -> number of dependencies not started
+        dependents = {}     # name -> names depending on it
+        timeouts = {}
+        for service in services:
+            name = service['name']
+            pending[name] = 0
+            dependents.setdefault(name, [])
+            try:
+                timeouts[name] = float(service.get('start_timeout', timeout))
+            except (TypeError, ValueError):
+                timeouts[name] = timeout
+        for service in services:
+            name = service['name']
+            for dependency in self._instance_dependencies(service):
+                if dependency == name:
+                    continue
+                if dependency in pending:
+                    pending[name] += 1
+                    dependents[dependency].append(name)
+                elif not self.instance_exists(dependency):
+                    self.__tracer.warning("'%s' depends on unknown " +
+                                          "instance '%s'", name, dependency)
+
+        ready = [ name for name in names if not pending[name] ]
+        running = {}        # name -> deadline
+        finished = []       # (name, latency, exception) of ended starts
+        released = set()
+        cond = threading.Condition()
+
+        def _start(name):
+            started = digitime.time()
+            error = None
+            try:
+                try:
+                    self.instance_start(name)
+                except Exception, e:
+                    error = e
+                    self.__tracer.error("exception starting '%s': %s",
+                                        name, traceback.format_exc())
+            finally:
+                cond.acquire()
+                try:
+                    finished.append((name, digitime.time() - started, error))
+                    cond.notify()
+                finally:
+                    cond.release()
+
+        def _release(name):
+            released.add(name)
+            for dependent in dependents[name]:
+                pending[dependent] -= 1
+                if not pending[dependent]:
+                    ready.append(dependent)
+
+        cond.acquire()
+        try:
+            while len(released) < len(names):
+                while ready and len(running) < workers:
+                    name = ready.pop(0)
+                    running[name] = digitime.time() + timeouts[name]
+                    thread = threading.Thread(target=_start, args=(name,),
+                                              name="start %s" % name)
+                    thread.setDaemon(True)
+                    thread.start()
+
+                if not running:
+                    # what is left depends on itself through a cycle:
+                    cycle = [ name for name in names if name not in released ]
+                    self.__tracer.error("dependency cycle between %s, " +
+                                        "starting them in order", cycle)
+                    for name in cycle:
+                        pending[name] = 0
+                    ready.extend(cycle)
+                    continue
+
+                if not finished:
+                    wait = min(running.values()) - digitime.time()
+                    if wait > 0:
+                        cond.wait(wait)
+
+                while finished:
+                    name, latency, error = finished.pop(0)
+                    if name in running:
+                        del running[name]
+                        _release(name)
+                    self.__record_start_latency(name, latency)
+
+                now = digitime.time()
+                for name, deadline in running.items():
+                    if deadline <= now:
+                        del running[name]
+                        self.__tracer.error("'%s' did not start within " +
+                                            "%.1fs, no longer waiting for it",
+                                            name, timeouts[name])
+                        _release(name)
+        finally:
+            cond.release()
+
+    def start_latencies(self):
+        """
+        Returns a dictionary of instance name -> seconds spent in the
+        instance's start() method.
+
+        Instances still starting (e.g. after a start up timeout) are
+        not listed.
+        """
+        return self._start_latencies.copy()
+
     def get_service(self, classname):
         """."""
         if classname not in self._loaded_services:
@@ -187,7 +416,9 @@ class AbstractServiceManager(SettingsBase):
         return True.
 
         If the service cannot be loaded for any reason, an exception
-        will be raised.
+        will be raised.  With lazy imports enabled (see
+        :meth:`_lazy_import`) the module of the service is only imported,
+        and errors reported, when its first instance is created.
         """
         if name in self._loaded_services:
             return True
@@ -203,7 +434,10 @@ class AbstractServiceManager(SettingsBase):
         self.__tracer.info("loading '%s' from '%s'", class_name,
                            module_path)
         try:
-            service_class = classloader(module_path, class_name)
+            if self._lazy_import():
+                service_class = lazy_classloader(module_path, class_name)
+            else:
+                service_class = classloader(module_path, class_name)
         except Exception, e:
             self.__tracer.error("Exception during dynamic class " +
                                 "load: %s", traceback.format_exc())
@@ -238,12 +472,30 @@ class AbstractServiceManager(SettingsBase):
 
         # Create a new instance and store it by instance name:
         service_class = self._loaded_services[classname]
+        if isinstance(service_class, LazyClass):
+            # first instance of a lazily loaded service, import it now:
+            try:
+                service_class = service_class.get()
+            except Exception, e:
+                self.__tracer.error("Exception during dynamic class " +
+                                    "load: %s", traceback.format_exc())
+                raise ASMClassLoadError("unable to load '%s': %s:%s" % (
+                    classname, e.__class__, str(e)))
+            self._loaded_services[classname] = service_class
         service_instance = service_class(name=instancename,
                                         core_services=self._core)
         self._name_instance_map[instancename] = service_instance
+        self._instance_generation += 1
 
         return True
 
+    def instance_generation(self):
+        """
+        Returns a number which changes each time an instance is added
+        or removed, allowing users to cache views of the instances.
+        """
+        return self._instance_generation
+
     def instance_list(self):
         """Returns a list of all service instances."""
         return [name for name in self._name_instance_map]
@@ -321,3 +573,4 @@ class AbstractServiceManager(SettingsBase):
             raise ASMInstanceCannotStop("cannot stop %s" % (instancename))
         # Remove it.
         del self._name_instance_map[instancename]
+        self._instance_generation += 1
@@ -70,3 +70,42 @@ def classloader(module_name, object_name):
 
     return obj
 
+def lazy_classloader(module_name, object_name):
+    """
+    Like :func:`classloader`, but if `module_name` has not been imported
+    yet, return a :class:`LazyClass` standing for the object instead of
+    importing the module now.
+
+    """
+    if module_name in sys.modules:
+        return classloader(module_name, object_name)
+    return LazyClass(module_name, object_name)
+
+class LazyClass:
+    """
+    Stands for `object_name` of `module_name`, which is imported when
+    the object is first called (e.g. to create an instance) or one of
+    its attributes is accessed.
+
+    """
+    def __init__(self, module_name, object_name):
+        self.module_name = module_name
+        self.object_name = object_name
+        self.__obj = None
+
+    def get(self):
+        """Return the object, importing its module if necessary."""
+        if self.__obj is None:
+            self.__obj = classloader(self.module_name, self.object_name)
+        return self.__obj
+
+    def __call__(self, *args, **kwargs):
+        return self.get()(*args, **kwargs)
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name.startswith('_LazyClass__'):
+            raise AttributeError, name
+        return getattr(self.get(), name)
+
+    def __repr__(self):
+        return "<LazyClass %s:%s>" % (self.module_name, self.object_name)
@@ -0,0 +1,207 @@
+############################################################################
+#                                                                          #
+# Copyright (c)2008-2012, Digi International (Digi). All Rights Reserved.  #
+#                                                                          #
+# Permission to use, copy, modify, and distribute this software and its    #
+# documentation, without fee and without a signed licensing agreement, is  #
+# hereby granted, provided that the software is used on Digi products only #
+# and that the software contain this copyright notice,  and the following  #
+# two paragraphs appear in all copies, modifications, and distributions as #
+# well. Contact Product Management, Digi International, Inc., 11001 Bren   #
+# Road East, Minnetonka, MN, +1 952-912-3444, for commercial licensing     #
+# opportunities for non-Digi products.                                     #
+#                                                                          #
+# DIGI SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED   #
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A          #
+# PARTICULAR PURPOSE. THE SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, #
+# PROVIDED HEREUNDER IS PROVIDED "AS IS" AND WITHOUT WARRANTY OF ANY KIND. #
+# DIGI HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,         #
+# ENHANCEMENTS, OR MODIFICATIONS.                                          #
+#                                                                          #
+# IN NO EVENT SHALL DIGI BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT,      #
+# SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS,   #
+# ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF   #
+# DIGI HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH DAMAGES.                #
+#                                                                          #
+############################################################################
+
+'''
+This module records the cost of module imports.
+
+While installed, an :class:`ImportProfiler` replaces the built-in
+`__import__` function and, for each module imported for the first
+time, records the time spent importing it (including and excluding the
+modules it imports itself) and the change of the process resident
+memory, where the platform lets us measure it.
+
+The core installs a profiler for the rest of the DIA start up once the
+settings are loaded, if their `startup` dictionary has a true
+`profile_imports` entry.  Its report is available from the console and
+RCI `import_report` commands.
+'''
+
+# imports
+import sys
+import threading
+import __builtin__
+
+import digitime
+
+# not on every platform, imported here as memory_usage() is called from
+# within the import hook:
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# constants
+
+# exception classes
+
+# interface functions
+def memory_usage():
+    '''
+    Return the resident memory of the process in bytes, or None if it
+    cannot be determined on this platform.
+    '''
+    if resource is None:
+        return None
+    try:
+        statm = open('/proc/self/statm')
+        try:
+            resident_pages = int(statm.read().split()[1])
+        finally:
+            statm.close()
+        return resident_pages * resource.getpagesize()
+    except Exception:
+        return None
+
+def format_import_report(records, limit=None):
+    '''
+    Return the text report of `records`, as returned by
+    :meth:`ImportProfiler.records`, limited to the `limit` costliest
+    imports if given.
+    '''
+    lines = [ '%-40s %9s %9s %10s' % ('module', 'total(s)', 'self(s)',
+                                      'memory(kB)') ]
+    if limit is not None:
+        records = records[:limit]
+    for module, total, own, memory in records:
+        if memory is None:
+            memory = 'n/a'
+        else:
+            memory = '%d' % (memory / 1024)
+        lines.append('%-40s %9.3f %9.3f %10s' % (module, total, own, memory))
+    return '\r\n'.join(lines) + '\r\n'
+
+# classes
+class ImportProfiler:
+    '''
+    Records the cost of the imports made while it is installed.
+    '''
+    def __init__(self):
+        self.__records = { }    # module name -> [total, self, memory]
+        self.__stacks = { }     # thread -> [time spent in nested imports]
+        self.__lock = threading.Lock()
+        self.__original_import = None
+
+    def install(self):
+        '''Start recording imports.'''
+        if self.__original_import is None:
+            self.__original_import = __builtin__.__import__
+            __builtin__.__import__ = self.__import
+
+    def uninstall(self):
+        '''Stop recording imports.'''
+        if self.__original_import is not None:
+            if __builtin__.__import__ == self.__import:
+                __builtin__.__import__ = self.__original_import
+            self.__original_import = None
+
+    def records(self):
+        '''
+        Return a list of (module, total seconds, self seconds, memory
+        delta in bytes or None) tuples, costliest import first.
+        '''
+        self.__lock.acquire()
+        try:
+            records = [ (total, module, own, memory) for
+                        module, (total, own, memory) in
+                        self.__records.items() ]
+        finally:
+            self.__lock.release()
+        records.sort()
+        records.reverse()
+        return [ (module, total, own, memory) for
+                 total, module, own, memory in records ]
+
+    def __import(self, name, *args, **kwargs):
+        original_import = self.__original_import
+        if original_import is None:
+            # uninstalled while a caller held a reference to us
+            original_import = __builtin__.__import__
+        relative = _relative_name(name, args)
+        if relative in sys.modules:
+            if sys.modules[relative] is not None:
+                return original_import(name, *args, **kwargs)
+            # known not to be a module of the importer package
+            relative = None
+        if relative is None and name in sys.modules:
+            return original_import(name, *args, **kwargs)
+
+        # new modules are detected by the growth of sys.modules
+        known = len(sys.modules)
+        absolute_known = name in sys.modules
+        thread = threading.currentThread()
+        stack = self.__stacks.setdefault(thread, [ ])
+        stack.append(0.0)
+        memory_before = memory_usage()
+        started = digitime.time()
+        try:
+            return original_import(name, *args, **kwargs)
+        finally:
+            total = digitime.time() - started
+            nested = stack.pop()
+            if stack:
+                stack[-1] += total
+            else:
+                del self.__stacks[thread]
+            memory = None
+            if memory_before is not None:
+                memory_after = memory_usage()
+                if memory_after is not None:
+                    memory = memory_after - memory_before
+            if len(sys.modules) != known:
+                # name the record after the module actually imported,
+                # which is fully qualified for implicit relative imports:
+                if relative is not None and \
+                        sys.modules.get(relative) is not None:
+                    self.__record(relative, total, total - nested, memory)
+                elif not absolute_known:
+                    self.__record(name, total, total - nested, memory)
+
+    def __record(self, module, total, own, memory):
+        self.__lock.acquire()
+        try:
+            self.__records[module] = [total, own, memory]
+        finally:
+            self.__lock.release()
+
+# internal functions & classes
+def _relative_name(name, args):
+    '''
+    Return the name `name` has for an implicit relative import with the
+    other `__import__` arguments `args`, or None if the importer is not
+    in a package or asks for an absolute import.
+    '''
+    if not args or not args[0] or (len(args) > 3 and args[3] == 0):
+        return None
+    importer = args[0].get('__name__')
+    if not importer:
+        return None
+    if '__path__' not in args[0]:
+        # a module, its package is the one it is in
+        importer = importer[:max(importer.rfind('.'), 0)]
+        if not importer:
+            return None
+    return importer + '.' + name
@@ -0,0 +1,112 @@
+# $Id$
+"""
+    Unit tests for the parallel start up of the instances of an
+    AbstractServiceManager.
+
+    usage: python test_abstract_service_manager.py
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+# src, where common and settings are, and lib, where digitime is
+_src_dir = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, _src_dir)
+sys.path.insert(0, os.path.join(os.path.dirname(_src_dir), 'lib'))
+
+from settings.settings_base import SettingsBase
+from services.service_base import ServiceBase
+from services.service_manager import ServiceManager
+
+START_TIMEOUT = 5.0
+
+# The test services are loaded by the manager from this module:
+DRIVER_MODULE = 'common.test_abstract_service_manager'
+
+class QuietService(ServiceBase):
+    """ A service whose start() only records it has been called """
+
+    def __init__(self, name, core_services):
+        ServiceBase.__init__(self, name, [])
+        self.started_by = None
+
+    def start(self):
+        self.started_by = threading.currentThread()
+        return True
+
+    def stop(self):
+        return True
+
+class SettingsService(QuietService):
+    """ A service applying its settings when started, as many do """
+
+    def start(self):
+        self.apply_settings()
+        return QuietService.start(self)
+
+class FakeCore:
+    def __init__(self, startup):
+        self.startup = startup
+        self.services = {}
+
+    def get_setting(self, name):
+        if name != 'startup':
+            raise KeyError(name)
+        return self.startup
+
+    def set_service(self, name, service):
+        self.services[name] = service
+
+    def get_service(self, name):
+        return self.services[name]
+
+def instance(name, class_name):
+    return { 'name': name, 'driver': '%s:%s' % (DRIVER_MODULE, class_name),
+             'settings': { } }
+
+class ParallelStartTest(unittest.TestCase):
+
+    def setUp(self):
+        SettingsBase._settings_global_pending_registry['services'] = \
+            { 'instance_list': [ ] }
+        self.manager = ServiceManager(FakeCore(
+            { 'mode': 'parallel', 'timeout': START_TIMEOUT }))
+
+    def tearDown(self):
+        SettingsBase._settings_global_pending_registry['services'] = \
+            { 'instance_list': [ ] }
+
+    def load(self, *instances):
+        began = time.time()
+        self.manager.load_tree({ 'services':
+                                 { 'instance_list': list(instances) } })
+        return time.time() - began
+
+    def started_by(self, name):
+        return self.manager.instance_get(name).started_by
+
+    def test_start_applying_settings(self):
+        elapsed = self.load(instance('applying', 'SettingsService'),
+                            instance('quiet', 'QuietService'))
+        self.failUnless(elapsed < START_TIMEOUT / 2,
+                        'start up took %.1fs' % elapsed)
+        for name in ('applying', 'quiet'):
+            self.failIf(self.started_by(name) is None)
+            self.failIf(self.started_by(name) is threading.currentThread())
+        latencies = self.manager.start_latencies()
+        self.failUnless('applying' in latencies and 'quiet' in latencies)
+
+    def test_start_after_settings_lock(self):
+        elapsed = self.load(instance('applying', 'SettingsService'))
+        self.failUnless(elapsed < START_TIMEOUT / 2,
+                        'start up took %.1fs' % elapsed)
+        self.failIf(self.started_by('applying') is None)
+        # Nothing is left to call under the settings lock:
+        self.assertEqual(SettingsBase._settings_global_apply_depth, 0)
+        self.assertEqual(SettingsBase._settings_global_applied_calls, [])
+
+if __name__ == '__main__':
+    unittest.main()
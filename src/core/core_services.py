@@ -39,7 +39,7 @@ import gc
 import threading
 
 from common.abstract_service_manager import AbstractServiceManager
-from core.tracing import TracingManager
+from core.tracing import TracingManager, get_tracer
 from devices.device_driver_manager import DeviceDriverManager
 from channels.channel_manager import ChannelManager
 from presentations.presentation_manager import PresentationManager
@@ -47,6 +47,8 @@ from services.service_manager import ServiceManager
 from core.scheduler import Scheduler
 
 from settings.settings_base import SettingsBase, Setting, REG_PENDING
+from settings.settings_cache import SettingsCache
+from common.import_profiler import ImportProfiler
 
 
 # exception classes
@@ -140,6 +142,8 @@ class CoreServices(SettingsBase):
                 name='services', type=list, required=False, default_value=[]),
             Setting(
                 name='tracing', type=list, required=False, default_value=[]),
+            Setting(
+                name='startup', type=dict, required=False, default_value={}),
         ]
         SettingsBase.__init__(self, binding=(), setting_defs=settings_list)
 
@@ -148,6 +152,7 @@ class CoreServices(SettingsBase):
         self.__serializer_ext_map = {}
         self.__sleep_req = None  # STUB: seconds to wait before power-off
         self.__shutdown_event = threading.Event()
+        self.__startup_timings = []
 
         # TODO: core may become a thread so we can monitor services and
         #       attempt to restart them when they fail.
@@ -223,6 +228,11 @@ class CoreServices(SettingsBase):
           Allows run-time access to presentations running in the
           system.
 
+        * :py:class:`import_profiler
+          <common.import_profiler.ImportProfiler>` - The cost of the
+          module imports made during start up, if the `profile_imports`
+          entry of the `startup` settings asked for it
+
         * :py:class:`scheduler <core.scheduler.Scheduler>` - Allows
           scheduling of events to be run in the future
 
@@ -318,10 +328,16 @@ will be used as the source of settings data.  `settings_filename` is always
 used in order to infer the settings serializer used to interpret the
 settings as given by a extension-to-type mapping table defined as a constant
 in the core service.
+
+The parsed settings are kept in a :class:`~settings.settings_cache.SettingsCache`
+beside `settings_filename` and are reused instead of being parsed again as
+long as the settings text is unchanged.
         """
 
+        started = digitime.time()
         serializer_name = self.conditional_settings_serializer_load(
                             settings_filename=settings_filename)
+        serializer = self._settings_global_serializers[serializer_name]
 
         if not settings_flo:
             if not os.path.exists(settings_filename):
@@ -333,7 +349,24 @@ in the core service.
                 raise CoreSettingsFileNotFound
 
         try:
-            SettingsBase.load(self, settings_flo, serializer_name)
+            settings_text = settings_flo.read()
+            started = self.__record_timing("settings read", started)
+
+            cache = SettingsCache(settings_filename)
+            cache_key = cache.key(settings_text, serializer_name, serializer)
+            raw_settings = cache.load(cache_key)
+            if raw_settings is None:
+                raw_settings = serializer.loads(settings_text)
+                started = self.__record_timing("settings parse", started)
+                if cache.store(cache_key, raw_settings):
+                    print "Core: settings cache '%s' updated." % \
+                          (cache.filename())
+            else:
+                started = self.__record_timing("settings cache load",
+                                               started)
+
+            SettingsBase.load_tree(self, raw_settings)
+            self.__record_timing("settings apply", started)
         except Exception, e:
             try:
                 print "Core: Unable to load settings: %s" % (str(e))
@@ -357,6 +390,26 @@ in the core service.
         SettingsBase.save(self, flo, serializer_name, REG_PENDING)
         flo.close()
 
+        # The settings text changed, the parsed copy is stale:
+        SettingsCache(self.__settings_filename).invalidate()
+
+    def __record_timing(self, phase, started):
+        """
+        Record the duration of `phase`, begun at time `started`.
+
+        Returns the current time, the start of the next phase.
+        """
+        now = digitime.time()
+        self.__startup_timings.append((phase, now - started))
+        return now
+
+    def __trace_startup_timings(self, tracer):
+        total = 0.0
+        for phase, duration in self.__startup_timings:
+            tracer.debug("start up timing: %-28s %8.3fs", phase, duration)
+            total += duration
+        tracer.info("started up in %.3fs.", total)
+
     def epoch(self, settings_flo):
         """After initialization, execution begins here.
 
@@ -364,8 +417,39 @@ in the core service.
         not be necessary for this to be called by any other code.
         """
 
+        self.__startup_timings = []
+        started = digitime.time()
+
+        # Records the cost of the modules imported while starting up, if
+        # the settings ask for it:
+        import_profiler = ImportProfiler()
+        self.set_service("import_profiler", import_profiler)
+        try:
+            self.__epoch(settings_flo, started)
+        finally:
+            import_profiler.uninstall()
+
+    def __profile_imports(self):
+        """
+        Return True if the optional `profile_imports` entry of the root
+        `startup` settings asks to record the cost of the imports made
+        during start up.
+        """
+        try:
+            options = self.get_setting('startup')
+        except Exception:
+            return False
+        if not isinstance(options, dict):
+            return False
+        profile_imports = options.get('profile_imports', False)
+        if isinstance(profile_imports, str):
+            return profile_imports.lower() in ('true', 'yes', 'on', '1')
+        return bool(profile_imports)
+
+    def __epoch(self, settings_flo, started):
         # Delay further initialization until the system is fully available:
         self.__wait_until_system_ready()
+        started = self.__record_timing("wait for system", started)
 
         print "Core: initial garbage collection of %d objects." % (gc.collect())
 
@@ -376,21 +460,32 @@ in the core service.
         self.load_settings(self.__settings_filename, settings_flo)
         settings_flo.close()
 
+        if self.__profile_imports():
+            self.get_service("import_profiler").install()
+
         try:
+            started = digitime.time()
             print "Core: post-settings garbage " + \
                    "collection of %d objects." % (gc.collect())
+            started = self.__record_timing("garbage collection", started)
             print "Core: Starting Tracing Manager...", # <- the ',' belongs there
             TracingManager(core_services=self)
+            started = self.__record_timing("tracing manager", started)
             print "Core: Starting Scheduler..."
             Scheduler(core_services=self)
+            started = self.__record_timing("scheduler", started)
             print "Core: Starting Channel Manager..."
             ChannelManager(core_services=self)
+            started = self.__record_timing("channel manager", started)
             print "Core: Starting Device Driver Manager..."
             DeviceDriverManager(core_services=self)
+            started = self.__record_timing("device driver manager", started)
             print "Core: Starting Presentation Manager..."
             PresentationManager(core_services=self)
+            started = self.__record_timing("presentation manager", started)
             print "Core: Starting Services Manager..."
             ServiceManager(core_services=self)
+            self.__record_timing("services manager", started)
 
             ##### DOCUMENTATION REMINDER: #########################
             # If you add objects as core services to the system,
@@ -405,6 +500,13 @@ in the core service.
             print "Core: Exception during core initialization:"
             traceback.print_exc()
             raise Exception("Fatal exception during initialization.")
+        tracer = get_tracer("Core")
+        self.__trace_startup_timings(tracer)
+        imports = self.get_service("import_profiler").records()
+        if imports:
+            tracer.info("%d modules imported in %.3fs during start up.",
+                        len(imports),
+                        reduce(lambda t, r: t + r[2], imports, 0.0))
         print "Core services started."
 
     def _shutdown(self):
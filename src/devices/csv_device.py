@@ -31,6 +31,17 @@ from settings.settings_base import SettingsBase, Setting
 from channels.channel_source_device_property import *
 from core.tracing import get_tracer
 from common.utils import wild_subscribe, wild_unsubscribe, wild_match
+from common.types.boolean import Boolean
+
+# constants
+
+# column type name: (property type, parser, default value)
+COLUMN_TYPES = {
+    'str': (str, None, ''),
+    'int': (int, int, 0),
+    'float': (float, float, 0.0),
+    'bool': (Boolean, Boolean, Boolean(False)),
+}
 
 # classes
 
@@ -47,12 +58,19 @@ class CSVDevice(DeviceBase):
             - "timestamp"
             - "status"
             - "error_msg"
+            - "alarm"
+        column_types:
+            - "float"
+            - "int"
+            - "str"
+            - "bool"
 
 
     CSVDevice is a virtual device that parsed a delimited stream of data.
     The delimited data is then returned to the source's parent driver as
-    new properties named by the 'column_names' setting.  All properties
-    created are of type 'str'.
+    new properties named by the 'column_names' setting, and typed by the
+    'column_types' setting.  All the properties of a line are set at once,
+    with the same timestamp.
 
     The source is determined by the 'channel_pattern' setting.  This setting
     supports ? and * tokens to identify multiple channels.
@@ -66,6 +84,15 @@ class CSVDevice(DeviceBase):
                    as 'column_1', 'column_2', depending on position in the
                    split sample.
 
+    column_types - Type of each column: 'str', 'int', 'float' or 'bool'.
+                   Columns without a type are of type 'str'.  A value
+                   which cannot be parsed is skipped.  Types apply to the
+                   properties when they are created: a column whose
+                   property already exists keeps the type of the property.
+
+    The column layout of each source channel is computed on its first
+    sample, and again when the settings change.
+
     """
 
     anon = {}  # For unsubscribing
@@ -83,6 +110,10 @@ class CSVDevice(DeviceBase):
 
         self.tdict = {}
         self.prop_names = []
+        # source channel name -> _ColumnLayout
+        self.__layouts = {}
+        # settings snapshot the layouts were computed from
+        self.__layouts_settings = None
         self.dm = self.core.get_service("device_driver_manager")
         self.channel_manager = self.core.get_service('channel_manager')
         self.channel_database = self.channel_manager.channel_database_get()
@@ -92,6 +123,8 @@ class CSVDevice(DeviceBase):
                     default_value=','),
             Setting(name='column_names', type=list, default_value=[],
                     required=False),
+            Setting(name='column_types', type=list, default_value=[],
+                    required=False, verify_function=_valid_column_types),
         ]
 
         ##No properties defined at first
@@ -148,13 +181,56 @@ class CSVDevice(DeviceBase):
 
         """
         channel_name = channel.name()
-        column_names = SettingsBase.get_setting(self, "column_names")
-        delimiter = SettingsBase.get_setting(self, "delimiter")
+        settings = self._settings_snapshot
+        if settings is not self.__layouts_settings:
+            # New settings, the layouts are computed again
+            self.__layouts = {}
+            self.__layouts_settings = settings
+
+        layout = self.__layouts.get(channel_name)
+        if layout is None:
+            layout = _ColumnLayout(self.get_driver_instance(channel_name),
+                                   settings.delimiter,
+                                   settings.column_names,
+                                   settings.column_types)
+            self.__layouts[channel_name] = layout
 
         channel_val = str(channel.get().value)
 
-        fields = channel_val.split(delimiter)
+        fields = channel_val.split(layout.delimiter)
+        known = layout.known
+        if len(fields) > known:
+            for column_name in layout.add_columns(len(fields)):
+                self.tracer.warning("%s: column %s keeps the type of its "
+                                    "existing property" %
+                                    (channel_name, column_name))
+
+        samples = []
+        for value, (column_name, parser) in zip(fields, layout.columns):
+            if parser is not None:
+                if not value:
+                    # No value
+                    continue
+                try:
+                    value = parser(value)
+                except ValueError:
+                    self.tracer.warning("%s: cannot parse column %s value: '%s'" %
+                                        (channel_name, column_name, value))
+                    continue
+            samples.append((column_name, Sample(0, value)))
+
+        #If the properties of some columns have not been seen yet,
+        #create them with their first value, otherwise just set them
+        if len(fields) > known:
+            samples = layout.add_properties(samples)
 
+        layout.driver_instance.property_set_many(samples)
+
+    def get_driver_instance(self, channel_name):
+        """
+        Returns the driver owning the given channel.
+
+        """
         #If we don't know about this channel
         if not self.tdict.has_key(channel_name):
             ## Create property
@@ -172,24 +248,7 @@ class CSVDevice(DeviceBase):
         else:
             driver_instance = self.tdict[channel_name]
 
-        #Get the column names
-        columns = CSVDevice.get_column_names(column_names, fields)
-
-        #For each value, name, if the property doesn't exist,
-        #Create it, otherwise just set it using the driver instance
-        for value, column_name in zip(fields, columns):
-            if not driver_instance.property_exists(column_name):
-                driver_instance.add_property(
-                      ChannelSourceDeviceProperty(
-                          name=column_name,
-                          type=str,
-                          initial=Sample(timestamp=0, value=value),
-                          perms_mask=DPROP_PERM_GET,
-                          options=DPROP_OPT_AUTOTIMESTAMP)
-                      )
-            else:
-                driver_instance.property_set(column_name, Sample(0, value))
-        #endfor
+        return driver_instance
 
     @staticmethod
     def get_column_names(column_names, fields):
@@ -209,3 +268,98 @@ class CSVDevice(DeviceBase):
             else:
                 columns.append(column_names[pos])
         return columns
+
+
+# internal functions & classes
+
+def _valid_column_types(column_types):
+    for column_type in column_types:
+        if column_type not in COLUMN_TYPES:
+            return False
+    return True
+
+def _column_type(value):
+    """
+    Returns the column type of the property of the given value.
+
+    """
+    for column_type in COLUMN_TYPES.values():
+        if type(value) is column_type[0]:
+            return column_type
+    return (type(value), type(value), value)
+
+
+class _ColumnLayout:
+    """
+    Columns of the lines of a source channel.
+
+    columns holds the (property name, parser or None) of each column seen
+    so far, types the (property type, default value) of these columns.
+    The properties of the first known columns are known to exist.
+
+    """
+
+    def __init__(self, driver_instance, delimiter, column_names, column_types):
+        self.driver_instance = driver_instance
+        self.delimiter = delimiter
+        self.column_names = column_names
+        self.column_types = column_types
+        self.columns = []
+        self.types = []
+        self.known = 0
+
+    def add_columns(self, count):
+        """
+        Adds the columns of a line of count fields.  Returns the names of
+        the columns which do not get their configured type, because their
+        property already exists with another one.
+
+        """
+        driver_instance = self.driver_instance
+        names = CSVDevice.get_column_names(self.column_names, range(count))
+        retyped = []
+        for pos in range(self.known, count):
+            if pos < len(self.column_types):
+                prop_type, parser, default = COLUMN_TYPES[self.column_types[pos]]
+            else:
+                prop_type, parser, default = COLUMN_TYPES['str']
+            if driver_instance.property_exists(names[pos]):
+                value = driver_instance.property_get(names[pos]).value
+                if type(value) is not prop_type:
+                    prop_type, parser, default = _column_type(value)
+                    retyped.append(names[pos])
+            self.columns.append((names[pos], parser))
+            self.types.append((prop_type, default))
+        return retyped
+
+    def add_properties(self, samples):
+        """
+        Creates the missing properties of the added columns, initialized
+        with their sample of samples.  Returns the samples of the other
+        properties.
+
+        """
+        values = dict(samples)
+        driver_instance = self.driver_instance
+        created = set()
+        for pos in range(self.known, len(self.columns)):
+            column_name = self.columns[pos][0]
+            if not driver_instance.property_exists(column_name):
+                prop_type, default = self.types[pos]
+                initial = values.get(column_name)
+                if initial is None:
+                    initial = Sample(timestamp=0, value=default)
+                driver_instance.add_property(
+                      ChannelSourceDeviceProperty(
+                          name=column_name,
+                          type=prop_type,
+                          initial=initial,
+                          perms_mask=DPROP_PERM_GET,
+                          options=DPROP_OPT_AUTOTIMESTAMP)
+                      )
+                created.add(column_name)
+        self.known = len(self.columns)
+        if not created:
+            return samples
+        return [(column_name, sample) for column_name, sample in samples
+                if column_name not in created]
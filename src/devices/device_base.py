@@ -30,6 +30,7 @@ from core.tracing import get_tracer
 from settings.settings_base import SettingsBase, Setting
 from channels.channel_source_device_property import ChannelSourceDeviceProperty
 
+import digitime
 import traceback
 # constants
 
@@ -86,6 +87,8 @@ class DeviceBase(SettingsBase):
 
         # cache the channel DB reference
         self._channel_db = None
+        # cache the channel publisher reference
+        self._channel_publisher = None
 
         # Initialize settings:
         ## Settings Table Definition:
@@ -177,6 +180,7 @@ class DeviceBase(SettingsBase):
         self._name = None
         self._core = None
         self._channel_db = None
+        self._channel_publisher = None
 
         ## leave self._tracer, deleting here is problematic during shutdown
 
@@ -211,6 +215,18 @@ class DeviceBase(SettingsBase):
 
         return self._channel_db
 
+    def get_channel_publisher(self):
+        """
+        Cache and return the channel publisher.
+        """
+
+        if self._channel_publisher is None:
+            # cache the channel publisher reference
+            self._channel_publisher = \
+                self._core.get_service("channel_manager").channel_publisher_get()
+
+        return self._channel_publisher
+
 
     def __get_property_channel(self, name):
         """
@@ -262,6 +278,57 @@ class DeviceBase(SettingsBase):
         channel = self.__get_property_channel(name)
         return channel.producer_set(sample)
 
+    def property_set_many(self, samples):
+        """
+        Sets several properties at once.  *samples* is a dictionary, or
+        a sequence of (name, :class:`~samples.sample.Sample`) pairs to
+        set the properties in order.
+
+        Samples without a timestamp are stored with the same one, the
+        given samples are not modified.  No property is set if one of
+        them does not exist.  The properties whose value cannot be
+        converted to their type are not set: the others are, and their
+        subscribers notified, before the ValueError is raised.
+
+        The properties are all updated before subscribers are notified:
+        the :class:`~channels.channel_publisher.ChannelPublisher`
+        dispatches a single logging event for them, and notifies its
+        sample batch subscribers once.
+
+        """
+
+        if hasattr(samples, 'items'):
+            samples = samples.items()
+
+        properties = self.__properties
+        updates = []
+        for name, sample in samples:
+            if name not in properties:
+                raise DeviceBasePropertyNotFound, \
+                    "channel device property '%s' not found." % (name)
+            updates.append((properties[name], sample))
+
+        if not updates:
+            return
+
+        now = digitime.time()
+        stored = []
+        error = None
+        for channel, sample in updates:
+            try:
+                sample = channel.producer_convert(sample, now)
+            except ValueError, e:
+                if error is None:
+                    error = e
+                continue
+            stored.append(channel)
+            channel.producer_store(sample)
+
+        if stored:
+            self.get_channel_publisher().new_samples_cb(stored)
+        if error is not None:
+            raise error
+
     def property_exists(self, name):
         """
         Determines if a property specified by *name* exists.
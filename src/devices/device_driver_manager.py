@@ -75,5 +75,19 @@ class DeviceDriverManager(AbstractServiceManager):
         driver_instance = self.instance_get(instancename)
         return driver_instance.get_properties()
 
+    def _instance_dependencies(self, instance_settings):
+        """
+        Devices depend on the instances named by their `depends_on`
+        entry and on their XBee device manager, if any.
+
+        """
+        dependencies = AbstractServiceManager._instance_dependencies(
+            self, instance_settings)
+        settings = instance_settings.get('settings')
+        if isinstance(settings, dict) and \
+               isinstance(settings.get('xbee_device_manager'), str):
+            dependencies.append(settings['xbee_device_manager'])
+        return dependencies
+
 
 # internal functions & classes
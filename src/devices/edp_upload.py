@@ -665,8 +665,9 @@ class EDPUpload(DeviceBase, threading.Thread):
             TRACER.debug('self.__enabled.isSet is NOT set')
             return
 
+        settings = self._settings_snapshot
         sam = channel.get()
-        if not SettingsBase.get_setting(self, "upload_time_zero"):
+        if not settings.upload_time_zero:
             if sam.timestamp == 0:
                 TRACER.debug('discard sample with null time')
                 return
@@ -692,7 +693,7 @@ class EDPUpload(DeviceBase, threading.Thread):
         finally:
             self.__entry_lock.release()
 
-        sample_threshold = SettingsBase.get_setting(self, "sample_threshold")
+        sample_threshold = settings.sample_threshold
         if sample_threshold > 0 and self.__sample_count >= sample_threshold:
             # It really doesn't matter that we set sample count to zero
             # here... self.__upload sets self.__sample_count back to zero.
@@ -215,7 +215,7 @@ class FilterChannelFactoryBase(DeviceBase):
                 obj.property_refresh()
 
     def _match_filter(self, channel_name):
-        filter_string = SettingsBase.get_setting(self, "target_channel_filter")
+        filter_string = self._settings_snapshot.target_channel_filter
         device_filter = '*'
         property_filter = '*'
         if filter_string.find('.') != -1:
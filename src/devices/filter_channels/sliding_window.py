@@ -0,0 +1,385 @@
+############################################################################
+#                                                                          #
+# Copyright (c)2012 Digi International (Digi). All Rights Reserved.        #
+#                                                                          #
+# Permission to use, copy, modify, and distribute this software and its    #
+# documentation, without fee and without a signed licensing agreement, is  #
+# hereby granted, provided that the software is used on Digi products only #
+# and that the software contain this copyright notice,  and the following  #
+# two paragraphs appear in all copies, modifications, and distributions as #
+# well. Contact Product Management, Digi International, Inc., 11001 Bren   #
+# Road East, Minnetonka, MN, +1 952-912-3444, for commercial licensing     #
+# opportunities for non-Digi products.                                     #
+#                                                                          #
+# DIGI SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED   #
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A          #
+# PARTICULAR PURPOSE. THE SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, #
+# PROVIDED HEREUNDER IS PROVIDED "AS IS" AND WITHOUT WARRANTY OF ANY KIND. #
+# DIGI HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,         #
+# ENHANCEMENTS, OR MODIFICATIONS.                                          #
+#                                                                          #
+# IN NO EVENT SHALL DIGI BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT,      #
+# SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS,   #
+# ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF   #
+# DIGI HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH DAMAGES.                #
+#                                                                          #
+############################################################################
+
+"""
+Filter Channels : Sliding Window Aggregate Filter.
+
+Publishes an aggregate of the last samples of the followed channels:
+the mean, sum, variance, standard deviation, minimum or maximum over a
+sliding window bounded by a number of samples (`window_samples`), an
+age in seconds (`window_seconds`), or both.
+
+Each new sample updates the aggregate in constant amortized time:
+values are kept in a ring buffer of arrays, the mean and variance are
+maintained incrementally as samples enter and leave the window, and the
+minimum and maximum through monotonic deques.
+
+**Sample Config**::
+
+    devices:
+      - name: temperature_avg
+        driver: devices.filter_channels.sliding_window:SlidingWindowFactory
+        settings:
+            target_channel_filter: "sensor*.temperature"
+            function: mean
+            window_seconds: 300
+            publish_every: 10
+"""
+
+# imports
+import math
+from array import array
+from collections import deque
+
+import digitime
+from devices.filter_channels.filter_channel_base import FilterChannelFactoryBase, FilterChannelBase
+from channels.channel_source_device_property import ChannelSourceDeviceProperty,\
+        DPROP_PERM_GET, DPROP_PERM_SET, DPROP_PERM_REFRESH, \
+        DPROP_OPT_AUTOTIMESTAMP, Sample
+from settings.settings_base import SettingsBase, Setting
+from core.tracing import get_tracer
+
+# constants
+FUNCTION_MEAN = 'mean'
+FUNCTION_SUM = 'sum'
+FUNCTION_VARIANCE = 'variance'
+FUNCTION_STDDEV = 'stddev'
+FUNCTION_MIN = 'min'
+FUNCTION_MAX = 'max'
+
+FUNCTIONS = (FUNCTION_MEAN, FUNCTION_SUM, FUNCTION_VARIANCE, FUNCTION_STDDEV,
+             FUNCTION_MIN, FUNCTION_MAX)
+
+# functions whose result is always a float:
+FLOAT_FUNCTIONS = (FUNCTION_MEAN, FUNCTION_VARIANCE, FUNCTION_STDDEV)
+
+# initial ring buffer capacity of windows bounded by time only:
+INITIAL_CAPACITY = 16
+
+
+class SlidingWindowFactory(FilterChannelFactoryBase):
+    def __init__(self, name, core_services):
+        """\
+            Standard __init__ function.
+        """
+
+        ## Settings Table Definition:
+        settings_list = [
+            Setting(
+                name='function', type=str, required=False,
+                default_value=FUNCTION_MEAN,
+                verify_function=lambda x: x in FUNCTIONS),
+            Setting(
+                name='window_samples', type=int, required=False,
+                default_value=0, verify_function=lambda x: x >= 0),
+            Setting(
+                name='window_seconds', type=float, required=False,
+                default_value=0.0, verify_function=lambda x: x >= 0),
+            Setting(
+                name='publish_every', type=int, required=False,
+                default_value=1, verify_function=lambda x: x > 0),
+        ]
+
+        ## Channel Properties Definition:
+        property_list = []
+
+        ## Initialize the DeviceBase interface:
+        FilterChannelFactoryBase.__init__(self, name, core_services,
+                                settings_list, property_list)
+
+    def apply_settings(self):
+        """\
+            Called when new configuration settings are available.
+
+            Ensures the window is bounded.
+        """
+        SettingsBase.merge_settings(self)
+        accepted, rejected, not_found = SettingsBase.verify_settings(self)
+
+        if not len(rejected) and not len(not_found) and \
+               not accepted['window_samples'] and \
+               not accepted['window_seconds']:
+            rejected['window_samples'] = \
+                "window_samples or window_seconds must be given"
+
+        if len(rejected) or len(not_found):
+            self._tracer.error("Settings rejected/not found: %s %s", rejected, not_found)
+            return (accepted, rejected, not_found)
+
+        SettingsBase.commit_settings(self, accepted)
+
+        return (accepted, rejected, not_found)
+
+    def physically_create_filter_channel(self, original_channel, filter_channel_name):
+        """\
+            Mean, variance and standard deviation channels are floats,
+            the other functions keep the type of the followed channel.
+        """
+        if SettingsBase.get_setting(self, "function") not in FLOAT_FUNCTIONS:
+            return FilterChannelFactoryBase.physically_create_filter_channel(
+                self, original_channel, filter_channel_name)
+
+        is_refreshable = bool(original_channel.perm_mask() & DPROP_PERM_REFRESH)
+        if is_refreshable:
+            perms_mask = DPROP_PERM_GET | DPROP_PERM_SET | DPROP_PERM_REFRESH
+        else:
+            perms_mask = DPROP_PERM_GET | DPROP_PERM_SET
+        filter_channel = ChannelSourceDeviceProperty(name = filter_channel_name,
+            type = float,
+            initial = Sample(timestamp = 0, value = 0.0),
+            perms_mask = perms_mask,
+            refresh_cb = self._refresh,
+            options = DPROP_OPT_AUTOTIMESTAMP)
+        return filter_channel
+
+    def create_filter_channel(self, channel, filter_channel):
+        """\
+            Required override of the base channel's call of the same name.
+
+            This allows us create/build a custom class to control the filter.
+
+            Keyword arguments:
+
+            channel -- the channel we are shadowing
+
+            filter_channel -- the shadow/filter channel
+        """
+        function = SettingsBase.get_setting(self, "function")
+        window_samples = SettingsBase.get_setting(self, "window_samples")
+        window_seconds = SettingsBase.get_setting(self, "window_seconds")
+        publish_every = SettingsBase.get_setting(self, "publish_every")
+        return SlidingWindowAggregator(self._name, self._core, channel,
+                                       filter_channel, function,
+                                       window_samples, window_seconds,
+                                       publish_every)
+
+
+class SlidingWindowAggregator(FilterChannelBase):
+    def __init__(self, name, core, source_channel, filter_channel,
+                 function, window_samples, window_seconds, publish_every):
+        self._tracer = get_tracer(name)
+        self._function = function
+        self._publish_every = publish_every
+        self._received = 0
+        self._window = SlidingWindow(window_samples, window_seconds,
+                                     track_extremes=function in
+                                         (FUNCTION_MIN, FUNCTION_MAX))
+        FilterChannelBase.__init__(self, name, core, source_channel, filter_channel)
+
+    def _receive(self, channel):
+        """\
+            Called whenever there is a new sample on the channel
+                that we are following/shadowing.
+
+            Keyword arguments:
+
+            channel -- the shadowed channel with the new sample
+        """
+        sample = channel.get()
+        timestamp = sample.timestamp
+        if not timestamp:
+            timestamp = digitime.time()
+
+        try:
+            self._window.add(sample.value, timestamp)
+        except (TypeError, ValueError):
+            self._tracer.error("cannot aggregate value %s of %s",
+                               repr(sample.value), channel.name())
+            return
+
+        self._received += 1
+        if self._received < self._publish_every:
+            return
+        self._received = 0
+
+        function = self._function
+        window = self._window
+        if function == FUNCTION_MEAN:
+            value = window.mean()
+        elif function == FUNCTION_SUM:
+            value = window.sum()
+        elif function == FUNCTION_VARIANCE:
+            value = window.variance()
+        elif function == FUNCTION_STDDEV:
+            value = window.stddev()
+        elif function == FUNCTION_MIN:
+            value = window.min()
+        else:
+            value = window.max()
+
+        # keep the type of the filter channel (e.g. int sums and extremes):
+        try:
+            value = self.filter_channel.type(value)
+        except (TypeError, ValueError):
+            pass
+
+        self.property_set(Sample(value = value, unit = sample.unit))
+
+
+class SlidingWindow(object):
+    """\
+        Sliding window statistics over (value, timestamp) pairs.
+
+        The window keeps at most `max_samples` values (if not 0) no
+        older than `max_age` seconds relative to the newest one (if not
+        0).  Values and timestamps are stored in a ring buffer of
+        arrays; the mean and variance are updated incrementally
+        (Welford's method, run backwards for values leaving the
+        window) and, if `track_extremes` is set, the minimum and
+        maximum are kept in monotonic deques.  All operations are O(1)
+        amortized.
+    """
+
+    def __init__(self, max_samples=0, max_age=0.0, track_extremes=True):
+        self.max_samples = max_samples
+        self.max_age = max_age
+
+        if max_samples:
+            capacity = max_samples
+        else:
+            capacity = INITIAL_CAPACITY
+        self._values = array('d', [0.0]) * capacity
+        self._times = array('d', [0.0]) * capacity
+        # sequence numbers of the oldest value and of the next value;
+        # value number seq is stored at index seq % capacity:
+        self._first = 0
+        self._next = 0
+
+        self._sum = 0.0
+        self._mean = 0.0
+        self._m2 = 0.0
+
+        self._track_extremes = track_extremes
+        # (seq, value) pairs, increasing values for the minimum and
+        # decreasing values for the maximum:
+        self._min_deque = deque()
+        self._max_deque = deque()
+
+    def __len__(self):
+        return self._next - self._first
+
+    def add(self, value, timestamp=0.0):
+        """\
+            Append a value to the window and evict the values that fall
+            out of it.
+        """
+        value = float(value)
+
+        if self.max_samples and len(self) >= self.max_samples:
+            self._evict()
+        elif len(self) == len(self._values):
+            self._grow()
+
+        seq = self._next
+        index = seq % len(self._values)
+        self._values[index] = value
+        self._times[index] = timestamp
+        self._next += 1
+
+        self._sum += value
+        n = len(self)
+        delta = value - self._mean
+        self._mean += delta / n
+        self._m2 += delta * (value - self._mean)
+
+        if self._track_extremes:
+            min_deque = self._min_deque
+            while min_deque and min_deque[-1][1] >= value:
+                min_deque.pop()
+            min_deque.append((seq, value))
+            max_deque = self._max_deque
+            while max_deque and max_deque[-1][1] <= value:
+                max_deque.pop()
+            max_deque.append((seq, value))
+
+        if self.max_age:
+            oldest_allowed = timestamp - self.max_age
+            times = self._times
+            while len(self) > 1 and \
+                      times[self._first % len(times)] < oldest_allowed:
+                self._evict()
+
+    def _evict(self):
+        seq = self._first
+        value = self._values[seq % len(self._values)]
+        self._first += 1
+
+        n = len(self)
+        if n:
+            self._sum -= value
+            delta = value - self._mean
+            self._mean -= delta / n
+            self._m2 -= delta * (value - self._mean)
+            if self._m2 < 0.0:
+                # rounding errors
+                self._m2 = 0.0
+        else:
+            self._sum = 0.0
+            self._mean = 0.0
+            self._m2 = 0.0
+
+        if self._track_extremes:
+            if self._min_deque and self._min_deque[0][0] == seq:
+                self._min_deque.popleft()
+            if self._max_deque and self._max_deque[0][0] == seq:
+                self._max_deque.popleft()
+
+    def _grow(self):
+        old_values = self._values
+        old_times = self._times
+        old_capacity = len(old_values)
+        capacity = old_capacity * 2
+        self._values = array('d', [0.0]) * capacity
+        self._times = array('d', [0.0]) * capacity
+        for seq in xrange(self._first, self._next):
+            self._values[seq % capacity] = old_values[seq % old_capacity]
+            self._times[seq % capacity] = old_times[seq % old_capacity]
+
+    def sum(self):
+        return self._sum
+
+    def mean(self):
+        return self._mean
+
+    def variance(self):
+        """Population variance of the values in the window."""
+        if not len(self):
+            return 0.0
+        return self._m2 / len(self)
+
+    def stddev(self):
+        return math.sqrt(self.variance())
+
+    def min(self):
+        if not self._min_deque:
+            raise ValueError("empty window")
+        return self._min_deque[0][1]
+
+    def max(self):
+        if not self._max_deque:
+            raise ValueError("empty window")
+        return self._max_deque[0][1]
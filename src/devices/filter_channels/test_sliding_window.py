@@ -0,0 +1,105 @@
+# $Id$
+"""
+    Tests of the sliding window statistics against a brute force
+    recomputation over random streams.
+
+    usage: python test_sliding_window.py
+"""
+
+import math
+import os
+import random
+import sys
+import unittest
+
+# src, where devices are, and lib, where digitime is
+_src_dir = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, _src_dir)
+sys.path.insert(0, os.path.join(os.path.dirname(_src_dir), 'lib'))
+
+from devices.filter_channels.sliding_window import SlidingWindow
+
+PLACES = 6
+
+def window_values(stream, max_samples, max_age):
+    """ The values a window of max_samples, max_age keeps of stream """
+    values = stream[:]
+    if max_samples:
+        values = values[-max_samples:]
+    if max_age:
+        newest = stream[-1][1]
+        # the newest value is always kept
+        values = [(value, timestamp) for value, timestamp in values[:-1]
+                  if timestamp >= newest - max_age] + values[-1:]
+    return [value for value, timestamp in values]
+
+class SlidingWindowTest(unittest.TestCase):
+
+    def setUp(self):
+        self.random = random.Random(1234)
+
+    def check(self, window, values):
+        count = len(values)
+        mean = sum(values) / count
+        variance = sum([(value - mean) ** 2 for value in values]) / count
+        self.assertEqual(len(window), count)
+        self.assertAlmostEqual(window.sum(), sum(values), PLACES)
+        self.assertAlmostEqual(window.mean(), mean, PLACES)
+        self.assertAlmostEqual(window.variance(), variance, PLACES - 2)
+        self.assertAlmostEqual(window.stddev(), math.sqrt(variance), PLACES - 3)
+        self.assertEqual(window.min(), min(values))
+        self.assertEqual(window.max(), max(values))
+
+    def run_stream(self, max_samples, max_age, length=500):
+        window = SlidingWindow(max_samples, max_age)
+        stream = []
+        timestamp = 1000.0
+        for i in xrange(length):
+            # ties and steps in both directions for the extremes
+            value = float(self.random.choice(
+                (self.random.randint(-5, 5), self.random.uniform(-100, 100))))
+            timestamp += self.random.choice((0.0, 0.5, 1.0, 7.0))
+            window.add(value, timestamp)
+            stream.append((value, timestamp))
+            self.check(window, window_values(stream, max_samples, max_age))
+
+    def test_samples(self):
+        for max_samples in (1, 2, 7, 16, 50):
+            self.run_stream(max_samples, 0.0)
+
+    def test_age(self):
+        # windows bounded by time only grow their ring buffer
+        for max_age in (0.5, 3.0, 20.0, 200.0):
+            self.run_stream(0, max_age)
+
+    def test_samples_and_age(self):
+        self.run_stream(10, 5.0)
+        self.run_stream(40, 30.0)
+
+    def test_age_gap(self):
+        window = SlidingWindow(0, 10.0)
+        for i in range(5):
+            window.add(i, 100.0 + i)
+        # all the older values leave the window at once
+        window.add(42, 1000.0)
+        self.check(window, [42.0])
+
+    def test_empty(self):
+        window = SlidingWindow(5, 0.0)
+        self.assertEqual(len(window), 0)
+        self.assertEqual(window.sum(), 0.0)
+        self.assertEqual(window.mean(), 0.0)
+        self.assertEqual(window.variance(), 0.0)
+        self.assertEqual(window.stddev(), 0.0)
+        self.assertRaises(ValueError, window.min)
+        self.assertRaises(ValueError, window.max)
+
+    def test_no_extremes(self):
+        window = SlidingWindow(3, 0.0, track_extremes=False)
+        for value in (1, 2, 3, 4):
+            window.add(value)
+        self.assertAlmostEqual(window.mean(), 3.0, PLACES)
+        self.assertRaises(ValueError, window.min)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -43,8 +43,24 @@
 #   60 seconds on an ConnectPort X3 based platform.  On non-ConnectPort X3 based
 #   platforms, this setting is ignored, and the GPS is instead polled
 #   once a second.
+#
+#   sentences: The list of the NMEA sentence types to decode, others are
+#   skipped.  (default value: ["GGA", "RMC", "GLL"])
+#
+#   min_publish_interval: The minimum time, in seconds, between two
+#   publications of a channel.  Values received in between are dropped.
+#   (default value: 0, every value is published)
+#
+#   unchanged_publish_interval: The time, in seconds, after which a value
+#   equal to the last published one is published again.  (default value: 0,
+#   unchanged values are published as they are received)
+#
+#   position_threshold: The distance, in meters, the position must move
+#   for latitude_degrees and longitude_degrees to be considered changed.
+#   Both are published together.  (default value: 0)
 
 # imports
+import math
 import threading
 import digitime
 import serial
@@ -60,6 +76,9 @@ from pprint import pprint
 
 # constants
 
+# Mean radius of the Earth, in meters
+EARTH_RADIUS = 6371000.0
+
 # exception classes
 
 # interface functions
@@ -94,6 +113,18 @@ class GPS(DeviceBase, threading.Thread):
             Setting(
                 name='sample_rate_sec', type=int, required=False, default_value=60,
                   verify_function=lambda x: x > 0.0),
+            Setting(
+                name='sentences', type=list, required=False,
+                default_value=['GGA', 'RMC', 'GLL']),
+            Setting(
+                name='min_publish_interval', type=float, required=False,
+                default_value=0.0, verify_function=lambda x: x >= 0.0),
+            Setting(
+                name='unchanged_publish_interval', type=float, required=False,
+                default_value=0.0, verify_function=lambda x: x >= 0.0),
+            Setting(
+                name='position_threshold', type=float, required=False,
+                default_value=0.0, verify_function=lambda x: x >= 0.0),
         ]
 
         ## Channel Properties Definition:
@@ -159,6 +190,10 @@ class GPS(DeviceBase, threading.Thread):
         DeviceBase.__init__(self, self.__name, self.__core,
                                 settings_list, property_list)
 
+        # property -> (last published value, publication time)
+        self.__published = {}
+        self.__pending_latitude = None
+
         ## Thread initialization:
         self.__stopevent = threading.Event()
         threading.Thread.__init__(self, name=name)
@@ -214,7 +249,14 @@ class GPS(DeviceBase, threading.Thread):
                                 baudrate=baud_rate,
                                 timeout=SHUTDOWN_WAIT)
 
-        nmea_obj = nmea.NMEA()
+        nmea_obj = nmea.NMEA(SettingsBase.get_setting(self, "sentences"))
+
+        self.__min_publish_interval = SettingsBase.get_setting(
+            self, "min_publish_interval")
+        self.__unchanged_publish_interval = SettingsBase.get_setting(
+            self, "unchanged_publish_interval")
+        self.__position_threshold = SettingsBase.get_setting(
+            self, "position_threshold")
         
         while 1:
             if self.__stopevent.isSet():
@@ -247,11 +289,68 @@ class GPS(DeviceBase, threading.Thread):
 
     def property_setter(self, prop, val):
 
+        # The parser reports latitude_degrees then longitude_degrees
+        if prop == 'latitude_degrees':
+            self.__pending_latitude = val
+            return
+        if prop == 'longitude_degrees':
+            self.__position_setter(self.__pending_latitude, val)
+            return
+
         if self.property_exists(prop):
-            if prop in nmea.units:
-                unit = nmea.units[prop]
-            else:
-                unit = ""
+            last = self.__published.get(prop)
+            if last is not None and not self.__publish_due(
+                    last, last[0] != val):
+                return
+            self.__published[prop] = (val, digitime.time())
+            self.__publish(prop, val)
+
+    def __position_setter(self, latitude, longitude):
+
+        if latitude is None:
+            return
+        last = self.__published.get('position')
+        if last is not None:
+            last_latitude, last_longitude = last[0]
+            moved = self.__distance(last_latitude, last_longitude,
+                                    latitude, longitude)
+            if not self.__publish_due(
+                    last, moved > self.__position_threshold):
+                return
+        self.__published['position'] = ((latitude, longitude),
+                                        digitime.time())
+        for prop, val in (('latitude_degrees', latitude),
+                          ('longitude_degrees', longitude)):
+            if self.property_exists(prop):
+                self.__publish(prop, val)
+
+    def __publish_due(self, last, changed):
+        """Tells if a value last published as last = (value, time) is to
+        be published again."""
+
+        elapsed = digitime.time() - last[1]
+        if elapsed < 0:
+            # The clock was set back
+            return True
+        if elapsed < self.__min_publish_interval:
+            return False
+        return changed or elapsed >= self.__unchanged_publish_interval
+
+    def __distance(self, latitude1, longitude1, latitude2, longitude2):
+        """Distance in meters between two close positions, with the
+        equirectangular approximation."""
+
+        x = math.radians(longitude2 - longitude1) * \
+            math.cos(math.radians((latitude1 + latitude2) / 2))
+        y = math.radians(latitude2 - latitude1)
+        return EARTH_RADIUS * math.sqrt(x * x + y * y)
+
+    def __publish(self, prop, val):
+
+        if prop in nmea.units:
+            unit = nmea.units[prop]
+        else:
+            unit = ""
 
-            self.property_set(prop, Sample(0, val, unit))
+        self.property_set(prop, Sample(0, val, unit))
             
@@ -31,13 +31,25 @@
 # Module to accept an NMEA stream and provide asynchronous access to
 # the contained data content.
 
+import array as _array
+import operator as _operator
 import re as _re
 
 # NMEA sentence, begins with a '$', ends with EOL, may have an
 # optional checksum sequence of a '*' and two hex digits at the end.
-# Group 1 is sentence proper, Group 2 is the optional checksum.
-_sentence_def = r"\$(.*?)(?:\*([0-9a-fA-F]{2}))?[\n\r]+"
-_sentence_re = _re.compile(_sentence_def, _re.MULTILINE)
+# The stream is scanned incrementally: feed() only looks at the data
+# it did not scan before.
+_eol_re = _re.compile(r"[\n\r]")
+
+# Value of the two hex digits of a checksum sequence, in upper case
+_checksum_values = {}
+for _i in xrange(256):
+    _checksum_values["%02X" % _i] = _i
+del _i
+
+# Longest sentence kept while waiting for its EOL (NMEA 0183 allows 82
+# characters), longer ones are garbage
+_max_sentence_length = 256
 
 _sentence_templates = {
     # GPS fix data
@@ -63,6 +75,9 @@ _position_items = set(['latitude_magnitude',
                        'latitude_hemisphere',
                        'longitude_hemisphere'])
 
+# Sentences decoded by default
+default_sentences = _sentence_templates.keys()
+
 # Report unit information for items as appropriate
 units = {"fix_time": "UTC",
          "latitude_magnitude": "degrees",
@@ -89,6 +104,15 @@ _cleanup['hdop'] = lambda val: float(val)
 _cleanup['magnetic_variation'] = lambda val: float(val)
 _cleanup['fix_good'] = lambda val: val == 'A'
 
+# For each sentence, the (field index, item, cleanup function or None,
+# position item) tuple of each item of its template
+_sentence_fields = dict()
+for _sentence, _template in _sentence_templates.items():
+    _sentence_fields[_sentence] = [
+        (_index + 1, _item, _cleanup.get(_item), _item in _position_items)
+        for _index, _item in enumerate(_template)]
+del _sentence, _template, _index, _item
+
 class NMEA:
     """NMEA 0183 data stream parsing object
     
@@ -97,30 +121,42 @@ class NMEA:
 
     Once parsing has begun, raw NMEA data elements can be retrieved
     from the object using direct attribute access.
+
+    sentences is the list of the sentence types (e.g. "GGA", whatever
+    the talker) to decode, all the known ones by default.  Other
+    sentences are skipped without checking them.
     """
 
-    def __init__(self):
+    def __init__(self, sentences=None):
         self._position = (51.4772, 0) # Greenwich royal observatory
         self._working_sentence = ""
+        # Offset in _working_sentence, which then starts with the '$' of
+        # an incomplete sentence, from which to look for its EOL
+        self._scan_pos = 0
+        if sentences is None:
+            sentences = default_sentences
+        self._fields = dict()
+        for sentence in sentences:
+            if sentence in _sentence_fields:
+                self._fields[sentence] = _sentence_fields[sentence]
 
-# _valid is passed a MatchObject from feed() that represents the
-# sentence.  If the sentence contains a group(2), we will calculate
-# and compare the check sequence and return appropriate truth values.
+# _valid is passed the sentence, between the '$' and the EOL.  If the
+# sentence contains a check sequence, we will calculate and compare it
+# and return the sentence proper, or None if it is not valid.
     def _valid(self, sentence):
-        if not sentence.group(2): #have to believe it valid
-            return True
+        if len(sentence) < 3 or sentence[-3] != '*': #have to believe it valid
+            return sentence
+        check = _checksum_values.get(sentence[-2:].upper())
+        if check is None:
+            # Not a check sequence
+            return sentence
+        sentence = sentence[:-3]
         # Calculate check sequence
-        #checkcalc = reduce(lambda x, y: x^ord(y), sentence.group(1), 0)
-        checkcalc = 0
-        s = sentence.group(1)
-        for i in xrange(len(s)):
-            checkcalc = checkcalc ^ ord(s[i])
-            
-        check = int(sentence.group(2), 16)
+        checkcalc = reduce(_operator.xor, _array.array('B', sentence), 0)
         if check != checkcalc:
-            return False
+            return None
         else:
-            return True
+            return sentence
 
     def set_position(self):
         try:
@@ -152,23 +188,25 @@ class NMEA:
         
         sentence = sentence.split(",")
         try:
-            template = _sentence_templates[sentence[0][2:5]]
+            fields = self._fields[sentence[0][2:5]]
         except KeyError:
             return # Don't understand this sentence
         
-        for i in range(len(template)):
+        attributes = self.__dict__
+        for index, item, cleanup, position_item in fields:
 
             # Sometimes a field is not populated.
             # If it is not, we need to just simply skip over it.
-            if sentence[i + 1] == "":
+            value = sentence[index]
+            if value == "":
                 continue
-            if template[i] in _cleanup:
-                sentence[i+1] = _cleanup[template[i]](sentence[i+1])
-            self.__dict__[template[i]] = sentence[i + 1]
+            if cleanup is not None:
+                value = cleanup(value)
+            attributes[item] = value
             if report:
-                report(template[i], sentence[i+1])
+                report(item, value)
 
-            if template[i] in _position_items:
+            if position_item:
                 update_position = True
 
         return update_position
@@ -180,24 +218,57 @@ class NMEA:
         object with this routine.  This function updates the state of
         the object with extracted position information.
         """
-        self._working_sentence += stream
-        sentence = _sentence_re.search(self._working_sentence)
-        end = 0
-        while sentence:
-            if self._valid(sentence):
-                update_position = self._extract(sentence.group(1), report)
+        if self._working_sentence:
+            data = self._working_sentence + stream
+        else:
+            data = stream
+        scan_pos = self._scan_pos
+        pos = 0
+        
+        while True:
+            start = data.find('$', pos)
+            if start < 0:
+                # No sentence: nothing to keep
+                data = ""
+                scan_pos = 0
+                break
+
+            # The sentence ends with the first EOL character
+            eol_pos = max(start + 1, scan_pos)
+            eol = _eol_re.search(data, eol_pos)
+            if eol is None:
+                if len(data) - start > _max_sentence_length:
+                    # Not a sentence, look for the next one
+                    pos = start + 1
+                    scan_pos = 0
+                    continue
+                # Incomplete sentence: keep it, and only scan the data
+                # received next for its EOL
+                if start:
+                    data = data[start:]
+                scan_pos = len(data)
+                break
+
+            # Only the last '$' of a line may start a sentence.
+            end = eol.start()
+            start = data.rfind('$', start, end)
+            pos = end + 1
+            scan_pos = 0
+            
+            if data[start + 3:start + 6] not in self._fields:
+                continue
+            sentence = self._valid(data[start + 1:end])
+            if sentence is not None:
+                update_position = self._extract(sentence, report)
 
                 if update_position:
                     self.set_position()
                     if report:
                         report('latitude_degrees', self.latitude_degrees)
                         report('longitude_degrees', self.longitude_degrees)
-                
-            end = sentence.end()
-            sentence = _sentence_re.search(self._working_sentence,
-                                           sentence.end())
 
-        self._working_sentence = self._working_sentence[end:]
+        self._working_sentence = data
+        self._scan_pos = scan_pos
 
 if __name__ == "__main__":
     def print_args(*args):
@@ -0,0 +1,83 @@
+# $Id$
+"""
+    Unit tests for the NMEA 0183 stream parser.
+
+    usage: python test_nmea.py
+"""
+
+import os
+import sys
+import unittest
+
+# src, where devices are
+_src_dir = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, _src_dir)
+
+from devices.gps.nmea import NMEA
+
+RMC = "$GPRMC,225446,A,4916.45,N,12311.12,W,000.5,054.7,191194,020.3,E*68"
+GGA = "$GPGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,*47"
+GLL = "$GPGLL,4916.45,N,12311.12,W,225444,A,"
+
+class NMEATest(unittest.TestCase):
+
+    def setUp(self):
+        self.gps = NMEA()
+        self.reports = []
+
+    def feed(self, *chunks):
+        for chunk in chunks:
+            self.gps.feed(chunk, self.report)
+
+    def report(self, item, value):
+        self.reports.append((item, value))
+
+    def reported(self, item):
+        return [value for name, value in self.reports if name == item]
+
+    def test_sentence(self):
+        self.feed(RMC + "\r\n")
+        self.assertEqual(self.reported('fix_time'), ['22:54:46'])
+        self.assertEqual(self.reported('fix_date'), ['11/19/94'])
+        latitude, longitude = self.gps.position()
+        self.assertAlmostEqual(latitude, 49 + 16.45 / 60)
+        self.assertAlmostEqual(longitude, -(123 + 11.12 / 60))
+
+    def test_chunks(self):
+        data = RMC + "\r\n" + GGA + "\n"
+        self.feed(data)
+        expected = self.reports
+        for size in (1, 2, 5, 16, 64):
+            self.reports = []
+            self.gps = NMEA()
+            self.feed(*[data[i:i + size] for i in xrange(0, len(data), size)])
+            self.assertEqual(self.reports, expected, 'chunks of %d' % size)
+
+    def test_checksum_case(self):
+        self.feed(GLL + "*1d\r")
+        self.assertEqual(self.reported('fix_time'), ['22:54:44'])
+
+    def test_bad_checksum(self):
+        self.feed(GLL + "*1E\r", GLL + "*aB\r", GLL + "*Ab\r")
+        self.assertEqual(self.reports, [])
+
+    def test_no_checksum(self):
+        self.feed(GLL + "\r")
+        self.assertEqual(self.reported('fix_time'), ['22:54:44'])
+
+    def test_resync(self):
+        # Garbage and a truncated sentence before a good one
+        self.feed("\x00\xff$GPRM", "C,2254" + "$" * 3, GGA + "\r\n")
+        self.assertEqual(self.reported('fix_time'), ['12:35:19'])
+        # A sentence never ended is dropped once too long
+        self.reports = []
+        self.feed("$GPGGA," + "1" * 300, "\r" + RMC + "\n")
+        self.assertEqual(self.reported('fix_time'), ['22:54:46'])
+
+    def test_selected_sentences(self):
+        self.gps = NMEA(sentences=['GGA'])
+        self.feed(RMC + "\r\n" + GGA + "\r\n")
+        self.assertEqual(self.reported('fix_time'), ['12:35:19'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -294,7 +294,9 @@ class InfoDevice(DeviceBase):
             if val[0] == '+':
                 # then append
                 self._tracer.debug("append comment %s", val)
-                sam.value = self.property_get("comment").value + val
+                sam = Sample(sam.timestamp,
+                             self.property_get("comment").value + val,
+                             sam.unit, sam.status)
 
         self._tracer.debug("set comment %s", sam)
         self.property_set("comment", sam)
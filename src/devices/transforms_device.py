@@ -30,7 +30,10 @@ from devices.device_base import DeviceBase
 from settings.settings_base import SettingsBase, Setting
 from channels.channel_source_device_property import *
 import sys
+import threading
 import traceback
+import heapq
+from types import CodeType
 from pprint import pformat
 
 # constants
@@ -44,6 +47,37 @@ class TransformInitError(Exception):
 
 # interface functions
 
+
+def compile_expr(name, expr):
+    """
+    Compile the expression of the transform `name` to a code object.
+
+    Raises TransformInitError if the expression is not valid Python.
+
+    """
+    try:
+        return compile(expr, "<transform %s>" % name, "eval")
+    except (SyntaxError, TypeError, ValueError):
+        exc = sys.exc_info()
+        raise TransformInitError\
+            ("invalid expression for transform %s:\n%s" % (name,
+                "".join(traceback.format_exception_only(exc[0], exc[1]))))
+
+
+def referenced_names(code):
+    """
+    Return the set of names a code object, or any code object nested in
+    it (generator expressions, lambdas), may look up.
+
+    """
+    names = set(code.co_names) | set(code.co_varnames) | \
+            set(code.co_freevars)
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            names |= referenced_names(const)
+    return names
+
+
 # classes
 
 
@@ -61,12 +95,17 @@ class Transform:
     **TransformsDevice**, and the list of channels and the expression supplied
     from a DIA configuration file.
 
+    The expression is compiled once, and only the variables it refers to
+    are built when it is evaluated.  Updates of the input channels are
+    handed over to the parent device, which evaluates its transforms in
+    dependency order.
+
     """
 
     #TODO: A transform should probably bind to the settings tree so
     #that we can let the settings code do some of the validation for
     #us.
-    def __init__(self, parent, core_services, **kw):
+    def __init__(self, parent, core_services, code=None, **kw):
         self.__parent = parent
         self.__core = core_services
         self.__name = kw['name']
@@ -86,11 +125,13 @@ class Transform:
         except:
             raise TransformInitError("Missing required transform setting expr")
 
+        if code is None:
+            code = compile_expr(self.__name, self.expr)
+        self.__code = code
+
         from core.tracing import get_tracer
         self.__tracer = get_tracer("Transform." + self.__name)
 
-        cm = self.__core.get_service("channel_manager")
-
         self.__channel_names = []
         for chan in channels:
             try:
@@ -99,13 +140,18 @@ class Transform:
                 self.__tracer.warning("channel '%s' does not exist yet.", chan)
             self.__channel_names.append(chan)
 
-        # subscribe to all the channels that drive our logic
-        cp = cm.channel_publisher_get()
+        # Resolve once which local variables the expression needs:
+        # `c` and/or one object per device referred to by name.
+        names = referenced_names(code)
+        self.__wants_c = "c" in names
+        self.__inputs = []
         for channel_name in self.__channel_names:
-            #TODO: Might it be a good idea to have a worker thread to
-            #queue transform updates to rather than directly in the
-            #callback from each channels update function?
-            cp.subscribe(channel_name, self.update)
+            object_name, attrname = channel_name.split('.', 1)
+            if object_name not in names:
+                object_name = None
+            self.__inputs.append((channel_name, object_name, attrname))
+
+        self.__subscriptions = []
 
         # try to create the device property with the proper type
         try:
@@ -117,6 +163,44 @@ class Transform:
             self.__tracer.error(
                 "".join(traceback.format_exception_only(exc[0], exc[1])))
 
+    def get_name(self):
+        """Return the name of the property this transform produces."""
+        return self.__name
+
+    def get_channel_names(self):
+        """Return the names of the input channels, in settings order."""
+        return self.__channel_names
+
+    def subscribe(self, ignore=()):
+        """
+        Subscribe to the input channels, except those in `ignore`.
+
+        The parent device evaluates transforms fed by its own
+        transforms itself, so their channels are ignored here.
+
+        """
+        #TODO: Might it be a good idea to have a worker thread to
+        #queue transform updates to rather than directly in the
+        #callback from each channels update function?
+        cp = self.__core.get_service("channel_manager").\
+            channel_publisher_get()
+        for channel_name in self.__channel_names:
+            if channel_name in ignore or \
+                   channel_name in self.__subscriptions:
+                continue
+            cp.subscribe(channel_name, self.update)
+            self.__subscriptions.append(channel_name)
+
+    def unsubscribe(self):
+        cp = self.__core.get_service("channel_manager").\
+            channel_publisher_get()
+        for channel_name in self.__subscriptions:
+            try:
+                cp.unsubscribe(channel_name, self.update)
+            except KeyError:
+                pass
+        self.__subscriptions = []
+
     def __create_property(self):
         """
         This procedure accesses the parent of this object to add the property
@@ -137,8 +221,8 @@ class Transform:
         that defines how to transform the channels.
 
         This is accomplished by creating a set of local variables to pass
-        to Python's built-in eval(), and then returns the result of
-        running eval() on the expression.
+        to the compiled expression, and then returns the result of
+        evaluating it.
 
         """
 
@@ -155,27 +239,27 @@ class Transform:
 
         try:
 
-            for channel_name in self.__channel_names:
-                chan = cdb.channel_get(channel_name)
-                sample = chan.get()
-                object_name, attrname = channel_name.split('.', 1)
+            for channel_name, object_name, attrname in self.__inputs:
+                sample = cdb.channel_get(channel_name).get()
 
-                if not object_name in d:
-                    d[object_name] = Dummy()
+                if object_name is not None:
+                    if not object_name in d:
+                        d[object_name] = Dummy()
 
-                setattr(d[object_name], attrname, sample)
+                    setattr(d[object_name], attrname, sample)
 
                 c.append(sample.value)
 
         except:
             raise ValueError\
-                ("Transform(%s): WARNING: failed to perform get" + \
+                ("Transform(%s): WARNING: failed to perform get" \
                  " on all channels" % self.__name)
 
-        d["c"] = c
+        if self.__wants_c:
+            d["c"] = c
 
         try:
-            value = eval(self.expr, {}, d)
+            value = eval(self.__code, {}, d)
         except:
             exc = sys.exc_info()
             raise ValueError\
@@ -186,14 +270,25 @@ class Transform:
         return value
 
     def update(self, channel):
+        """
+        Channel publisher callback for the input channels.
+
+        The evaluation is left to the parent TransformsDevice, see
+        :meth:`refresh`.
+        """
+        self.__parent.transform_dirty(self)
+
+    def refresh(self):
         """
         This checks the parent TransformsDevice object if it contains
         the property that the Transform object is defined for. If the
-        property does not exist, update() creates it.
+        property does not exist, refresh() creates it.
 
         Then it calls Transform.eval() to create a value for the
         TransformsDevice property. If this new value is different than
         the existing value, the property is updated.
+
+        Returns True if the property was created or updated.
         """
         if not self.__parent.property_exists(self.__name):
             try:
@@ -202,13 +297,17 @@ class Transform:
                 self.__tracer.warning(
                     "cannot update property, it may not exist yet")
                 self.__tracer.error("Error: %s" % str(e))
-                return
+                return False
+            return True
 
         val = self.eval()
         old_val = self.__parent.property_get(self.__name).value
         if val != old_val:
             self.__parent.property_set(self.__name, Sample(value=val,
                                                            unit=self.__unit))
+            return True
+
+        return False
 
 
 class TransformsDevice(DeviceBase):
@@ -219,6 +318,13 @@ class TransformsDevice(DeviceBase):
     base class documentation for the API and the source code for this file
     for an example implementation.
 
+    Transforms whose inputs include the output of other transforms of
+    this device are evaluated in dependency order: after one or more
+    input channels change, each affected transform is evaluated at most
+    once, and only if one of its inputs actually changed.  Updates
+    arriving while an evaluation pass is running, from the same or from
+    another thread, are batched into the next pass.
+
     """
 
     def __init__(self, name, core_services):
@@ -226,6 +332,16 @@ class TransformsDevice(DeviceBase):
         self.__core = core_services
         self.tlist = []
 
+        # expression code objects by transform name, see apply_settings():
+        self.__codes = {}
+
+        # dependency graph and evaluation state:
+        self.__rank = {}
+        self.__dependents = {}
+        self.__dirty_lock = threading.Lock()
+        self.__dirty = set()
+        self.__flushing = False
+
         cm = self.__core.get_service("channel_manager")
         self.cdb = cm.channel_database_get()
 
@@ -252,6 +368,16 @@ class TransformsDevice(DeviceBase):
         SettingsBase.merge_settings(self)
         accepted, rejected, not_found = SettingsBase.verify_settings(self)
 
+        # Compile the expressions once; invalid ones are reported when
+        # the transform is created.
+        codes = {}
+        for t in accepted.get('instance_list') or []:
+            try:
+                codes[t['name']] = compile_expr(t['name'], t['expr'])
+            except (KeyError, TransformInitError):
+                pass
+        self.__codes = codes
+
         SettingsBase.commit_settings(self, accepted)
 
         return (accepted, rejected, not_found)
@@ -261,19 +387,141 @@ class TransformsDevice(DeviceBase):
 
         for t in transforms:
             try:
-                self.tlist.append(Transform(self, self.__core, **t))
+                self.tlist.append(Transform(self, self.__core,
+                                            code=self.__codes.get(t['name']),
+                                            **t))
             except:
                 self.__tracer.error("%s", sys.exc_info()[1])
                 self.__tracer.error("Transform was %s", pformat(t))
 
+        self.__build_graph()
+
+        # Transforms fed by others of this device may not have been able
+        # to create their property yet:
+        missing = [ t for t in self.tlist
+                    if not self.property_exists(t.get_name()) ]
+        if missing:
+            self.__schedule(missing)
+
         return True
 
     def stop(self):
+        for t in self.tlist:
+            t.unsubscribe()
         return True
 
 
     ## Locally defined functions:
 
+    def __build_graph(self):
+        """
+        Rank the transforms in dependency order and subscribe them to
+        the channels which are not produced by this device.
+        """
+        producers = {}
+        for t in self.tlist:
+            producers["%s.%s" % (self.__name, t.get_name())] = t
+
+        dependents = {}
+        in_degree = {}
+        for t in self.tlist:
+            dependents[t] = []
+            in_degree[t] = 0
+        for t in self.tlist:
+            for channel_name in t.get_channel_names():
+                producer = producers.get(channel_name)
+                # a transform fed by its own output is not re-triggered:
+                if producer is not None and producer is not t and \
+                       t not in dependents[producer]:
+                    dependents[producer].append(t)
+                    in_degree[t] += 1
+
+        # Kahn's algorithm, in settings order among peers:
+        order = []
+        ready = [ t for t in self.tlist if not in_degree[t] ]
+        while ready:
+            t = ready.pop(0)
+            order.append(t)
+            for dependent in dependents[t]:
+                in_degree[dependent] -= 1
+                if not in_degree[dependent]:
+                    ready.append(dependent)
+
+        # transforms in a cycle are evaluated last, in settings order:
+        for t in self.tlist:
+            if in_degree[t]:
+                self.__tracer.warning("transform %s is part of a " \
+                                      "dependency cycle", t.get_name())
+                order.append(t)
+
+        rank = {}
+        for i, t in enumerate(order):
+            rank[t] = i
+
+        self.__rank = rank
+        self.__dependents = dependents
+
+        for t in self.tlist:
+            t.subscribe(ignore=producers)
+
+    def transform_dirty(self, transform):
+        """
+        Schedule the evaluation of `transform` and of the transforms
+        depending on it.
+
+        The first caller evaluates all the pending transforms, any call
+        made meanwhile only adds its transform to the next pass.
+        """
+        self.__schedule((transform,))
+
+    def __schedule(self, transforms):
+        self.__dirty_lock.acquire()
+        try:
+            self.__dirty.update(transforms)
+            if self.__flushing:
+                return
+            self.__flushing = True
+        finally:
+            self.__dirty_lock.release()
+
+        try:
+            while True:
+                self.__dirty_lock.acquire()
+                try:
+                    dirty = self.__dirty
+                    if not dirty:
+                        self.__flushing = False
+                        return
+                    self.__dirty = set()
+                finally:
+                    self.__dirty_lock.release()
+
+                self.__evaluate(dirty)
+        except:
+            self.__dirty_lock.acquire()
+            self.__flushing = False
+            self.__dirty_lock.release()
+            raise
+
+    def __evaluate(self, dirty):
+        rank = self.__rank
+        heap = [ (rank.get(t, 0), t) for t in dirty ]
+        heapq.heapify(heap)
+        queued = set(dirty)
+
+        while heap:
+            ignored, t = heapq.heappop(heap)
+            try:
+                changed = t.refresh()
+            except Exception, e:
+                self.__tracer.error("%s", str(e))
+                continue
+
+            if changed:
+                for dependent in self.__dependents.get(t, ()):
+                    if dependent not in queued:
+                        queued.add(dependent)
+                        heapq.heappush(heap, (rank[dependent], dependent))
 
 
 # internal functions & classes
@@ -0,0 +1,21 @@
+'''
+Enumerated engineering unit codes of decoded beacons.
+'''
+import unittest
+import WirelessPacketParser
+
+class Test(unittest.TestCase):
+
+    def runTest(self):
+        parser = WirelessPacketParser.WirelessPacketParser()
+        #counter 0x0123, value 0x0010 in the units of the code
+        for code, units in (('33', 'InH20'), ('3f', 'C'), ('3d', '%RH')):
+            parser.dataField = '00' + code + '01230010'
+            parser.deviceId = '28'
+            parser.parseDataField()
+            assert parser.units == ['Count', units], 'wrong units:' + str(parser.units)
+            assert parser.fields[0] == 0x0123, 'wrong count:' + str(parser.fields)
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -5,6 +5,46 @@ try:
 except:
     import RecordParser
 
+class DecodePlan:
+    """The decode steps of one device type, compiled from its maps"""
+    FIELD_RAW = 0
+    FIELD_LINEAR = 1
+    FIELD_TC16 = 2
+    FIELD_LONG_SERIAL = 3
+    FIELD_LITTLE_ENDIAN = 4
+
+    def __init__(self, deviceId, steps, service, types, units, extension):
+        self.deviceId = deviceId
+        #one (kind, start, stop, arg1, arg2) tuple per field, start:stop
+        #being its slice of the data field.  arg1 and arg2 are the offset
+        #and scale of linear fields, the scale of TC16 fields and the
+        #byte slices in reverse order of little endian fields
+        self.steps = steps
+        self.service = service
+        self.types = types
+        self.units = units
+        #name of the parser method doing the extended conversion, or None
+        self.extension = extension
+
+class DecodeResult:
+    """The outcome of decoding one packet with WirelessPacketParser.decode"""
+
+    def __init__(self, command):
+        self.command = command
+        #what parseExtendedPacket returns for the packet
+        self.values = {}
+        #beacon packets only
+        self.deviceId = None
+        self.serialNo = 0
+        self.dataField = ''
+        self.fields = []
+        self.service = False
+        self.types = []
+        self.units = []
+        #enumerated engineering units found in the data, if any
+        self.eeu1 = None
+        self.eeu2 = None
+
 class WirelessPacketParser:
     """A parser for parsing point six wireless packets"""
     ACK = struct.pack("BBBB", 0xc3, 0x3c, 0x00, 0x06)
@@ -33,6 +73,8 @@ class WirelessPacketParser:
     KEY_XMIT_PERIOD = 'xmit_period'
  
     LONG_SERIAL = 'LONG_SERIAL'
+
+    PACKET_LENGTH = 75
  
     TC16 = 'TC16'
     TC16_MIDPOINT = 0x7fff
@@ -50,6 +92,8 @@ class WirelessPacketParser:
     UNITS_UNITS = "Units"
 
     _p6id = int('c33c', 16)
+    _headerFormat = '>HH'
+    _beaconFormat = '>H18sIHBBcc29sB3B3BHBBB'
     _andMask1 = 0xfffffffc
     _andMask2 = 3
     _andMaskLocalConfigure = 1
@@ -58,8 +102,10 @@ class WirelessPacketParser:
     _conversionMaps = None
     _datamaps = None
     _eeumaps = None
+    _extensionmaps = None
     _servicemaps = None
     _typemaps = None
+    _plans = None
     _unitmaps = None
 
     def __init__(self):
@@ -68,6 +114,7 @@ class WirelessPacketParser:
             self._conversionMaps = {}
             self._datamaps = {}
             self._eeumaps = {}
+            self._extensionmaps = {}
             self._littleEndian = {}
             self._servicemaps = {}
             self._typemaps = {}
@@ -140,6 +187,16 @@ class WirelessPacketParser:
             eeumap = [-40, 0.030525, 'C']
             self._eeumaps['63'] = eeumap
 
+            #build the extended conversion maps
+            self._extensionmaps['28'] = '_extendCounterEeu'
+            self._extensionmaps['29'] = '_extendCounterEeu'
+
+            self._extensionmaps['53'] = '_extendDropSerial'
+            self._extensionmaps['54'] = '_extendDropSerial'
+
+            self._extensionmaps['75'] = '_extendDualEeu'
+            self._extensionmaps['76'] = '_extendDualEeu'
+
             #build the service flag maps
             self._servicemaps['10'] = True
             self._servicemaps['11'] = False
@@ -198,6 +255,17 @@ class WirelessPacketParser:
             self._unitmaps['75'] = unitmap
             self._unitmaps['76'] = unitmap
 
+            #compile the maps into one decode plan per device type
+            #eeu codes are matched against the map keys as written by
+            #str(code), so '00' matches none and code 0 raises KeyError
+            self._eeuCodes = {}
+            for code, eeumap in self._eeumaps.items():
+                if str(int(code)) == code:
+                    self._eeuCodes[int(code)] = eeumap
+            self._plans = {}
+            for devId in self._datamaps.keys():
+                self._plans[devId] = self._compilePlan(devId)
+
         #initialize instance data
         self.identifier = 0
         self.command = 0
@@ -226,35 +294,7 @@ class WirelessPacketParser:
         self.types = []
         self.units = []
 
-        #create record factories
-        #this is just for the header portion
-        self._headerFactory = RecordParser.RecordFactory("""
-            >H.id
-            >H.cmd
-            71s.payload
-""")
-
-        #payload portion for beacon data
-        self._beaconFactory = RecordParser.RecordFactory("""
-            >H.packetCount
-            18s.mac
-            >I.clock
-            >H.logNext
-            1B.rssi
-            1B.reserved
-            c.locator1
-            c.locator2
-            29s.payload
-            1B.org
-            3B.batteryCount
-            3B.maxBatteryCount
-            >H.period
-            1B.alarm
-            1B.status
-            1B.quality
-""")
-
-        #payload portion for config data
+        #create record factory for the payload of config packets
         self._configFactory = RecordParser.RecordFactory("""
             >I.serNo
             >H.xmitPeriod
@@ -309,38 +349,6 @@ class WirelessPacketParser:
             val = val - self.TC16_MIDPOINT + self.TC16_OFFSET
         return val
 
-    def customConvert(self):
-        """convert data to engineering units if appropriate"""
-        try:
-            conversionMap = self._conversionMaps[str(self.deviceId)]
-
-            convertIdx = 0
-            for idx in range(len(self.fields)):
-                offset = conversionMap[convertIdx]
-                scale = conversionMap[convertIdx + 1]
-
-                if(offset!=None):
-                    if(str(offset) == self.TC16):
-                        val = self.fields[idx]
-                        val = self.convertSigned16(val) * scale
-                    elif(str(offset) == self.LONG_SERIAL):
-                        #merge with the existing serial number
-                        val = self.serialNo << 32
-                        val |= self.fields[idx]
-                        self.serialNo = val
-                    else:
-                        val = (self.fields[idx] * scale) + offset
-
-                    self.fields[idx] = val
-
-                convertIdx += 2
-
-        except KeyError:
-            #no conversion for this type
-            None
-
-        return
-
     def buildConfig(self, serNo, xmit_period, alarm_exit, tries, hysterisis, log_period,
                     high_value1, high_time1, low_value1, low_time1,
                     high_value2, high_time2, low_value2, low_time2):
@@ -382,135 +390,258 @@ class WirelessPacketParser:
         print ("config packet:" + self.dump(packet))
         return packet
 
-    def convertLittleEndian(self):
-        """Some conversions need special attention. This takes care of them."""
-        devId = str(self.deviceId)
-        if self._littleEndian.get(devId, False):
-            revFields = []
-            for field in self.fields:
-                revFields.append(self.reverseByteOrder(field))
-            self.fields = revFields
-
-    def extendedConvert(self):
-        """Some conversions need special attention. This takes care of them."""
-        devId = str(self.deviceId)
-        if(devId == '28' or devId == '29'):
-          answers = []
-          #just add the counter value
-          answers.append(self.fields[1])
-          #find the engineering units converter
-          enum = self.fields[0] & 0x3F
-          #look up the scale and offset for that eeu
-          eeu = self._eeumaps[str(enum)]
-          self.eeu1 = eeu
-          print('eeu:' + str(eeu))
-          #convert from twos complement and adjust by scale/offset
-          val = (self.convertSigned16(self.fields[2]) * eeu[1]) + eeu[0]
-          answers.append(val)
-          #reset fields to hold the new answers
-          self.fields = answers
-          self.units = [self.UNITS_COUNT, eeu[2]]
-        elif(devId == '53' or devId == '54'):
-          #strip off the first part of the answer which is the last part of the
-          #serial number
-          answers = [self.fields[1]]
-          self.fields = answers
-        elif(devId == '75' or devId == '76'):
-          answers = []
-          #find out the number of I/O points
-          pointCount = self.fields[0] & 3
-          #find out engineering units for 1st I/O
-          enum = self.fields[1] & 0x3F
-          eeu = self._eeumaps[str(enum)]
-          self.eeu1 = eeu
-          #new value = old value * scale + offset
-          val = (self.convertSigned16(self.fields[3]) * eeu[1]) + eeu[0]
-          answers.append(val)
-          self.units = [eeu[2]]
-          #see if there's two
-          if pointCount == 2:
-              #find out engineering units for 2nd I/O
-              #and off first two bits
-              enum = self.fields[0] >> 2
-              eeu = self._eeumaps[str(enum)]
-              self.eeu2 = eeu
-              val = (self.convertSigned16(self.fields[2]) * eeu[1]) + eeu[0]
-              answers.append(val)
-              self.units.append(eeu[2])
-          else:
-              self.eeu2 = []
-          #reset fields to hold the new answers
-          self.fields = answers
+    def _compileDataMap(self, datamap):
+        """Find the slice of the data field holding each field of a datamap"""
+        slices = []
+        start = None
+        dataIndex = 0
+        fieldIndex = 0
+        mapIndex = 0
+        while mapIndex < len(datamap):
+            mapValue = int(datamap[mapIndex])
+            if fieldIndex == mapValue:
+                #another character of the current field
+                if start is None:
+                    start = dataIndex
+                mapIndex = mapIndex + 1
+                dataIndex = dataIndex + 1
+            elif fieldIndex+1 == mapValue:
+                #the end of the current field
+                if start is None:
+                    raise ValueError('Empty field %d in datamap %s' % (fieldIndex, datamap))
+                slices.append((start, dataIndex))
+                start = None
+                fieldIndex = fieldIndex + 1
+            else:
+                if start is not None:
+                    slices.append((start, dataIndex))
+                    start = None
+                    fieldIndex = fieldIndex + 1
+                mapIndex = mapIndex + 1
+                dataIndex = dataIndex + 1
 
-        return
+        if start is not None:
+            slices.append((start, dataIndex))
+
+        return slices
+
+    def _compilePlan(self, devId):
+        """Compile the data, conversion and endianness maps of a device type"""
+        conversionMap = self._conversionMaps.get(devId, [])
+        littleEndian = self._littleEndian.get(devId, False)
+        steps = []
+        idx = 0
+        for start, stop in self._compileDataMap(self._datamaps[devId]):
+            kind = DecodePlan.FIELD_RAW
+            arg1 = None
+            arg2 = None
+            offset = None
+            if len(conversionMap) > idx * 2 + 1:
+                offset = conversionMap[idx * 2]
+                scale = conversionMap[idx * 2 + 1]
+            if offset is not None:
+                if offset == self.TC16:
+                    kind = DecodePlan.FIELD_TC16
+                    arg2 = scale
+                elif offset == self.LONG_SERIAL:
+                    kind = DecodePlan.FIELD_LONG_SERIAL
+                else:
+                    kind = DecodePlan.FIELD_LINEAR
+                    arg1 = offset
+                    arg2 = scale
+            elif littleEndian:
+                kind = DecodePlan.FIELD_LITTLE_ENDIAN
+                byteSlices = [(pos, min(pos + 2, stop)) for pos in range(start, stop, 2)]
+                byteSlices.reverse()
+                arg1 = tuple(byteSlices)
+            steps.append((kind, start, stop, arg1, arg2))
+            idx += 1
+
+        return DecodePlan(devId, tuple(steps), self._servicemaps[devId],
+                          self._typemaps[devId], self._unitmaps[devId],
+                          self._extensionmaps.get(devId))
+
+    def _applyPlan(self, plan, dataField, serialNo, result):
+        """Decode the data field of a beacon into result using plan"""
+        fields = []
+        for kind, start, stop, arg1, arg2 in plan.steps:
+            if kind == DecodePlan.FIELD_LITTLE_ENDIAN:
+                val = int(''.join([dataField[a:b] for a, b in arg1]), 16)
+            else:
+                val = int(dataField[start:stop], 16)
+                if kind == DecodePlan.FIELD_LINEAR:
+                    val = (val * arg2) + arg1
+                elif kind == DecodePlan.FIELD_TC16:
+                    if val > self.TC16_MIDPOINT:
+                        val = val - self.TC16_MIDPOINT + self.TC16_OFFSET
+                    val = val * arg2
+                elif kind == DecodePlan.FIELD_LONG_SERIAL:
+                    #merge with the existing serial number
+                    serialNo = (serialNo << 32) | val
+                    val = serialNo
+            fields.append(val)
+
+        units = plan.units
+        if plan.extension is not None:
+            fields, units = getattr(self, plan.extension)(fields, units, result)
+
+        result.serialNo = serialNo
+        result.fields = fields
+        result.service = plan.service
+        result.types = list(plan.types)
+        result.units = list(units)
+
+    def _extendCounterEeu(self, fields, units, result):
+        """a counter followed by a value in enumerated engineering units"""
+        #find the engineering units converter
+        eeu = self._eeuCodes[fields[0] & 0x3F]
+        result.eeu1 = eeu
+        #convert from twos complement and adjust by scale/offset
+        val = (self.convertSigned16(fields[2]) * eeu[1]) + eeu[0]
+        return [fields[1], val], [self.UNITS_COUNT, eeu[2]]
+
+    def _extendDropSerial(self, fields, units, result):
+        """strip off the first field, which is the end of the serial number"""
+        return [fields[1]], units
+
+    def _extendDualEeu(self, fields, units, result):
+        """one or two values in enumerated engineering units"""
+        #find out the number of I/O points
+        pointCount = fields[0] & 3
+        #find out engineering units for 1st I/O
+        eeu = self._eeuCodes[fields[1] & 0x3F]
+        result.eeu1 = eeu
+        #new value = old value * scale + offset
+        answers = [(self.convertSigned16(fields[3]) * eeu[1]) + eeu[0]]
+        units = [eeu[2]]
+        #see if there's two
+        if pointCount == 2:
+            #find out engineering units for 2nd I/O
+            #and off first two bits
+            eeu = self._eeuCodes[fields[0] >> 2]
+            result.eeu2 = eeu
+            answers.append((self.convertSigned16(fields[2]) * eeu[1]) + eeu[0])
+            units.append(eeu[2])
+        else:
+            result.eeu2 = []
+        return answers, units
+
+    def decode(self, packet):
+        """\
+        Decode an extended packet and return a DecodeResult.
+
+        Unlike parseExtendedPacket, the parser itself is left untouched,
+        so one parser may decode packets from several threads.
+        """
+        identifier, command = struct.unpack(self._headerFormat, packet[:4])
+        #check the indentifier
+        if(self._p6id!=identifier):
+            raise ValueError('Not a P6 packet:' + str(identifier))
+
+        result = DecodeResult(command)
+        if command == 2 or command == 5:
+            self._decodeBeacon(packet[4:self.PACKET_LENGTH], result)
+        elif command == 0x10:
+            result.values = self.parseConfig(packet[4:self.PACKET_LENGTH])
+
+        result.values[self.KEY_COMMAND] = command
+        return result
+
+    def _decodeBeacon(self, packetPayload, result):
+        """Decode the beacon data from the payload section of the packet"""
+        (packetCount, mac, clock, logNext, rssi, reserved, locator1, locator2,
+         hexAsciiData, originator, batt1, batt2, batt3, maxBatt1, maxBatt2,
+         maxBatt3, period, alarm, status, quality) = \
+            struct.unpack(self._beaconFormat, packetPayload)
 
-    def parseBeacon(self, packetPayload):
-        """Parse the beacon data from the payload section of the packet"""
-        record = self._beaconFactory.build(packetPayload)
-        self.packetCount = record.packetCount
-        self.macAddress = record.mac[:-1]
-        self.clock = record.clock
-        self.logNext = record.logNext
-        self.rssi = record.rssi
-        self.reserved = record.reserved
-        self.locator1 = record.locator1
-        self.locator2 = record.locator2
-        self.hexAsciiData = record.payload
-        self.originator = record.org
-        self.batteryCount = self.convertBytesToInt(record.batteryCount)
-        self.maxBatteryCount = self.convertBytesToInt(record.maxBatteryCount)
-        self.period = record.period
-        self.alarm = record.alarm
-        self.status = record.status
-        self.quality = record.quality
- 
         #parse the standard packet
-        self.deviceId = self.hexAsciiData[0:2]
+        deviceId = hexAsciiData[0:2]
+        plan = self._plans[deviceId]
         #extract the serial number from the next 30 bits
         #by pulling the next 8 nybbles
-        work = long(self.hexAsciiData[2:10], 16)
-        #and off the last two bits of the serial number
-        self.serialNo = work & self._andMask1
+        work = long(hexAsciiData[2:10], 16)
         #pull the rest and store as the open flag
         doorOpen = ((work & self._andMask2) == 1)
         #pull the 48 bit data field
-        work = self.hexAsciiData[10:22]
-        self.dataField = work
-        self.parseDataField()
+        dataField = hexAsciiData[10:22]
+        #and off the last two bits of the serial number
+        self._applyPlan(plan, dataField, work & self._andMask1, result)
+        result.deviceId = deviceId
+        result.dataField = dataField
 
-        values = {}
+        values = result.values
         values[self.KEY_DOOR_OPEN] = doorOpen
-        values['packetCount'] = self.packetCount
-        values['macAddress'] = self.macAddress
-        values[self.KEY_CLOCK] = self.clock
-        values['logNext'] = self.logNext
-        values['rssi'] = self.rssi
-        values['reserved'] = self.reserved
-        values['locator1'] = self.locator1
-        values['locator2'] = self.locator2
-        values['hexAsciiData'] = self.hexAsciiData
-        values['originator'] = self.originator
-        values['batteryCount'] = self.batteryCount
-        values['maxBatteryCount'] = self.maxBatteryCount
-        values['period'] = self.period
-        values['alarm'] = self.alarm
-        values['status'] = self.status
-        values['quality'] = self.quality
-
-        values[self.KEY_DEVICE_ID] = self.deviceId
-        values[self.KEY_SER_NO] = self.serialNo
-        values['dataField'] = self.dataField
-        values['fields'] = self.fields
-        values['service'] = self.service
-        values['types'] = self.types
-        values['units'] = self.units
+        values['packetCount'] = packetCount
+        values['macAddress'] = mac[:-1]
+        values[self.KEY_CLOCK] = clock
+        values['logNext'] = logNext
+        values['rssi'] = rssi
+        values['reserved'] = reserved
+        values['locator1'] = locator1
+        values['locator2'] = locator2
+        values['hexAsciiData'] = hexAsciiData
+        values['originator'] = originator
+        values['batteryCount'] = (batt1 << 16) + (batt2 << 8) + batt3
+        values['maxBatteryCount'] = (maxBatt1 << 16) + (maxBatt2 << 8) + maxBatt3
+        values['period'] = period
+        values['alarm'] = alarm
+        values['status'] = status
+        values['quality'] = quality
+
+        values[self.KEY_DEVICE_ID] = deviceId
+        values[self.KEY_SER_NO] = result.serialNo
+        values['dataField'] = dataField
+        values['fields'] = result.fields
+        values['service'] = result.service
+        values['types'] = result.types
+        values['units'] = result.units
 
         #parse the status
-        values['locallyConfigured'] = ((self.status & self._andMaskLocalConfigure) == self._andMaskLocalConfigure)
-        values['lowBattery'] = ((self.status & self._andMaskLowBatt) == self._andMaskLowBatt)
-        values['linePowered'] = ((self.status & self._andMaskLinePower) == self._andMaskLinePower)
+        values['locallyConfigured'] = ((status & self._andMaskLocalConfigure) == self._andMaskLocalConfigure)
+        values['lowBattery'] = ((status & self._andMaskLowBatt) == self._andMaskLowBatt)
+        values['linePowered'] = ((status & self._andMaskLinePower) == self._andMaskLinePower)
+
+    def _adoptFields(self, result):
+        """Store the decoded data field of result on the parser"""
+        self.serialNo = result.serialNo
+        self.fields = result.fields
+        self.service = result.service
+        self.types = result.types
+        self.units = result.units
+        if result.eeu1 is not None:
+            self.eeu1 = result.eeu1
+        if result.eeu2 is not None:
+            self.eeu2 = result.eeu2
+
+    def _adoptBeacon(self, result):
+        """Store a decoded beacon on the parser"""
+        values = result.values
+        self.packetCount = values['packetCount']
+        self.macAddress = values['macAddress']
+        self.clock = values[self.KEY_CLOCK]
+        self.logNext = values['logNext']
+        self.rssi = values['rssi']
+        self.reserved = values['reserved']
+        self.locator1 = values['locator1']
+        self.locator2 = values['locator2']
+        self.hexAsciiData = values['hexAsciiData']
+        self.originator = values['originator']
+        self.batteryCount = values['batteryCount']
+        self.maxBatteryCount = values['maxBatteryCount']
+        self.period = values['period']
+        self.alarm = values['alarm']
+        self.status = values['status']
+        self.quality = values['quality']
+        self.deviceId = result.deviceId
+        self.dataField = result.dataField
+        self._adoptFields(result)
 
-        return values
+    def parseBeacon(self, packetPayload):
+        """Parse the beacon data from the payload section of the packet"""
+        result = DecodeResult(self.command)
+        self._decodeBeacon(packetPayload, result)
+        self._adoptBeacon(result)
+        return result.values
 
     def parseConfig(self, packetPayload):
         record = self._configFactory.build(packetPayload)
@@ -536,70 +667,26 @@ class WirelessPacketParser:
 
     def parseDataField(self):
         """Parse the standard data field according to the identifier type"""
-        devId = str(self.deviceId)
-        datamap = self._datamaps[devId]
-        work = ''
-        dataIndex = 0
-        fieldIndex = 0
-        mapIndex = 0
-        self.fields=[]
-        while mapIndex < len(datamap):
-            mapChar = datamap[mapIndex]
-            mapValue = int(mapChar)
-            if fieldIndex == mapValue:
-                #we've found another character in our current field
-                work = work + self.dataField[dataIndex]
-                mapIndex = mapIndex + 1
-                dataIndex = dataIndex + 1
-            elif fieldIndex+1 == mapValue:
-                #we've found the end of the field we're working on
-                self.fields.append(int(work, 16))
-                work = ''
-                fieldIndex = fieldIndex + 1
-            else:
-                if len(work) > 0:
-                    self.fields.append(int(work, 16))
-                    work = ''
-                    fieldIndex = fieldIndex + 1
-                mapIndex = mapIndex + 1
-                dataIndex = dataIndex + 1
-
-        if len(work) > 0:
-            self.fields.append(int(work, 16))
-
-        self.service = self._servicemaps[devId]
-        self.types = self._typemaps[devId]
-        self.units = self._unitmaps[devId]
-
-        self.customConvert()
-        self.extendedConvert()
-        self.convertLittleEndian()
+        result = DecodeResult(self.command)
+        self._applyPlan(self._plans[str(self.deviceId)], self.dataField,
+                        self.serialNo, result)
+        self._adoptFields(result)
 
         return
 
     def parseExtendedPacket(self, packet, values=None):
-        if values==None:
-            values = {}
-
         """receive and parse the extended packet"""
-        #create the record
-        record = self._headerFactory.build(packet)
-        #parse the identifier
-        self.identifier = record.id
-        #check the indentifier
-        if(self._p6id!=self.identifier):
-            raise ValueError('Not a P6 packet:' + str(self.identifier))
+        result = self.decode(packet)
+        self.identifier = self._p6id
+        self.command = result.command
 
-        #parse the rest of the extended packet
-        self.command = record.cmd
+        if result.deviceId is not None:
+            self._adoptBeacon(result)
+        elif values is not None and result.command != 0x10:
+            values[self.KEY_COMMAND] = result.command
+            return values
 
-        if self.command == 2 or self.command == 5:
-            values = self.parseBeacon(record.payload)
-        elif self.command == 0x10:
-            values = self.parseConfig(record.payload)
-
-        values[self.KEY_COMMAND] = self.command
-        return values
+        return result.values
 
     def parseHysterisis(self, hysterisis):
         """convert percentage forms of hysterisis to a integer value"""
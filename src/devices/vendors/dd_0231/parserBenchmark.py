@@ -0,0 +1,294 @@
+"""\
+Compares WirelessPacketParser over recorded beacon packets with the former
+parser, which walked the datamap a character at a time and then converted
+the fields in three more passes.
+
+usage: python parserBenchmark.py [packets.bin] [rounds]
+
+The packet file holds raw extended packets of PACKET_LENGTH bytes, as
+read by parserDriver.py.  Without one, a beacon is generated for each
+known device type.
+"""
+import os
+import struct
+import sys
+import time
+
+import RecordParser
+import WirelessPacketParser
+
+class LegacyWirelessPacketParser(WirelessPacketParser.WirelessPacketParser):
+    """WirelessPacketParser before decode plans, without its eeu print"""
+
+    def __init__(self):
+        WirelessPacketParser.WirelessPacketParser.__init__(self)
+        self._headerFactory = RecordParser.RecordFactory("""
+            >H.id
+            >H.cmd
+            71s.payload
+""")
+        self._beaconFactory = RecordParser.RecordFactory("""
+            >H.packetCount
+            18s.mac
+            >I.clock
+            >H.logNext
+            1B.rssi
+            1B.reserved
+            c.locator1
+            c.locator2
+            29s.payload
+            1B.org
+            3B.batteryCount
+            3B.maxBatteryCount
+            >H.period
+            1B.alarm
+            1B.status
+            1B.quality
+""")
+
+    def customConvert(self):
+        try:
+            conversionMap = self._conversionMaps[str(self.deviceId)]
+
+            convertIdx = 0
+            for idx in range(len(self.fields)):
+                offset = conversionMap[convertIdx]
+                scale = conversionMap[convertIdx + 1]
+
+                if(offset!=None):
+                    if(str(offset) == self.TC16):
+                        val = self.fields[idx]
+                        val = self.convertSigned16(val) * scale
+                    elif(str(offset) == self.LONG_SERIAL):
+                        val = self.serialNo << 32
+                        val |= self.fields[idx]
+                        self.serialNo = val
+                    else:
+                        val = (self.fields[idx] * scale) + offset
+
+                    self.fields[idx] = val
+
+                convertIdx += 2
+
+        except KeyError:
+            None
+
+    def convertLittleEndian(self):
+        devId = str(self.deviceId)
+        if self._littleEndian.get(devId, False):
+            revFields = []
+            for field in self.fields:
+                revFields.append(self.reverseByteOrder(field))
+            self.fields = revFields
+
+    def extendedConvert(self):
+        devId = str(self.deviceId)
+        if(devId == '28' or devId == '29'):
+          answers = []
+          answers.append(self.fields[1])
+          enum = self.fields[0] & 0x3F
+          eeu = self._eeumaps[str(enum)]
+          self.eeu1 = eeu
+          val = (self.convertSigned16(self.fields[2]) * eeu[1]) + eeu[0]
+          answers.append(val)
+          self.fields = answers
+          self.units = [self.UNITS_COUNT, eeu[2]]
+        elif(devId == '53' or devId == '54'):
+          answers = [self.fields[1]]
+          self.fields = answers
+        elif(devId == '75' or devId == '76'):
+          answers = []
+          pointCount = self.fields[0] & 3
+          enum = self.fields[1] & 0x3F
+          eeu = self._eeumaps[str(enum)]
+          self.eeu1 = eeu
+          val = (self.convertSigned16(self.fields[3]) * eeu[1]) + eeu[0]
+          answers.append(val)
+          self.units = [eeu[2]]
+          if pointCount == 2:
+              enum = self.fields[0] >> 2
+              eeu = self._eeumaps[str(enum)]
+              self.eeu2 = eeu
+              val = (self.convertSigned16(self.fields[2]) * eeu[1]) + eeu[0]
+              answers.append(val)
+              self.units.append(eeu[2])
+          else:
+              self.eeu2 = []
+          self.fields = answers
+
+    def parseBeacon(self, packetPayload):
+        record = self._beaconFactory.build(packetPayload)
+        self.packetCount = record.packetCount
+        self.macAddress = record.mac[:-1]
+        self.clock = record.clock
+        self.logNext = record.logNext
+        self.rssi = record.rssi
+        self.reserved = record.reserved
+        self.locator1 = record.locator1
+        self.locator2 = record.locator2
+        self.hexAsciiData = record.payload
+        self.originator = record.org
+        self.batteryCount = self.convertBytesToInt(record.batteryCount)
+        self.maxBatteryCount = self.convertBytesToInt(record.maxBatteryCount)
+        self.period = record.period
+        self.alarm = record.alarm
+        self.status = record.status
+        self.quality = record.quality
+
+        self.deviceId = self.hexAsciiData[0:2]
+        work = long(self.hexAsciiData[2:10], 16)
+        self.serialNo = work & self._andMask1
+        doorOpen = ((work & self._andMask2) == 1)
+        work = self.hexAsciiData[10:22]
+        self.dataField = work
+        self.parseDataField()
+
+        values = {}
+        values[self.KEY_DOOR_OPEN] = doorOpen
+        values['packetCount'] = self.packetCount
+        values['macAddress'] = self.macAddress
+        values[self.KEY_CLOCK] = self.clock
+        values['logNext'] = self.logNext
+        values['rssi'] = self.rssi
+        values['reserved'] = self.reserved
+        values['locator1'] = self.locator1
+        values['locator2'] = self.locator2
+        values['hexAsciiData'] = self.hexAsciiData
+        values['originator'] = self.originator
+        values['batteryCount'] = self.batteryCount
+        values['maxBatteryCount'] = self.maxBatteryCount
+        values['period'] = self.period
+        values['alarm'] = self.alarm
+        values['status'] = self.status
+        values['quality'] = self.quality
+
+        values[self.KEY_DEVICE_ID] = self.deviceId
+        values[self.KEY_SER_NO] = self.serialNo
+        values['dataField'] = self.dataField
+        values['fields'] = self.fields
+        values['service'] = self.service
+        values['types'] = self.types
+        values['units'] = self.units
+
+        values['locallyConfigured'] = ((self.status & self._andMaskLocalConfigure) == self._andMaskLocalConfigure)
+        values['lowBattery'] = ((self.status & self._andMaskLowBatt) == self._andMaskLowBatt)
+        values['linePowered'] = ((self.status & self._andMaskLinePower) == self._andMaskLinePower)
+
+        return values
+
+    def parseDataField(self):
+        devId = str(self.deviceId)
+        datamap = self._datamaps[devId]
+        work = ''
+        dataIndex = 0
+        fieldIndex = 0
+        mapIndex = 0
+        self.fields=[]
+        while mapIndex < len(datamap):
+            mapChar = datamap[mapIndex]
+            mapValue = int(mapChar)
+            if fieldIndex == mapValue:
+                work = work + self.dataField[dataIndex]
+                mapIndex = mapIndex + 1
+                dataIndex = dataIndex + 1
+            elif fieldIndex+1 == mapValue:
+                self.fields.append(int(work, 16))
+                work = ''
+                fieldIndex = fieldIndex + 1
+            else:
+                if len(work) > 0:
+                    self.fields.append(int(work, 16))
+                    work = ''
+                    fieldIndex = fieldIndex + 1
+                mapIndex = mapIndex + 1
+                dataIndex = dataIndex + 1
+
+        if len(work) > 0:
+            self.fields.append(int(work, 16))
+
+        self.service = self._servicemaps[devId]
+        self.types = self._typemaps[devId]
+        self.units = self._unitmaps[devId]
+
+        self.customConvert()
+        self.extendedConvert()
+        self.convertLittleEndian()
+
+    def parseExtendedPacket(self, packet, values=None):
+        if values==None:
+            values = {}
+
+        record = self._headerFactory.build(packet)
+        self.identifier = record.id
+        if(self._p6id!=self.identifier):
+            raise ValueError('Not a P6 packet:' + str(self.identifier))
+
+        self.command = record.cmd
+
+        if self.command == 2 or self.command == 5:
+            values = self.parseBeacon(record.payload)
+        elif self.command == 0x10:
+            values = self.parseConfig(record.payload)
+
+        values[self.KEY_COMMAND] = self.command
+        return values
+
+def loadPackets(fileName):
+    packets = []
+    packetFile = open(fileName, 'rb')
+    try:
+        packet = packetFile.read(WirelessPacketParser.WirelessPacketParser.PACKET_LENGTH)
+        while len(packet) == WirelessPacketParser.WirelessPacketParser.PACKET_LENGTH:
+            packets.append(packet)
+            packet = packetFile.read(WirelessPacketParser.WirelessPacketParser.PACKET_LENGTH)
+    finally:
+        packetFile.close()
+    return packets
+
+def makeBeacons():
+    #device id and a 48 bit data field the device type can decode
+    samples = [('10', '0001003e54e9'), ('28', '00330123fe10'),
+               ('51', '000005dc0a28'), ('53', '0000abcd0190'),
+               ('75', 'f23903e80800')]
+    packets = []
+    for devId, dataField in samples:
+        hexAsciiData = devId + '12345678' + dataField + '0' * 7
+        payload = struct.pack('>H18sIHBBcc29sB3B3BHBBB', 1, 'MAC-ADDRESS-01234\0',
+                              0, 0, 40, 0, 'a', 'b', hexAsciiData, 1,
+                              0, 1, 2, 0, 9, 9, 600, 0, 0, 5)
+        packets.append(struct.pack('>HH', 0xc33c, 2) + payload)
+    return packets
+
+def timeIt(function, packets, rounds):
+    """Return the time, in microseconds, function takes per packet"""
+    start = time.time()
+    for i in range(rounds):
+        for packet in packets:
+            function(packet)
+    return (time.time() - start) * 1000000.0 / (rounds * len(packets))
+
+def main():
+    rounds = 1000
+    if len(sys.argv) > 2:
+        rounds = int(sys.argv[2])
+    if len(sys.argv) > 1 and os.path.exists(sys.argv[1]):
+        packets = loadPackets(sys.argv[1])
+    else:
+        packets = makeBeacons()
+    if not packets:
+        print('no packets to decode')
+        return
+
+    legacy = LegacyWirelessPacketParser()
+    parser = WirelessPacketParser.WirelessPacketParser()
+    print('%d packets, %d rounds' % (len(packets), rounds))
+    print('%-20s %12s %12s %8s' % ('', 'former us', 'current us', 'speedup'))
+    former = timeIt(legacy.parseExtendedPacket, packets, rounds)
+    for label, function in (('parseExtendedPacket', parser.parseExtendedPacket),
+                            ('decode', parser.decode)):
+        current = timeIt(function, packets, rounds)
+        print('%-20s %12.1f %12.1f %7.1fx' %
+              (label, former, current, former / current))
+
+if __name__ == "__main__":
+    main()
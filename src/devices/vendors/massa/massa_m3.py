@@ -699,17 +699,19 @@ class MassaM3(XBeeBase):
     def __update_channels(self, results):
         if isinstance(results, list):
             for result in results:
-                self.property_set("distance", Sample(result['timestamp'], round(result['distance'], 6), "in"))
-                self.property_set("temperature", Sample(result['timestamp'], round(result['temperature'], 6), "C"))
-                self.property_set("target_strength", Sample(result['timestamp'], result['target_strength'], "%"))
-                self.property_set("strength", Sample(result['timestamp'], result['strength'], ""))
-                self.property_set("battery", Sample(result['timestamp'], round(result['battery'], 6), "V"))
-                self.property_set("gain", Sample(result['timestamp'], result['gain'], ""))
-                self.property_set("event", Sample(result['timestamp'], result['event'], ""))
-                self.property_set("serial_number", Sample(result['timestamp'], result['serial_number'], ""))
-                self.property_set("sensor_model", Sample(result['timestamp'], result['sensor_model'], ""))
-                self.property_set("FWa_version", Sample(result['timestamp'], result['FWa_version'], ""))
-                self.property_set("FWb_version", Sample(result['timestamp'], result['FWb_version'], ""))
+                self.property_set_many([
+                    ("distance", Sample(result['timestamp'], round(result['distance'], 6), "in")),
+                    ("temperature", Sample(result['timestamp'], round(result['temperature'], 6), "C")),
+                    ("target_strength", Sample(result['timestamp'], result['target_strength'], "%")),
+                    ("strength", Sample(result['timestamp'], result['strength'], "")),
+                    ("battery", Sample(result['timestamp'], round(result['battery'], 6), "V")),
+                    ("gain", Sample(result['timestamp'], result['gain'], "")),
+                    ("event", Sample(result['timestamp'], result['event'], "")),
+                    ("serial_number", Sample(result['timestamp'], result['serial_number'], "")),
+                    ("sensor_model", Sample(result['timestamp'], result['sensor_model'], "")),
+                    ("FWa_version", Sample(result['timestamp'], result['FWa_version'], "")),
+                    ("FWb_version", Sample(result['timestamp'], result['FWb_version'], "")),
+                ])
 
 
     def __decode_history_data(self, data):
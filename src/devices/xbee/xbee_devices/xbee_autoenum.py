@@ -102,6 +102,14 @@ class XBeeAutoEnum(DeviceBase, threading.Thread):
         self.__purgatory = []
         self.__callbacks = []
 
+        # Known addresses, see __is_known():
+        self.__index_lock = threading.RLock()
+        self.__index_generation = None
+        self.__address_index = {}   # normalized address -> XBee device
+        self.__purgatory_addresses = set()  # normalized addresses
+        self.__seen = {}            # raw address -> (device, snapshot)
+        self.__queued = set()       # raw addresses waiting to be added
+
         ## Settings Table Definition:
 
         settings_list = [
@@ -126,6 +134,12 @@ class XBeeAutoEnum(DeviceBase, threading.Thread):
             # becomes just 'aio_E0_FC'
             Setting(name='short_names', type=bool, required=False,
                     default_value=False),
+
+            # Maximum number of newly seen devices added to the system
+            # in one pass.
+            Setting(
+                name='batch_size', type=int, required=False,
+                default_value=1, verify_function=lambda x: x >= 1),
         ]
 
         ## Channel Properties Definition:
@@ -322,12 +336,31 @@ class XBeeAutoEnum(DeviceBase, threading.Thread):
             except Queue.Empty:
                 continue
 
-            if addr != None:
-                already_in = self.__check_if_device_is_already_in_system(addr)
-                if already_in == False:
-                    self.__add_new_device(addr)
-            else:
+            if addr == None:
                 digitime.sleep(1)
+                continue
+
+            # Then take any other device already waiting, up to the batch
+            # size, to add them in one pass:
+            batch = [ addr ]
+            batch_size = SettingsBase.get_setting(self, "batch_size")
+            while len(batch) < batch_size:
+                try:
+                    addr = self.__add_device_queue.get_nowait()
+                except Queue.Empty:
+                    break
+                if addr != None:
+                    batch.append(addr)
+
+            try:
+                self.__add_new_devices(batch)
+            finally:
+                self.__index_lock.acquire()
+                try:
+                    for addr in batch:
+                        self.__queued.discard(addr)
+                finally:
+                    self.__index_lock.release()
 
         # Unregister ourselves with the XBee Device Manager instance:
         self.__xbee_manager.xbee_device_unregister(self)
@@ -364,15 +397,10 @@ class XBeeAutoEnum(DeviceBase, threading.Thread):
                 if node.type == 'coordinator':
                     continue
 
-                already_in = self.__check_if_device_is_already_in_system(
-                             node.addr_extended)
-                if already_in == False:
+                if self.__enqueue_if_new(node.addr_extended):
                     self.__tracer.info("XBeeAutoEnum: "
                                        "discover_thread enqueue: %s",
                                        (node.addr_extended))
-                    self.__add_device_queue.put(node.addr_extended)
-                    # Uncomment when we go to Python 2.5+
-                    # self.__add_device_queue.task_done()
 
     def add_new_device_callback(self, cbfnc):
         """\
@@ -405,11 +433,28 @@ class XBeeAutoEnum(DeviceBase, threading.Thread):
     def __sample_indication(self, buf, addr):
         # print "XBeeAutoEnum: Got sample indication from: %s, buf is
         # len %d." % (str(addr), len(buf))
-        already_in = self.__check_if_device_is_already_in_system(addr[0])
-        if already_in == False:
-            self.__add_device_queue.put(addr[0])
-            # Uncomment when we go to Python 2.5+
-            # self.__add_device_queue.task_done()
+        self.__enqueue_if_new(addr[0])
+
+    def __enqueue_if_new(self, address):
+        """\
+            Queue `address` to be added to the system, unless it is
+            known or already queued.
+
+            Returns True if the address was queued.
+
+        """
+        self.__index_lock.acquire()
+        try:
+            if address in self.__queued or self.__is_known(address):
+                return False
+            self.__queued.add(address)
+        finally:
+            self.__index_lock.release()
+
+        self.__add_device_queue.put(address)
+        # Uncomment when we go to Python 2.5+
+        # self.__add_device_queue.task_done()
+        return True
 
     def __generate_running_xbee_devices_list(self):
         """\
@@ -427,56 +472,88 @@ class XBeeAutoEnum(DeviceBase, threading.Thread):
         #print device_list
         return device_list
 
-    def __check_if_device_is_already_in_system(self, new_address):
+    def __rebuild_index(self, dm):
         """\
-            Attempt to determine if the detected device is already
-            configured or in purgatory.
-
-            Parameters:
-                * **new_address**: The XBee address of the new device.
+            Index the running XBee devices by extended address.
 
-            Return type:
-                * bool
+            Called with the index lock held.
 
         """
-        device_list = self.__generate_running_xbee_devices_list()
-
-        # Search the device list to see if this is a device
-        # we already know about...
-        for device in device_list:
+        index = {}
+        for device in self.__generate_running_xbee_devices_list():
             try:
                 existing_address = device.get_setting('extended_address')
             except Exception, e:
-                # print e
-                # print device
                 continue
 
             if existing_address == None or existing_address == '':
                 continue
 
-            new_address = normalize_address(new_address)
-            existing_address = normalize_address(existing_address)
-            if existing_address == new_address:
-                #print "XBeeAutoEnum:
-                #      __check_if_device_is_already_in_system -"\ "
-                #      DUPLICATE %s not re-adding." % (new_address)
-                return True
+            try:
+                index[normalize_address(existing_address)] = device
+            except ValueError:
+                continue
 
-        # Now walk through purgatory, and see if the device is listed in there.
-        # If so, return True so that the system won't attempt to add it.
-        for entry in self.__purgatory:
-            if entry['extended_address'] == new_address:
-                #print "XBeeAutoEnum:
-                #      __check_if_device_is_already_in_system -"\ "
-                #      DEVICE IN PURGATORY %s not re-adding." %
-                #      (new_address)
+        self.__address_index = index
+        self.__seen.clear()
+        self.__index_generation = dm.instance_generation()
+
+    def __is_known(self, new_address, refresh=False):
+        """\
+            Determine if the detected device is already configured or
+            in purgatory.
+
+            Known raw addresses are remembered with the settings
+            snapshot of their device, so that a device seen again costs
+            a dictionary lookup.  The index is rebuilt when devices are
+            added to or removed from the device driver manager, or on
+            request (`refresh`), and an entry is checked again when the
+            settings of its device change.
+
+            Called with the index lock held.
+
+        """
+        dm = self.__core.get_service("device_driver_manager")
+        if refresh or self.__index_generation != dm.instance_generation():
+            self.__rebuild_index(dm)
+
+        seen = self.__seen.get(new_address)
+        if seen is not None:
+            device, snapshot = seen
+            if device is None or device.get_settings_snapshot() is snapshot:
                 return True
+            # the settings of the device changed, look again:
+            del self.__seen[new_address]
+            self.__rebuild_index(dm)
+
+        try:
+            normalized = normalize_address(new_address)
+        except ValueError:
+            self.__tracer.warning("XBeeAutoEnum: ignoring invalid " +
+                                  "address %s", new_address)
+            self.__seen[new_address] = (None, None)
+            return True
+
+        device = self.__address_index.get(normalized)
+        if device is not None:
+            self.__seen[new_address] = (device,
+                                        device.get_settings_snapshot())
+            return True
+
+        # Now check purgatory, if the device is listed in there return
+        # True so that the system won't attempt to add it.
+        if normalized in self.__purgatory_addresses:
+            self.__seen[new_address] = (None, None)
+            return True
 
         return False
 
-    def __create_name(self, default_name, address, node_identifier):
+    def __create_name(self, default_name, address, node_identifier,
+                      device_names):
         """\
             Create a new DIA name for this device.
+
+            `device_names` are the names of the running XBee devices.
         """
 
         # Only use the NI value if its not empty, or isn't just a single space.
@@ -484,10 +561,9 @@ class XBeeAutoEnum(DeviceBase, threading.Thread):
             # Walk the device list, to make sure we don't add a
             # duplicate name...
             count = 0
-            device_list = self.__generate_running_xbee_devices_list()
-            for i in device_list:
-                l = len(node_identifier)
-                if i.get_name()[0:l] == node_identifier:
+            l = len(node_identifier)
+            for device_name in device_names:
+                if device_name[0:l] == node_identifier:
                     count += 1
             if count == 0:
                 name = node_identifier
@@ -554,15 +630,80 @@ class XBeeAutoEnum(DeviceBase, threading.Thread):
         #                                                 (extended_address)
         entry = dict(product_type=product_type,
                      extended_address=extended_address)
-        self.__purgatory.append(entry)
+        self.__index_lock.acquire()
+        try:
+            self.__purgatory.append(entry)
+            try:
+                self.__purgatory_addresses.add(
+                    normalize_address(extended_address))
+            except ValueError:
+                pass
+        finally:
+            self.__index_lock.release()
+
+    def __add_new_devices(self, new_extended_addresses):
+        """\
+            Add the devices seen at `new_extended_addresses` in one pass:
+            query and name them all, append their settings to the
+            pending instance list, then create and start them.
 
-    def __add_new_device(self, new_extended_address):
+        """
+        device_names = [ device.get_name() for device in
+                         self.__generate_running_xbee_devices_list() ]
 
-        already_in_system = self.__check_if_device_is_already_in_system(
-                          new_extended_address)
-        if already_in_system == True:
+        # Look at the devices in the system once for the whole batch:
+        self.__index_lock.acquire()
+        try:
+            dm = self.__core.get_service("device_driver_manager")
+            self.__rebuild_index(dm)
+        finally:
+            self.__index_lock.release()
+
+        new_devices = []
+        batch = set()
+        for new_extended_address in new_extended_addresses:
+            if new_extended_address in batch:
+                continue
+            batch.add(new_extended_address)
+            prepared = self.__prepare_new_device(new_extended_address,
+                                                 device_names)
+            if prepared is not None:
+                product_type, instance_settings = prepared
+                device_names.append(instance_settings['name'])
+                new_devices.append((new_extended_address, product_type,
+                                    instance_settings))
+
+        if not new_devices:
             return
 
+        # Get the current instance list for the devices binding:
+        self.__settings_ctx.set_current_binding(("devices", ))
+        for _, _, instance_settings in new_devices:
+            self.__settings_ctx.pending_instance_list_append(
+                instance_settings)
+
+        for new_extended_address, product_type, instance_settings in \
+                new_devices:
+            self.__start_new_device(new_extended_address, product_type,
+                                    instance_settings)
+
+    def __prepare_new_device(self, new_extended_address, device_names):
+        """\
+            Build the instance settings of the device seen at
+            `new_extended_address`.
+
+            Returns a (product type, instance settings) tuple, or None if
+            the device is known already or cannot be added.
+
+        """
+        self.__index_lock.acquire()
+        try:
+            already_in_system = self.__is_known(new_extended_address)
+        finally:
+            self.__index_lock.release()
+        if already_in_system == True:
+            return None
+
         # Device is new, and one we didn't have already configured in the
         # config file.  Ask the device what it is...
         product_type, node_identifier = self.__get_device_data(\
@@ -575,7 +716,7 @@ class XBeeAutoEnum(DeviceBase, threading.Thread):
         # If we were unable to get important data about the device, bail early.
         # The next discovery we will take another crack at it.
         if product_type == None:
-            return
+            return None
 
         self.__tracer.info("XBeeAutoEnum: New Device Found: %-s%s%-s%s%-s",
                            product_name(product_type), " " * 4,
@@ -599,7 +740,7 @@ class XBeeAutoEnum(DeviceBase, threading.Thread):
             self.__tracer.warning("XBeeAutoEnum: No Default Config Found.")
             self.__banish_device_to_purgatory(product_type,
                                               new_extended_address)
-            return
+            return None
 
         if instance_settings == None:
             # If there is no instance settings for this device, there is no
@@ -610,23 +751,24 @@ class XBeeAutoEnum(DeviceBase, threading.Thread):
             # the device will remain until a later time, in which we might
             # have a new DIA config inserted into the running state of the
             # system that would provide us correct instance settings.
-            entry = dict(product_type=product_type,
-                         extended_address=new_extended_address)
-            self.__purgatory.append(entry)
-            return
+            self.__banish_device_to_purgatory(product_type,
+                                              new_extended_address)
+            return None
 
         # Go create a custom name derived from the address and node identifier.
         name = self.__create_name(instance_settings['name'],
-                    new_extended_address, node_identifier)
+                    new_extended_address, node_identifier, device_names)
         instance_settings['name'] = name
 
         # Replace the extended address with our custom versions.
         instance_settings['settings']['extended_address'] = \
                                                           new_extended_address
 
-        # Get the current instance list for the devices binding:
-        self.__settings_ctx.set_current_binding(("devices", ))
-        self.__settings_ctx.pending_instance_list_append(instance_settings)
+        return (product_type, instance_settings)
+
+    def __start_new_device(self, new_extended_address, product_type,
+                           instance_settings):
+        name = instance_settings['name']
 
         # Now attempt to start the new device, if it already hasn't been done.
         try:
@@ -468,7 +468,8 @@ class XBeeRPM(XBeeBase):
             if ((digitime.time() - self.__power_on_time) \
                 >= idle_off_setting):
                 power_on_state_bool = self.property_get("power_on")
-                power_on_state_bool.value = False
+                power_on_state_bool = Sample(power_on_state_bool.timestamp,
+                                             False, power_on_state_bool.unit)
                 self.prop_set_power_control(power_on_state_bool)
                 self._tracer.debug('Idle Off True')
 
@@ -403,6 +403,9 @@ class XBeeSensor(XBeeBase):
         # Parse the I/O sample:
         io_sample = parse_is(buf)
 
+        # the properties are all set at once
+        samples = []
+
         # Calculate sensor channel values:
         if "AD1" in io_sample and "AD2" in io_sample and \
                "AD3" in io_sample:
@@ -429,8 +432,8 @@ class XBeeSensor(XBeeBase):
 
             temperature = round(temperature, 2)
 
-            self.property_set("temperature",
-                Sample(self._last_timestamp, temperature, units))
+            samples.append(("temperature",
+                Sample(self._last_timestamp, temperature, units)))
             if msg is not None:
                 msg.append("%d %s" % (temperature, units))
 
@@ -441,8 +444,8 @@ class XBeeSensor(XBeeBase):
             if light < 0:
                 # clamp to be zero or higher
                 light = 0
-            self.property_set("light",
-                Sample(self._last_timestamp, light, "brightness"))
+            samples.append(("light",
+                Sample(self._last_timestamp, light, "brightness")))
             if msg is not None:
                 msg.append(", %d brightness" % light)
 
@@ -458,8 +461,8 @@ class XBeeSensor(XBeeBase):
                 elif humidity > 100.0:
                     # clamp to be max of 100%
                     humidity = 100.0
-                self.property_set("humidity",
-                    Sample(self._last_timestamp, humidity, "%"))
+                samples.append(("humidity",
+                    Sample(self._last_timestamp, humidity, "%")))
                 if msg is not None:
                     # cannot use %% in string, __tracer will misunderstand
                     msg.append(", %d RH" % humidity)
@@ -472,13 +475,15 @@ class XBeeSensor(XBeeBase):
         if "DIO11" in io_sample:
             low_battery = not bool(io_sample["DIO11"])
             if low_battery != bool(self.property_get("low_battery").value):
-                self.property_set("low_battery",
-                    Sample(self._last_timestamp, low_battery))
+                samples.append(("low_battery",
+                    Sample(self._last_timestamp, low_battery)))
 
             if low_battery and msg is not None:
                 msg.append(", low_battery")
                 # try to keep memory use from dragging out
 
+        self.property_set_many(samples)
+
         if msg is not None:
             self._tracer.info("".join(msg))
             del msg
@@ -48,8 +48,10 @@ from channels.channel_database_interface import \
 from channels.channel import \
     PERM_GET, PERM_SET, PERM_REFRESH, \
     OPT_AUTOTIMESTAMP, OPT_DONOTLOG, OPT_DONOTDUMPDATA
-from core.core_services import CoreSettingsInvalidSerializer
+from core.core_services import CoreSettingsInvalidSerializer, \
+    CoreServiceNotFound
 from common.dia_proc import get_drivers
+from common.import_profiler import format_import_report
 
 
 # constants
@@ -268,6 +270,17 @@ Syntax::
         device_dump
 """,
 #---
+"import_report":
+"""
+    Report the cost of the modules imported during start up, costliest
+    first: the time spent importing each module with and without the
+    modules it imports, and the change of resident memory when known.
+
+    Syntax::
+
+        import_report [count]
+""",
+#---
 "quit":
 """
 Disconnect from the CLI.
@@ -909,6 +922,28 @@ Syntax::
         for _ in name_device_pairs:
             self.write(_[0] + ": " + _[1] + '\r\n')
     
+    def do_import_report(self, arg):
+        try:
+            args = parse_line(arg)
+            count = None
+            if len(args) == 1:
+                count = int(args[0])
+            elif len(args) > 1:
+                raise ValueError
+        except:
+            self.write("invalid syntax.\r\n")
+            return 0
+
+        try:
+            records = self.__core.get_service("import_profiler").records()
+        except CoreServiceNotFound:
+            records = []
+        if not records:
+            self.write("\r\n\tNo import report available, see the "
+                       "profile_imports start up setting.\r\n")
+            return 0
+        self.write(format_import_report(records, count))
+
     def do_quit(self, arg):
         return -1
 
@@ -38,7 +38,6 @@ from StringIO import StringIO
 from string import Template
 import time
 import cgi 
-from presentations.embedded_web.index_page import raw_html
 import presentations.embedded_web.pyhtml as pyhtml
 
 class Web(PresentationBase):
@@ -112,6 +111,8 @@ class Web(PresentationBase):
             return None
        try:
         if args==None or args["controller"]==None or args["controller"]=="index":
+            # the page is large, only import it once it is requested:
+            from presentations.embedded_web.index_page import raw_html
             return (digiweb.TextHtml,raw_html)
 
         cm = self.__core.get_service("channel_manager").channel_database_get()
@@ -199,7 +199,7 @@ class iDigi_DB(PresentationBase, threading.Thread):
 
     def receive(self, channel):
         # Check how many samples it takes to meet the sample threshold
-        sample_threshold = SettingsBase.get_setting(self, "sample_threshold")
+        sample_threshold = self._settings_snapshot.sample_threshold
         self.__sample_count += 1
         # self.__tracer.info("idigi_db (%s): Received sample %i", \
         #       self.__name, self.__sample_count)
@@ -221,6 +221,22 @@ Device Dump
        <device name="..." driver="..." />
     </device_dump>
 
+Import Report
+-------------
+**Request** code::
+
+    <import_report [count="..."] />
+
+**Response** code::
+
+    <import_report>
+       <module name="..." total="..." self="..." memory="..." />
+    </import_report>
+
+Lists the modules imported during start up, costliest first, with the
+time spent importing them in seconds (with and without the modules they
+import themselves) and the resident memory delta in bytes when known.
+
 Shutdown
 --------
 **Request** code::
@@ -236,6 +252,9 @@ Shutdown
 
 # History:
 # 2012-10-26: LAL changed to support subclassing
+# Parser and reply state are kept per request so that concurrent RCI
+# callbacks no longer share them.  Channel dump fragments are cached per
+# channel, and re-used while the channel holds the same sample.
 
 # imports
 import xml.parsers.expat
@@ -263,6 +282,7 @@ from common.helpers.format_channels import iso_date
 from channels.channel_database_interface import \
     LOG_SEEK_SET, LOG_SEEK_CUR, LOG_SEEK_END, LOG_SEEK_REC
 from common.dia_proc import get_drivers
+from core.core_services import CoreServiceNotFound
 
 from core.tracing import get_tracer
 
@@ -273,6 +293,8 @@ ENTITY_MAP = {
     "&": "&amp;",
 }
 
+RCI_WRAPPER_TAG = "hidden_rci_callback_xml_wrapper_tag"
+
 # classes
 
 class RCIHandler(PresentationBase):
@@ -301,6 +323,16 @@ class RCIHandler(PresentationBase):
         self._handle = None
         self._tracer = get_tracer(name)
 
+        # reply fragments of the request processed by each thread, see
+        # _reply:
+        self.__request_state = threading.local()
+
+        # channel dump cache, see __generate_channel_database_cached():
+        self.__dump_lock = threading.Lock()
+        self.__dump_fragments = {}
+        self.__dump_layout = None
+        self.__dump_channel_list = None
+
         settings_list = [
                          Setting(
                                  name='target_name', type=str,
@@ -341,6 +373,8 @@ class RCIHandler(PresentationBase):
                 del self._handle
                 self._handle = None
 
+        self.__dump_flush()
+
         return True
 
     def __escape_entities(self, sample_value):
@@ -360,11 +394,39 @@ class RCIHandler(PresentationBase):
 
         return sample_value
 
+    def _reply_fragments(self):
+        """
+        Returns the list of the fragments of the reply of the request
+        being processed by the calling thread.  Element handlers append
+        their fragments to it, they are joined once the request has been
+        processed.
+        """
+        try:
+            return self.__request_state.fragments
+        except AttributeError:
+            fragments = self.__request_state.fragments = []
+            return fragments
+
+    def __get_reply(self):
+        return "".join(self._reply_fragments())
+
+    def __set_reply(self, reply):
+        self.__request_state.fragments = [reply]
+
+    # Reply of the request being processed, as a string.  It is kept per
+    # thread, so several requests may be processed at the same time.
+    # Appending to _reply_fragments() is cheaper than assigning it.
+    _reply = property(__get_reply, __set_reply)
+
     def __rci_callback(self, message):
         """
         Called whenever there is an incoming RCI message with
         our specified target.
 
+        The parser is local to this call and the reply local to the
+        calling thread, so several requests may be processed at the
+        same time.
+
         Keyword arguments:
             message - the value that is intended for us from RCI.
 
@@ -372,18 +434,28 @@ class RCIHandler(PresentationBase):
         """
 
         self._tracer.debug("Req: %s", message)
-        
-        self.__parser = xml.parsers.expat.ParserCreate()
-        self.__parser.StartElementHandler = self._handle_start_element
-        self.__parser.EndElementHandler = self._handle_end_element
-        self._reply = ""
 
-        start_wrapper = "<hidden_rci_callback_xml_wrapper_tag>"
-        end_wrapper = "</hidden_rci_callback_xml_wrapper_tag>"
-        message = start_wrapper + message + end_wrapper
+        def start_element(name, attrs):
+            if name != RCI_WRAPPER_TAG:
+                fragment = self._handle_start_element(name, attrs)
+                if fragment is not None:
+                    self._reply_fragments().append(fragment)
+
+        def end_element(name):
+            if name != RCI_WRAPPER_TAG:
+                fragment = self._handle_end_element(name)
+                if fragment is not None:
+                    self._reply_fragments().append(fragment)
+
+        parser = xml.parsers.expat.ParserCreate()
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = end_element
+        self.__request_state.fragments = []
+
+        message = "<%s>%s</%s>" % (RCI_WRAPPER_TAG, message, RCI_WRAPPER_TAG)
 
         try:
-            self.__parser.Parse(message)
+            parser.Parse(message)
         except xml.parsers.expat.ExpatError:
             self._reply = RCIHandler.ERR_PARSE_ERROR
         except Exception, e:
@@ -391,10 +463,10 @@ class RCIHandler(PresentationBase):
                 str(e))
             self._tracer.debug(traceback.format_exc())
 
-        self._tracer.debug("Rsp: %s", self._reply)
+        reply_string = str(self._reply)
+        self.__request_state.fragments = []
 
-        reply_string = str(self._reply).\
-            replace(start_wrapper, "").replace(end_wrapper, "")
+        self._tracer.debug("Rsp: %s", reply_string)
 
         return reply_string
 
@@ -405,40 +477,18 @@ class RCIHandler(PresentationBase):
         Keyword arguments:
             name -- the name of the element.
             attrs -- dictionary of attributes.
+
+        Appends the reply fragment for this element to
+        self._reply_fragments().  Subclasses extending the set of requests
+        may append their own fragment, or return it, and defer to this
+        method for any other element.
         """
 
-        if name == "channel_dump":
-            self._reply += self.__do_channel_dump(attrs)
-        elif name == "channel_get":
-            self._reply += self.__do_channel_get(attrs)
-        elif name == "channel_set":
-            self._reply += self.__do_channel_set(attrs)
-        elif name == "channel_refresh":
-            self._reply += self.__do_channel_refresh(attrs)
-        elif name == "channel_info":
-            self._reply += self.__do_channel_info(attrs)
-        elif name == "logger_list":
-            self._reply += self.__do_logger_list(attrs)
-        elif name == "logger_set":
-            self._reply += self.__do_logger_set(attrs)
-        elif name == "logger_dump":
-            self._reply += self.__do_logger_dump(attrs)
-        elif name == "logger_next":
-            self._reply += self.__do_logger_next(attrs)
-        elif name == "logger_prev":
-            self._reply += self.__do_logger_prev(attrs)
-        elif name == "logger_rewind":
-            self._reply += self.__do_logger_rewind(attrs)
-        elif name == "logger_seek":
-            self._reply += self.__do_logger_seek(attrs)
-        elif name == "logger_pos":
-            self._reply += self.__do_logger_pos(attrs)
-        elif name == "device_dump":
-            self._reply += self.__do_device_dump(attrs)
-        elif name == "shutdown":
-            self._reply += self.__do_dia_shutdown(attrs)
+        handler = self.__request_handlers.get(name)
+        if handler is None:
+            self._reply_fragments().append("<" + name + ">")
         else:
-            self._reply += "<" + name + ">"
+            self._reply_fragments().append(handler(self, attrs))
 
     def _handle_end_element(self, name):
         """
@@ -446,9 +496,12 @@ class RCIHandler(PresentationBase):
 
         Keyword arguments:
             name -- the name of the end element
+
+        Appends the closing fragment for this element to
+        self._reply_fragments().
         """
 
-        self._reply += "</" + str(name) + ">"
+        self._reply_fragments().append("</" + str(name) + ">")
 
     def __do_channel_dump(self, attrs):
         """
@@ -465,7 +518,7 @@ class RCIHandler(PresentationBase):
 
         cdb = (self._core.get_service("channel_manager")
                 .channel_database_get())
-        device_string.write(self.__generate_channel_database(cdb))
+        device_string.write(self.__generate_channel_database_cached(cdb))
 
         return device_string.getvalue()
 
@@ -960,6 +1013,35 @@ class RCIHandler(PresentationBase):
                                              name_driver_pairs))
 
 
+    def __do_import_report(self, attrs):
+        """
+        Build a response for an 'import_report' request.
+
+        Keyword arguments:
+            attrs -- Dictionary of attributes. May have 'count', the
+                     number of modules to report.
+        """
+        try:
+            records = self._core.get_service("import_profiler").records()
+        except CoreServiceNotFound:
+            records = []
+
+        if 'count' in attrs:
+            try:
+                records = records[:int(attrs['count'])]
+            except ValueError:
+                return ('<import_report><error>Invalid count: %s</error>'
+                        % attrs['count'])
+
+        response = StringIO()
+        response.write('<import_report>')
+        for module, total, own, memory in records:
+            if memory is None:
+                memory = ''
+            response.write('<module name="%s" total="%.3f" self="%.3f" '
+                           'memory="%s" />' % (module, total, own, memory))
+        return response.getvalue()
+
     def __do_dia_shutdown(self, attrs):
         """
         Build a response for a 'shutdown' request.
@@ -975,45 +1057,150 @@ class RCIHandler(PresentationBase):
         return "<shutdown>"
 
 
-    def __generate_channel_database(self, cdb):
+    def __generate_channel_fragment(self, cdb, entry, channel_name):
+        """
+        Render the <channel .../> element of a single channel.
+        """
 
-        channel_list = cdb.channel_list()
+        try:
+            channel = cdb.channel_get(entry)
+            if (not (channel.perm_mask() & PERM_GET) or
+                channel.options_mask() & OPT_DONOTDUMPDATA):
+                raise Exception
+            sample = channel.get()
+            value = self.__escape_entities(sample.value)
+            units = sample.unit
+            timestamp = time.asctime(time.localtime(sample.timestamp))
+            type_name = str(channel.type().__name__)
+        except Exception, e:
+            value, units, timestamp, type_name = "(N/A)", "", "", ""
+
+        return ('<channel name="%s" value="%s"'
+                ' units="%s" timestamp="%s"'
+                ' type="%s"/>' % (channel_name, value, units,
+                                  timestamp, type_name))
+
+    def __generate_layout(self, channel_list):
+        """
+        Group a list of channel names by device.
+
+        Returns a sorted list of (device, [(entry, channel_name), ...]).
+        """
+
+        channel_list = list(channel_list)
         channel_list.sort()
 
         devices = {}
-
         for entry in channel_list:
             device, channel_name = entry.split('.')
-            channel = cdb.channel_get(entry)
-
             if not devices.has_key(device):
                 devices[device] = []
+            devices[device].append((entry, channel_name))
 
-            try:
-                if (not (channel.perm_mask() & PERM_GET) or
-                    channel.options_mask() & OPT_DONOTDUMPDATA):
-                    raise Exception
-                sample = channel.get()
-                devices[device].append((channel_name,
-                                        sample.value,
-                                        sample.unit,
-                                        time.asctime(
-                                                     time.localtime
-                                                     (sample.timestamp)),
-                                        str(channel.type().__name__)))
-            except Exception, e:
-                devices[device].append((channel_name, "(N/A)", "", "", ""))
+        layout = devices.items()
+        layout.sort()
 
-        device_string = StringIO()
+        return layout
 
-        for device in devices.keys():
-            device_string.write('<device name="%s">' % device)
-            for channel in devices[device]:
-                value = self.__escape_entities(channel[1])
-                device_string.write('<channel name="%s" value="%s"'
-                    ' units="%s" timestamp="%s"'
-                    ' type="%s"/>' % (channel[0], value, channel[2],
-                                        channel[3], channel[4]))
-            device_string.write('</device>')
+    def __generate_channel_database(self, cdb):
 
-        return device_string.getvalue()
+        out = []
+        for device, channels in self.__generate_layout(cdb.channel_list()):
+            out.append('<device name="%s">' % device)
+            for entry, channel_name in channels:
+                out.append(self.__generate_channel_fragment(cdb, entry,
+                                                            channel_name))
+            out.append('</device>')
+
+        return ''.join(out)
+
+    def __generate_channel_database_cached(self, cdb):
+        """
+        Same as __generate_channel_database() for the live channel
+        database, re-using the fragments of channels which still hold
+        the sample of the previous dump.
+
+        Device properties keep the same sample object until a new one
+        is set, so a fragment is valid as long as the channel returns
+        the sample it was rendered from, with the same timestamp.
+        Nothing is done when samples are published.
+        """
+
+        channel_list = cdb.channel_list()
+
+        self.__dump_lock.acquire()
+        try:
+            layout = self.__dump_layout
+            if layout is None or self.__dump_channel_list != channel_list:
+                # a channel was added or removed:
+                layout = self.__generate_layout(channel_list)
+                self.__dump_layout = layout
+                self.__dump_channel_list = channel_list
+                for entry in self.__dump_fragments.keys():
+                    if not cdb.channel_exists(entry):
+                        del self.__dump_fragments[entry]
+            fragments = self.__dump_fragments.copy()
+        finally:
+            self.__dump_lock.release()
+
+        out = []
+        rendered = []
+        for device, channels in layout:
+            out.append('<device name="%s">' % device)
+            for entry, channel_name in channels:
+                try:
+                    sample = cdb.channel_get(entry).get()
+                except Exception:
+                    # rendered as "(N/A)", not cached
+                    sample = None
+                cached = fragments.get(entry)
+                if (sample is not None and cached is not None and
+                    cached[0] is sample and cached[1] == sample.timestamp):
+                    fragment = cached[2]
+                else:
+                    fragment = self.__generate_channel_fragment(cdb, entry,
+                                                                channel_name)
+                    if sample is not None:
+                        rendered.append((entry, (sample, sample.timestamp,
+                                                 fragment)))
+                out.append(fragment)
+            out.append('</device>')
+
+        if rendered:
+            self.__dump_lock.acquire()
+            try:
+                for entry, cached in rendered:
+                    self.__dump_fragments[entry] = cached
+            finally:
+                self.__dump_lock.release()
+
+        return ''.join(out)
+
+    def __dump_flush(self):
+        self.__dump_lock.acquire()
+        try:
+            self.__dump_fragments.clear()
+            self.__dump_layout = None
+            self.__dump_channel_list = None
+        finally:
+            self.__dump_lock.release()
+
+    # request element name -> handler, see _handle_start_element():
+    __request_handlers = {
+        "channel_dump": __do_channel_dump,
+        "channel_get": __do_channel_get,
+        "channel_set": __do_channel_set,
+        "channel_refresh": __do_channel_refresh,
+        "channel_info": __do_channel_info,
+        "logger_list": __do_logger_list,
+        "logger_set": __do_logger_set,
+        "logger_dump": __do_logger_dump,
+        "logger_next": __do_logger_next,
+        "logger_prev": __do_logger_prev,
+        "logger_rewind": __do_logger_rewind,
+        "logger_seek": __do_logger_seek,
+        "logger_pos": __do_logger_pos,
+        "device_dump": __do_device_dump,
+        "import_report": __do_import_report,
+        "shutdown": __do_dia_shutdown,
+    }
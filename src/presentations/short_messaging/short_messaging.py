@@ -91,7 +91,7 @@ iDigi SMS, iDigi Iridium, regular SMS or regular Iridium.
 
 # imports
 import digitime
-import copy
+import heapq
 import threading
 
 from settings.settings_base import SettingsBase, Setting
@@ -108,6 +108,20 @@ from common.shutdown import SHUTDOWN_WAIT
 
 # constants
 
+# name the channel value is bound to in compiled alarm conditions:
+CONDITION_VALUE_NAME = '__c__'
+
+# what each '%c' escape is replaced with in compiled alarm conditions,
+# parenthesized and spaced so it never merges with adjacent tokens:
+CONDITION_VALUE_TOKEN = ' (%s) ' % CONDITION_VALUE_NAME
+
+# whether a character next to a '%c' escape would extend the value's token:
+CONDITION_TOKEN_CHAR = lambda c: c != '' and (c.isalnum() or c in '_.')
+
+# types whose str() may be replaced by the value itself when evaluating
+# an alarm condition, floats being first rounded as str() does:
+CONDITION_NATIVE_TYPES = (bool, int, long, float)
+
 # exception classes
 
 # interface functions
@@ -122,6 +136,12 @@ class ShortMessaging(PresentationBase, threading.Thread):
         from core.tracing import get_tracer
         self.__tracer = get_tracer(name)
 
+        # Rules compiled from the 'updates' and 'alarms' settings by
+        # apply_settings(): rules with a literal filter are indexed by
+        # channel name, the others are matched by wild_match().
+        self.__exact_rules = {}
+        self.__wild_rules = []
+
         settings_list = [
             Setting(
                 name = "SMS", type = dict, required = False,
@@ -149,14 +169,23 @@ class ShortMessaging(PresentationBase, threading.Thread):
         # Our cached list of clients.
         self.client_list = []
 
-        # The list of DIA channels that have matched our filters and so we have
-        # subscribed to getting channel updates from DIA as they come in.
-        self.__channels_being_watched = []
+        # Our cached clients, by name.
+        self.__clients_by_name = {}
 
-        # The following list will contain a list of messages that should
-        # be sent out at the next interval time.
+        # The DIA channels that have matched our filters and so we have
+        # subscribed to getting channel updates from DIA as they come in,
+        # channel name -> list of matched filters.
+        self.__channels_being_watched = {}
 
-        self.__coalesce_list = []
+        # The update messages that should be sent out at the next interval
+        # time, bucketed by interval:
+        # interval -> { (channel name, id(filter)): entry }
+        self.__coalesce_buckets = {}
+        # The keys of these entries ordered by due time, as a heap of
+        # (due time, sequence, interval, key), each key appearing once:
+        self.__coalesce_due = []
+        self.__coalesce_sequence = 0
+        self.__coalesce_lock = threading.Lock()
 
         self.__stopevent = threading.Event()
         threading.Thread.__init__(self, name = name)
@@ -208,10 +237,61 @@ class ShortMessaging(PresentationBase, threading.Thread):
             del accepted['alarms']
             return (accepted, rejected, not_found)
 
+        try:
+            rules = self.__compile_rules(updates_list, alarms_list)
+        except SyntaxError, e:
+            self.__tracer.error("Invalid alarm condition: %s", str(e))
+            rejected['alarms'] = accepted['alarms']
+            del accepted['alarms']
+            return (accepted, rejected, not_found)
+
         SettingsBase.commit_settings(self, accepted)
+        self.__exact_rules, self.__wild_rules = rules
         return (accepted, rejected, not_found)
 
 
+    def __compile_rules(self, updates_list, alarms_list):
+        """\
+            Compile the updates and alarms lists into rules.
+            Returns a tuple of the rules indexed by literal filter and the
+            list of rules whose filter holds wildcards.
+        """
+        exact_rules = {}
+        wild_rules = []
+
+        for update_type, entry_list in [ ("updates", updates_list),
+                                         ("alarms", alarms_list) ]:
+            for entry in entry_list:
+
+                if 'settings' not in entry or entry['settings'] == None:
+                    continue
+
+                settings = entry['settings']
+                if 'filter' not in settings:
+                    continue
+
+                if update_type == "updates":
+                    rule = dict(type      = update_type,
+                                filter    = settings['filter'],
+                                clients   = settings['clients'],
+                                interval  = settings['interval'],
+                                condition = None)
+                else:
+                    rule = dict(type      = update_type,
+                                filter    = settings['filter'],
+                                clients   = settings['clients'],
+                                interval  = 0,
+                                condition = AlarmCondition(
+                                                settings['condition']))
+
+                if '*' in rule['filter'] or '?' in rule['filter']:
+                    wild_rules.append(rule)
+                else:
+                    exact_rules.setdefault(rule['filter'], []).append(rule)
+
+        return (exact_rules, wild_rules)
+
+
     def start(self):
         """\
             Start the Short Messaging Presentation instance.
@@ -267,6 +347,9 @@ class ShortMessaging(PresentationBase, threading.Thread):
             client_list = []
 
         self.client_list = self.__allocate_clients(client_list)
+        self.__clients_by_name = {}
+        for client in self.client_list:
+            self.__clients_by_name.setdefault(client.name(), client)
 
         # Tell each client to announce that we are running.
         # This allows each client to send notification out (if desired)
@@ -287,8 +370,8 @@ class ShortMessaging(PresentationBase, threading.Thread):
             filters = self.__match_filter(channel)
             if filters != None and len(filters) > 0:
                 cp.subscribe(channel, self.receive)
-                data = dict(channel = channel, filters = filters)
-                self.__add_new_channel_to_channels_being_watched(data)
+                self.__add_new_channel_to_channels_being_watched(channel,
+                                                                 filters)
         threading.Thread.start(self)
         return True
 
@@ -304,10 +387,11 @@ class ShortMessaging(PresentationBase, threading.Thread):
         """
         # Create a shorthand list of our stored clients, along with any
         # stored messages we want to send to each client.
-        client_message_list = []
+        client_message_list = {}
         for client in self.client_list:
-            e = dict(name = client.name(), client = client, message_list = [])
-            client_message_list.append(e)
+            if client.name() not in client_message_list:
+                client_message_list[client.name()] = \
+                    dict(client = client, message_list = [])
 
         wait_time = SHUTDOWN_WAIT
         while not self.__stopevent.isSet():
@@ -326,53 +410,37 @@ class ShortMessaging(PresentationBase, threading.Thread):
 
                 #self.__tracer.info("ShortMessaging: Len of Watched List: %d", \
                 #       len(self.__channels_being_watched))
-                #for entry in self.__channels_being_watched:
-                #    for filter in entry['filters']:
-                #        self.__print_statistics(entry['channel'], filter)
-
-                #self.__tracer. "ShortMessaging: Len of Coalesce List: %d", \
-                #       len(self.__coalesce_list))
-                #for entry in self.__coalesce_list:
-                #    self.__print_statistics(entry['channel'], entry['filter'])
+                #for channel, filters in self.__channels_being_watched.items():
+                #    for filter in filters:
+                #        self.__print_statistics(channel, filter)
 
-                for entry in copy.copy(self.__coalesce_list):
+                for entry in self.__pop_due_coalesced(current_time):
                     filter = entry['filter']
                     messages = entry['messages']
-                    interval = filter['interval'] * 60
-                    last = filter['last_sent']
 
-                    # See if the time is up, and that we need to send
-                    # a new update.
-                    if (last + interval) < current_time:
+                    self.__tracer.info("Past Time, Should Send!")
 
-                        self.__tracer.info("Past Time, Should Send!")
+                    for message in messages:
 
-                        for message in messages:
-
-                            # Find the correct client entry.
-                            for client in client_message_list:
-                                if message['client'] == client['name']:
-                                    break
-                            else:
-                                self.__tracer.warning("Run: Unable to find " \
-                                      "Client in Client List")
-                                continue
-
-                            # Add message to the list of messages we should
-                            # send to this client.
-                            client['message_list'].append(message['message'])
+                        # Find the correct client entry.
+                        client = client_message_list.get(message['client'])
+                        if client is None:
+                            self.__tracer.warning("Run: Unable to find " \
+                                  "Client in Client List")
+                            continue
 
-                            # Bump our filter's total sent value.
-                            filter['total_sent'] += 1
+                        # Add message to the list of messages we should
+                        # send to this client.
+                        client['message_list'].append(message['message'])
 
-                        # Bump our filter's last sent value to the current time
-                        filter['last_sent'] = current_time
+                        # Bump our filter's total sent value.
+                        filter['total_sent'] += 1
 
-                        # Finally, remove entry from our list.
-                        self.__coalesce_list.remove(entry)
+                    # Bump our filter's last sent value to the current time
+                    filter['last_sent'] = current_time
 
                 # Walk each client in our message list cache
-                for client in client_message_list:
+                for client in client_message_list.itervalues():
 
                     # Check to see if the client has any data that needs
                     # to be sent.
@@ -402,15 +470,14 @@ class ShortMessaging(PresentationBase, threading.Thread):
             cm = self.__core.get_service("channel_manager")
             cp = cm.channel_publisher_get()
             cp.subscribe(channel, self.receive)
-            data = dict(channel = channel, filters = filters)
-            self.__add_new_channel_to_channels_being_watched(data)
+            self.__add_new_channel_to_channels_being_watched(channel, filters)
 
 
-    def __add_new_channel_to_channels_being_watched(self, data):
+    def __add_new_channel_to_channels_being_watched(self, channel, filters):
         """\
-            Add a new channel to our list of channels that are being watched.
+            Add a new channel to our channels that are being watched.
         """
-        self.__channels_being_watched.append(data)
+        self.__channels_being_watched[channel] = filters
 
 
     def receive(self, channel):
@@ -433,62 +500,26 @@ class ShortMessaging(PresentationBase, threading.Thread):
         """
         current_time = digitime.time()
 
-        filters = []
-        for update_type in [ "updates", "alarms" ]:
-
-            # Get our updates and alarms list.
-            #
-            # Because of the way DIA requires defining a list in its
-            # configuration file, the get_setting() call below will first
-            # return this value in a dictionary with the actual updates and
-            # alarms list stored under the key name of 'instance_list'.
-            entry_list = SettingsBase.get_setting(self, update_type)
-
-            # It's possible the user doesn't have any of the given type set up.
-            # This is fine, and we should just continue to the next type.
-            if len(entry_list) == 0:
-                continue
-
-            try:
-                entry_list = entry_list['instance_list']
-            except Exception, e:
-                self.__tracer.error("Exception trying to get instance_list: %s", \
-                       str(e))
-                continue
-
-            for entry in entry_list:
+        rules = list(self.__exact_rules.get(channel, []))
+        for rule in self.__wild_rules:
+            if wild_match(rule['filter'], channel) == True:
+                rules.append(rule)
 
-                if 'settings' not in entry or entry['settings'] == None:
-                    continue
+        filters = []
+        for rule in rules:
+            self.__tracer.info("Match (%s) Filter of %s and DIA channel name of %s", \
+                        rule['type'], rule['filter'], channel)
+
+            # Each matching channel keeps its own sending statistics.
+            data = dict(rule)
+            data['synched'] = False
+            data['total_sent'] = 0
+            if rule['type'] == "updates":
+                data['last_sent'] = current_time
+            else:
+                data['last_sent'] = 0.0
 
-                settings = entry['settings']
-                if 'filter' in settings:
-
-                    # If this filter matches something we care about,
-                    # add it to our list.
-                    if wild_match(settings['filter'], channel) == True:
-                        self.__tracer.info("Match (%s) Filter of %s and DIA channel name of %s", \
-                                    update_type, settings['filter'], channel)
-                        if update_type == "updates":
-                            data = dict(type           = update_type,
-                                        filter         = settings['filter'],
-                                        clients        = settings['clients'],
-                                        interval       = settings['interval'],
-                                        condition      = None,
-                                        synched        = False,
-                                        total_sent     = 0,
-                                        last_sent      = current_time)
-                        else:
-                            data = dict(type           = update_type,
-                                        filter         = settings['filter'],
-                                        clients        = settings['clients'],
-                                        interval       = 0,
-                                        condition      = settings['condition'],
-                                        synched        = False,
-                                        total_sent     = 0,
-                                        last_sent       = 0.0)
-
-                        filters.append(data)
+            filters.append(data)
 
         return filters
 
@@ -500,14 +531,12 @@ class ShortMessaging(PresentationBase, threading.Thread):
             notifications as needed.
         """
 
-        for entry in self.__channels_being_watched:
+        filters = self.__channels_being_watched.get(channel.name())
+        if filters:
+            self.__send_message_based_on_filter_entry(channel, filters)
 
-            # If the channel matches, walk through each filter we have stored.
-            if channel.name() == entry['channel']:
-                self.__send_message_based_on_filter_entry(channel, entry)
 
-
-    def __send_message_based_on_filter_entry(self, channel, entry):
+    def __send_message_based_on_filter_entry(self, channel, filters):
         """\
             This function will determine if the supplied channel is one that
             we are watching, and if so, it will initiate sending
@@ -516,7 +545,7 @@ class ShortMessaging(PresentationBase, threading.Thread):
         cm = self.__core.get_service("channel_manager")
         cdb = cm.channel_database_get()
 
-        for filter in entry['filters']:
+        for filter in filters:
 
             message_list = []
 
@@ -526,11 +555,7 @@ class ShortMessaging(PresentationBase, threading.Thread):
                 enabled = None
 
                 # Find the correct client entry.
-                for client in self.client_list:
-                    if send_to_client == client.name():
-                        break
-                else:
-                    continue
+                client = self.__clients_by_name.get(send_to_client)
 
                 if client == None:
                     self.__tracer.warning("Unable to find Client in Client List")
@@ -577,8 +602,7 @@ class ShortMessaging(PresentationBase, threading.Thread):
 
                         # Check to see if the condition has been met...
                         try:
-                            ret = self.__check_for_alarm_condition(channel,
-                                                         filter['condition'])
+                            ret = filter['condition'].evaluate(channel)
                             if ret == True:
                                 tmp_message_list = []
                                 tmp_message = client.create_alarm_message(channel)
@@ -617,9 +641,9 @@ class ShortMessaging(PresentationBase, threading.Thread):
             time, so that we can combine as much data as we can into
             as few SMS/Satellite/Iridium packets as possible.
 
-            To do that, the idea is to walk through our existing list,
-            find a filter that has our same interval rate, and set our
-            "last sent" value to be the same, thus synching them together.
+            To do that, the idea is to look for a filter that has our same
+            interval rate, and set our "last sent" value to be the same,
+            thus synching them together.
 
             If that doesn't work, we should also try doing a modulo of the
             interval rates, because we still might be able to synch up
@@ -627,93 +651,94 @@ class ShortMessaging(PresentationBase, threading.Thread):
             of the time
 
         """
+        filter = data['filter']
+        interval = filter['interval']
+        key = (data['channel'], id(filter))
 
-        # Scan the coalesce list and see if our filter is already there
-        # If it is, remove it.
-        for entry in copy.copy(self.__coalesce_list):
-            if entry['channel'] == data['channel'] and \
-               entry['filter'] == data['filter']:
-                self.__coalesce_list.remove(entry)
+        self.__coalesce_lock.acquire()
+        try:
+            buckets = self.__coalesce_buckets
 
-        # Now attempt to try to synch our update to
-        # get it to be sent in with other samples.
-        filter = data['filter']
-        if filter['type'] == "updates" and filter['synched'] == False:
+            # Any older update of our filter is made obsolete by this one.
+            bucket = buckets.get(interval)
+            replaced = None
+            if bucket is not None:
+                replaced = bucket.pop(key, None)
 
-            for existing_filter in self.__coalesce_list:
+            # Now attempt to try to synch our update to
+            # get it to be sent in with other samples.
+            if filter['type'] == "updates" and filter['synched'] == False:
 
                 # If we find an existing filter that has the same
                 # interval rate as the one we want to use, then
                 # we want to "synch" these 2 together, so that
                 # they both want to report their updates at the same
                 # time.
-                if filter['interval'] == existing_filter['filter']['interval']:
-                    filter['last_sent'] = existing_filter['filter']['last_sent']
-                    filter['synched'] = True
-                    break
-            else:
-
-                # If we didn't find another filter that has the same
-                # interval rate, lets try to see if we can find a filter
-                # that has at least a modulo of our interval.
-
-                for existing_filter in self.__coalesce_list:
-
-                    if filter['interval'] % existing_filter['filter']['interval'] == 0:
-                        # We found an existing filter that has a modulo
-                        # interval rate as the one we want to use.
-                        # We now want to "synch" these 2 together, so that
-                        # our new filter will want to report its updates
-                        filter['last_sent'] = existing_filter['filter']['last_sent']
-                        filter['synched'] = True
-                        break
+                if bucket:
+                    existing = bucket.itervalues().next()
+                    filter['last_sent'] = existing['filter']['last_sent']
                 else:
-                    filter['synched'] = True
-
-
-        # Add the new entry to our list.
-        self.__coalesce_list.append(data)
 
-
-    def __check_for_alarm_condition(self, channel, condition):
+                    # If we didn't find another filter that has the same
+                    # interval rate, lets try to see if we can find a filter
+                    # that has at least a modulo of our interval.
+                    for existing_interval in buckets:
+                        if (existing_interval and buckets[existing_interval]
+                            and interval % existing_interval == 0):
+                            existing = \
+                                buckets[existing_interval].itervalues().next()
+                            filter['last_sent'] = \
+                                existing['filter']['last_sent']
+                            break
+
+                filter['synched'] = True
+
+            # Add the new entry to our list, and index its key by due
+            # time if it is not already: an entry replacing another one
+            # takes its place in the heap.
+            if bucket is None:
+                bucket = buckets[interval] = {}
+            if replaced is None:
+                self.__coalesce_sequence += 1
+                heapq.heappush(self.__coalesce_due,
+                    (filter['last_sent'] + interval * 60,
+                     self.__coalesce_sequence, interval, key))
+            bucket[key] = data
+        finally:
+            self.__coalesce_lock.release()
+
+
+    def __pop_due_coalesced(self, current_time):
         """\
-            Given a channel structure and a condition string,
-            decide whether an alarm condition has been triggerd.
-            Returns True of False
+            Removes and returns the coalesced updates whose interval has
+            elapsed.
         """
-        condition_string = ""
-        escape = False
-        for i in condition:
-            if escape == True and i == 'c':
-                condition_string += str(channel.get().value)
-                escape = False
-            elif i == '%':
-                # If we are already in escaped mode, then the previous
-                # escape was not used.
-                # Reinsert the previous escape into the stream, and keep
-                # ourselves in escape mode for the next character.
-                if escape == True:
-                    condition_string += '%'
-                escape = True
-            else:
-                # If we are in escaped mode, and we get an escape
-                # character that we don't recognize, make sure
-                # we put back the escape character into our stream.
-                if escape == True:
-                    escape = False
-                    condition_string += '%'
-                condition_string += i
+        due = []
 
-        # If user had the last character as an escape character,
-        # then we should reinsert said escape character into the
-        # stream, as it is unused for our parsing.
-        if escape == True:
-            condition_string += '%'
+        self.__coalesce_lock.acquire()
+        try:
+            heap = self.__coalesce_due
+            buckets = self.__coalesce_buckets
+            while heap and heap[0][0] < current_time:
+                due_time, sequence, interval, key = heapq.heappop(heap)
+                bucket = buckets[interval]
+                entry = bucket[key]
+
+                # The filter may have been sent since the entry was
+                # queued, see if the time is still up.
+                due_time = entry['filter']['last_sent'] + interval * 60
+                if due_time >= current_time:
+                    heapq.heappush(heap, (due_time, sequence, interval, key))
+                    continue
+
+                due.append(entry)
+                del bucket[key]
+                if not bucket:
+                    del buckets[interval]
+        finally:
+            self.__coalesce_lock.release()
 
-        #self.__tracer.info("ShortMessaging: condition: ", condition_string)
-        value = eval(condition_string)
-        #self.__tracer.info("ShortMessaging: result: ", value)
-        return value
+        return due
 
 
     def __print_statistics(self, channel, filter):
@@ -993,3 +1018,93 @@ class ShortMessaging(PresentationBase, threading.Thread):
                     return False
         
         return True
+
+
+class AlarmCondition:
+    """\
+        An alarm condition, compiled once from its setting string.
+
+        Occurrences of '%c' in the condition stand for the value of the
+        channel being checked.  When the value is a number or a bool and
+        '%c' does not appear inside a string literal, the condition is
+        evaluated from a code object with the value bound to a variable,
+        a float being first rounded to its str() form so comparisons give
+        the same result as on the text.  Otherwise the value is formatted
+        into the condition text which is then evaluated, as it always has
+        been.
+    """
+
+    def __init__(self, condition):
+        self.condition = condition
+
+        # Split the condition around the '%c' escapes:
+        parts = []
+        current = ""
+        escape = False
+        for i in condition:
+            if escape == True and i == 'c':
+                parts.append(current)
+                current = ""
+                escape = False
+            elif i == '%':
+                # If we are already in escaped mode, then the previous
+                # escape was not used.
+                # Reinsert the previous escape into the stream, and keep
+                # ourselves in escape mode for the next character.
+                if escape == True:
+                    current += '%'
+                escape = True
+            else:
+                # If we are in escaped mode, and we get an escape
+                # character that we don't recognize, make sure
+                # we put back the escape character into our stream.
+                if escape == True:
+                    escape = False
+                    current += '%'
+                current += i
+
+        # If user had the last character as an escape character,
+        # then we should reinsert said escape character into the
+        # stream, as it is unused for our parsing.
+        if escape == True:
+            current += '%'
+        parts.append(current)
+
+        self.__parts = parts
+        self.__code = None
+
+        # A quote before an escape means it may sit in a string literal,
+        # a name or number character next to an escape means the value
+        # is pasted into a longer token ('1%c' is 10 for 0), and a power
+        # after an escape binds tighter than the sign of a negative value
+        # ('%c**2' is -4 for -2):
+        textual = False
+        prefix = ""
+        for i in range(len(parts) - 1):
+            prefix += parts[i]
+            if prefix.count('"') % 2 or prefix.count("'") % 2 or \
+                   CONDITION_TOKEN_CHAR(parts[i][-1:]) or \
+                   CONDITION_TOKEN_CHAR(parts[i + 1][:1]) or \
+                   parts[i + 1].lstrip()[:2] == '**':
+                textual = True
+                break
+        if not textual:
+            self.__code = compile(
+                CONDITION_VALUE_TOKEN.join(parts).strip(),
+                '<alarm condition>', 'eval')
+
+    def evaluate(self, channel):
+        """\
+            Decide whether the alarm condition is met for the current
+            value of the given channel.
+            Returns True or False
+        """
+        value = channel.get().value
+
+        if self.__code is not None and \
+               type(value) in CONDITION_NATIVE_TYPES:
+            if type(value) is float:
+                value = float(str(value))
+            return eval(self.__code, {}, { CONDITION_VALUE_NAME: value })
+
+        return eval(str(value).join(self.__parts))
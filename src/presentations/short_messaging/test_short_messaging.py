@@ -0,0 +1,148 @@
+# $Id$
+"""
+    Unit tests for the alarm conditions and the coalescing of update
+    messages of the short messaging presentation.
+
+    usage: python test_short_messaging.py
+"""
+
+import os
+import sys
+import unittest
+
+# src, where presentations are, and lib, where digitime is
+_src_dir = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, _src_dir)
+sys.path.insert(0, os.path.join(os.path.dirname(_src_dir), 'lib'))
+
+from settings.settings_base import SettingsBase
+from samples.sample import Sample
+from presentations.short_messaging.short_messaging import \
+    AlarmCondition, ShortMessaging
+
+class FakeChannel:
+    def __init__(self, value):
+        self.sample = Sample(0, value)
+
+    def get(self):
+        return self.sample
+
+class AlarmConditionTest(unittest.TestCase):
+
+    def assertCondition(self, condition, value, expected):
+        self.assertEqual(
+            bool(AlarmCondition(condition).evaluate(FakeChannel(value))),
+            expected)
+
+    def test_spaced(self):
+        self.assertCondition('%c > 3', 5, True)
+        self.assertCondition('%c > 3', 2, False)
+        self.assertCondition('%c == True', True, True)
+
+    def test_adjacent_tokens(self):
+        # The value is pasted into the neighbouring token, as in the text:
+        self.assertCondition('%c5>3', 1, True)
+        self.assertCondition('%c5>20', 1, False)
+        self.assertCondition('1%c', 0, True)
+        self.assertCondition('1%c>10', 0, False)
+        self.assertCondition('1%c>10', 5, True)
+        self.assertCondition('%c0>30', 5, True)
+        self.assertCondition('%c.5>1', 1, True)
+
+    def test_adjacent_operators(self):
+        self.assertCondition('%c>3', 5, True)
+        self.assertCondition('-%c>0', -2, True)
+        self.assertCondition('(%c)>3', 2, False)
+        self.assertCondition('%c>3 and %c<10', 5, True)
+
+    def test_same_result_as_text(self):
+        # Compiled conditions must agree with the value formatted in:
+        for condition in ('%c5>3', '1%c>10', '%c>3 and %c<10', '%c % 2 == 0',
+                          '%c*%c>20', '2**%c>8', '-%c<0', '%c-1>0',
+                          '%c**2 > 3', '%c == 0.3', '%c < 0.00001',
+                          '%c * 3 == 0.9'):
+            for value in (0, 1, 3, 5, 12, 2.5, -2, -2.5, 0.1 + 0.2,
+                          1e-05, 0.30000000001, 1.0 / 3):
+                self.assertEqual(
+                    AlarmCondition(condition).evaluate(FakeChannel(value)),
+                    eval(str(value).join(condition.split('%c'))),
+                    '%s with %r' % (condition, value))
+
+    def test_quoted_value(self):
+        self.assertCondition('"%c" == "on"', 'on', True)
+        self.assertCondition('"%c" == "on"', 'off', False)
+
+class CoalesceTest(unittest.TestCase):
+
+    instances = 0
+
+    def setUp(self):
+        # Settings are bound by name, so each test gets its own instance.
+        CoalesceTest.instances += 1
+        name = 'sms%d' % CoalesceTest.instances
+        SettingsBase._settings_global_pending_registry.setdefault(
+            'presentations', {})['instance_list'] = [
+            { 'name': name, 'settings': { 'clients':
+                                          { 'instance_list': [] } } } ]
+        self.presentation = ShortMessaging(name, None)
+
+    def add(self, channel, filter):
+        entry = dict(channel = channel, filter = filter, messages = [channel])
+        self.presentation._ShortMessaging__add_to_coalesce_list(entry)
+        return entry
+
+    def pop(self, current_time):
+        return self.presentation._ShortMessaging__pop_due_coalesced(
+            current_time)
+
+    def filter(self, interval, last_sent):
+        return dict(type = 'updates', synched = True, interval = interval,
+                    last_sent = last_sent)
+
+    def test_due_order(self):
+        late = self.add('late', self.filter(2, 0.0))
+        early = self.add('early', self.filter(1, 30.0))
+        self.assertEqual(self.pop(60.0), [])
+        self.assertEqual(self.pop(91.0), [early])
+        self.assertEqual(self.pop(121.0), [late])
+        self.assertEqual(self.pop(1000.0), [])
+
+    def test_replaced_entry(self):
+        filter = self.filter(1, 0.0)
+        self.add('a', filter)
+        newer = self.add('a', filter)
+        self.assertEqual(self.pop(61.0), [newer])
+        self.assertEqual(self.pop(1000.0), [])
+
+    def test_replaced_entries_not_kept(self):
+        filter = self.filter(1, 0.0)
+        for i in range(100):
+            newest = self.add('a', filter)
+        self.add('b', filter)
+        self.assertEqual(
+            len(self.presentation._ShortMessaging__coalesce_due), 2)
+        due = self.pop(61.0)
+        self.assertEqual(len(due), 2)
+        self.failUnless(newest in due)
+        self.assertEqual(self.presentation._ShortMessaging__coalesce_due, [])
+
+    def test_sent_since_queued(self):
+        filter = self.filter(1, 0.0)
+        entry = self.add('a', filter)
+        filter['last_sent'] = 50.0
+        self.assertEqual(self.pop(61.0), [])
+        self.assertEqual(self.pop(111.0), [entry])
+
+    def test_synched_filters(self):
+        first = self.filter(1, 10.0)
+        second = self.filter(1, 40.0)
+        second['synched'] = False
+        a = self.add('a', first)
+        b = self.add('b', second)
+        self.assertEqual(second['last_sent'], 10.0)
+        due = self.pop(71.0)
+        self.assertEqual(len(due), 2)
+        self.failUnless(a in due and b in due)
+
+if __name__ == '__main__':
+    unittest.main()
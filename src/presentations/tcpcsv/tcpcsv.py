@@ -28,13 +28,43 @@
 """
 TCPCSV Presentation
 
+Emits channel samples as CSV rows (``channel_name,timestamp,value,unit``)
+over TCP.
+
+Two modes of operation are available:
+
+* **interval** (default): connect to `server`:`port` and send a row for
+  every channel each `interval` seconds.
+* **stream**: subscribe to the channel publisher and send a row only
+  when a channel receives a new sample.  Several peers may be served at
+  once: `server`:`port` and the `servers` list are connected to (and
+  reconnected when lost), and if `listen_port` is given, clients may
+  also connect in.  All peers are served from one select() loop; each
+  peer has a send buffer bounded by `buffer_size` bytes.  When a peer
+  does not keep up, its rows are either coalesced to the latest sample
+  per channel (`slow_consumer: coalesce`) or dropped
+  (`slow_consumer: drop`).  A snapshot of all channels is sent to every
+  peer when it connects.
+
+**Sample Config**::
+
+    presentations:
+      - name: tcpcsv
+        driver: presentations.tcpcsv.tcpcsv:TCPCSV
+        settings:
+            mode: stream
+            servers: [ "historian.example.com:4000" ]
+            listen_port: 4001
+
 """
 
 # imports
 import threading
 import digitime
 import time
+import errno
 from StringIO import StringIO
+from select import select
 from socket import *
 
 from settings.settings_base import SettingsBase, Setting
@@ -49,6 +79,14 @@ RECONNECT_DELAY = 10.0
 STATE_NOTCONNECTED = 0x0
 STATE_CONNECTED    = 0x1
 
+MODE_INTERVAL = 'interval'
+MODE_STREAM = 'stream'
+
+SLOW_COALESCE = 'coalesce'
+SLOW_DROP = 'drop'
+
+RECV_SIZE = 4096
+
 # classes
 class TCPCSV(PresentationBase, threading.Thread):
     
@@ -69,27 +107,92 @@ class TCPCSV(PresentationBase, threading.Thread):
 		
         from core.tracing import get_tracer
         self.__tracer = get_tracer(name)
+
+        # stream mode state, see __run_stream():
+        self.__updates_lock = threading.Lock()
+        self.__updates = {}
+        self.__outer_sd = None
+        self.__inner_sd = None
         
         # Configuration Settings:
 
+        # mode: 'interval' or 'stream' (default: 'interval').
         # server: The IP address or hostname to connect to.
         # port: The TCP port number to connect to.
         # interval: How often (in seconds) to emit CSV data 
-        #    (default: 60 seconds).
+        #    (default: 60 seconds). Interval mode only.
         # channels: A list of channels to include in the data set. If this 
         #    setting is not given, all channels will be included.
+        # servers: Additional "host:port" peers to connect to. Stream
+        #    mode only.
+        # listen_port: TCP port accepting incoming peers, 0 disables
+        #    listening (default: 0). Stream mode only.
+        # buffer_size: Maximum number of bytes queued for one peer
+        #    (default: 16384). Stream mode only.
+        # slow_consumer: 'coalesce' or 'drop', what to do with rows for
+        #    a peer whose buffer is full (default: 'coalesce').
         settings_list = [
-                Setting(name="server", type=str, required=True),
-                Setting(name="port", type=int, required=True),
+                Setting(name="mode", type=str, required=False,
+                        default_value=MODE_INTERVAL,
+                        verify_function=lambda x: x in
+                            (MODE_INTERVAL, MODE_STREAM)),
+                Setting(name="server", type=str, required=False),
+                Setting(name="port", type=int, required=False),
                 Setting(name='interval', type=int, required=False, default_value=60),
                 Setting(name="channels", type=list, required=False, default_value=[]),
+                Setting(name="servers", type=list, required=False,
+                        default_value=[]),
+                Setting(name="listen_port", type=int, required=False,
+                        default_value=0,
+                        verify_function=lambda x: 0 <= x <= 65535),
+                Setting(name="buffer_size", type=int, required=False,
+                        default_value=16384,
+                        verify_function=lambda x: x > 0),
+                Setting(name="slow_consumer", type=str, required=False,
+                        default_value=SLOW_COALESCE,
+                        verify_function=lambda x: x in
+                            (SLOW_COALESCE, SLOW_DROP)),
         ]
                                                  
         PresentationBase.__init__(self, name=name, settings_list=settings_list)
 
         threading.Thread.__init__(self, name=name)
         threading.Thread.setDaemon(self, True)
-    
+
+    def apply_settings(self):
+
+        SettingsBase.merge_settings(self)
+        accepted, rejected, not_found = SettingsBase.verify_settings(self)
+
+        if len(rejected) or len(not_found):
+            self.__tracer.error("Settings rejected/not found: %s %s",
+                                rejected, not_found)
+            return (accepted, rejected, not_found)
+
+        if accepted['mode'] == MODE_INTERVAL:
+            for name in ('server', 'port'):
+                if accepted[name] is None:
+                    not_found[name] = "required item not given"
+        else:
+            for peer in accepted['servers']:
+                try:
+                    _parse_peer(peer)
+                except ValueError:
+                    rejected['servers'] = "invalid peer '%s'" % peer
+            if (accepted['server'] is None) != (accepted['port'] is None):
+                rejected['server'] = "server and port go together"
+            elif (accepted['server'] is None and not accepted['servers']
+                  and not accepted['listen_port']):
+                not_found['servers'] = "no peer to connect to or listen for"
+
+        if len(rejected) or len(not_found):
+            self.__tracer.error("Settings rejected/not found: %s %s",
+                                rejected, not_found)
+            return (accepted, rejected, not_found)
+
+        SettingsBase.commit_settings(self, accepted)
+
+        return (accepted, rejected, not_found)
     
     def start(self):
         threading.Thread.start(self)
@@ -97,9 +200,16 @@ class TCPCSV(PresentationBase, threading.Thread):
  
     def stop(self):
         self.__stopevent.set()
+        self.__wakeup()
         return True
 
     def run(self):
+        if SettingsBase.get_setting(self, "mode") == MODE_STREAM:
+            self.__run_stream()
+        else:
+            self.__run_interval()
+
+    def __run_interval(self):
         state = STATE_NOTCONNECTED
         sd = None
 
@@ -150,27 +260,389 @@ class TCPCSV(PresentationBase, threading.Thread):
         if len(channel_list) == 0:
             channel_list = cdb.channel_list()
 
+        for channel_name in channel_list:
+            row = self._format_row(cdb, channel_name)
+            if row is not None:
+                sio.write(row)
+
+    def _format_row(self, cdb, channel_name):
+        """
+        Format the current sample of a channel as one CSV row.
+
+        Returns None if the channel may not be dumped.
+        """
+
         # Each row of the CSV data is given as:
         #     channel_name,timestamp,value,unit``
         # where timestamp is adjusted to GMT and given in the format
         # ``YYYY-mm-dd HH:MM:SS`
 
-        for channel_name in channel_list:
+        try:
+            channel = cdb.channel_get(channel_name)
+            if not channel.perm_mask() & PERM_GET:
+                raise Exception, "Does not have GET permission"
+            elif channel.options_mask() & OPT_DONOTDUMPDATA:
+                raise Exception, "Do not dump option set on channel"
+            sample = channel.get()
+            row_data = (channel_name,
+                        time.strftime("%Y-%m-%d %H:%M:%S",
+                                time.gmtime(sample.timestamp)),
+                        sample.value,
+                        sample.unit)
+            row_data = map(lambda d: str(d), row_data)
+            return ','.join(row_data) + "\r\n"
+        except Exception, e:
+            self.__tracer.error("error formatting '%s': %s", \
+                    channel_name, str(e))
+
+        return None
+
+    ## Stream mode:
+    def __wakeup(self):
+        if self.__outer_sd is not None:
             try:
-                channel = cdb.channel_get(channel_name)
-                if not channel.perm_mask() & PERM_GET:
-                    raise Exception, "Does not have GET permission"
-                elif channel.options_mask() & OPT_DONOTDUMPDATA:
-                    raise Exception, "Do not dump option set on channel"
-                sample = channel.get()
-                row_data = (channel_name,
-                            time.strftime("%Y-%m-%d %H:%M:%S",
-                                    time.gmtime(sample.timestamp)),
-                            sample.value,
-                            sample.unit)
-                row_data = map(lambda d: str(d), row_data)
-                sio.write(','.join(row_data) + "\r\n")
-            except Exception, e:
-                self.__tracer.error("error formatting '%s': %s", \
-                        channel_name, str(e))
+                self.__outer_sd.send('a')
+            except error:
+                # wakeup already pending
                 pass
+
+    def __new_sample_cb(self, channel):
+        # Called from the channel publisher, the row is formatted here
+        # so that it reflects this very sample:
+        cdb = self.__core.get_service("channel_manager").\
+            channel_database_get()
+        channel_name = channel.name()
+        row = self._format_row(cdb, channel_name)
+        if row is None:
+            return
+
+        self.__updates_lock.acquire()
+        try:
+            wakeup = not self.__updates
+            # coalesce at the source if the loop is behind:
+            self.__updates[channel_name] = row
+        finally:
+            self.__updates_lock.release()
+
+        if wakeup:
+            self.__wakeup()
+
+    def __new_channel_cb(self, channel_name):
+        cp = self.__core.get_service("channel_manager").\
+            channel_publisher_get()
+        cp.subscribe(channel_name, self.__new_sample_cb)
+
+    def __subscribe(self):
+        cp = self.__core.get_service("channel_manager").\
+            channel_publisher_get()
+        channel_list = SettingsBase.get_setting(self, "channels")
+        if len(channel_list) == 0:
+            cp.subscribe_new_channels(self.__new_channel_cb)
+            cp.subscribe_to_all(self.__new_sample_cb)
+        else:
+            for channel_name in channel_list:
+                cp.subscribe(channel_name, self.__new_sample_cb)
+
+    def __unsubscribe(self):
+        cp = self.__core.get_service("channel_manager").\
+            channel_publisher_get()
+        channel_list = SettingsBase.get_setting(self, "channels")
+        if len(channel_list) == 0:
+            try:
+                cp.unsubscribe_new_channels(self.__new_channel_cb)
+            except KeyError:
+                pass
+            cp.unsubscribe_from_all(self.__new_sample_cb)
+        else:
+            for channel_name in channel_list:
+                try:
+                    cp.unsubscribe(channel_name, self.__new_sample_cb)
+                except KeyError:
+                    pass
+
+    def __snapshot(self):
+        sio = StringIO()
+        self._write_channels(sio)
+        return sio.getvalue()
+
+    def __run_stream(self):
+        buffer_size = SettingsBase.get_setting(self, "buffer_size")
+        coalesce = (SettingsBase.get_setting(self, "slow_consumer") ==
+                    SLOW_COALESCE)
+
+        peers = []
+        if SettingsBase.get_setting(self, "server") is not None:
+            peers.append((SettingsBase.get_setting(self, "server"),
+                          SettingsBase.get_setting(self, "port")))
+        for peer in SettingsBase.get_setting(self, "servers"):
+            peers.append(_parse_peer(peer))
+
+        clients = [ CSVClient(addr, buffer_size, coalesce, outbound=True)
+                    for addr in peers ]
+
+        self.__outer_sd, self.__inner_sd = socketpair()
+        for sd in (self.__outer_sd, self.__inner_sd):
+            sd.setblocking(0)
+
+        listen_sd = None
+        listen_port = SettingsBase.get_setting(self, "listen_port")
+        listen_retry_at = 0
+
+        self.__subscribe()
+        try:
+            while not self.__stopevent.isSet():
+                now = digitime.real_clock()
+                timeout = SHUTDOWN_WAIT
+                if listen_port and listen_sd is None:
+                    if now >= listen_retry_at:
+                        listen_sd = self.__listen(listen_port)
+                        listen_retry_at = now + RECONNECT_DELAY
+                    if listen_sd is None:
+                        timeout = min(timeout, max(0, listen_retry_at - now))
+                for client in clients:
+                    if client.sd is None and client.outbound:
+                        if now >= client.retry_at:
+                            self.__connect(client)
+                        if client.sd is None:
+                            timeout = min(timeout,
+                                          max(0, client.retry_at - now))
+
+                rl = [ self.__inner_sd ]
+                if listen_sd is not None:
+                    rl.append(listen_sd)
+                wl = []
+                for client in clients:
+                    if client.sd is None:
+                        continue
+                    if client.connecting:
+                        wl.append(client.sd)
+                        continue
+                    rl.append(client.sd)
+                    if client.pending():
+                        wl.append(client.sd)
+
+                rl, wl, _ = select(rl, wl, [], timeout)
+
+                by_sd = dict((client.sd, client) for client in clients
+                             if client.sd is not None)
+
+                for sd in rl:
+                    if sd is self.__inner_sd:
+                        try:
+                            while sd.recv(RECV_SIZE):
+                                pass
+                        except error:
+                            pass
+                    elif sd is listen_sd:
+                        self.__accept(listen_sd, clients, buffer_size,
+                                      coalesce)
+                    elif sd in by_sd:
+                        # peers are not expected to talk, drain input:
+                        client = by_sd[sd]
+                        try:
+                            data = sd.recv(RECV_SIZE)
+                        except error, e:
+                            data = ''
+                        if not data:
+                            self.__drop(client, clients, "closed by peer")
+
+                for sd in wl:
+                    client = by_sd.get(sd)
+                    if client is None or client.sd is None:
+                        continue
+                    if client.connecting:
+                        self.__connected(client)
+                        continue
+                    try:
+                        client.send()
+                    except error, e:
+                        self.__drop(client, clients, str(e))
+
+                self.__updates_lock.acquire()
+                try:
+                    updates = self.__updates
+                    self.__updates = {}
+                finally:
+                    self.__updates_lock.release()
+
+                if updates:
+                    for client in clients:
+                        if client.sd is not None and not client.connecting:
+                            for channel_name, row in updates.iteritems():
+                                client.enqueue(channel_name, row)
+        finally:
+            self.__unsubscribe()
+            for client in clients:
+                client.close()
+            for sd in (listen_sd, self.__outer_sd, self.__inner_sd):
+                if sd is not None:
+                    try:
+                        sd.close()
+                    except:
+                        pass
+            self.__outer_sd = self.__inner_sd = None
+
+    def __listen(self, listen_port):
+        sd = socket(AF_INET, SOCK_STREAM)
+        try:
+            sd.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+            sd.bind(('', listen_port))
+            sd.listen(5)
+        except error, e:
+            self.__tracer.error("error listening on port %d: %s", \
+                listen_port, str(e))
+            sd.close()
+            return None
+        sd.setblocking(0)
+        self.__tracer.info("listening on port %d", listen_port)
+        return sd
+
+    def __connect(self, client):
+        sd = socket(AF_INET, SOCK_STREAM)
+        sd.setblocking(0)
+        try:
+            err = sd.connect_ex(client.addr)
+        except error, e:
+            # e.g. name resolution failure
+            err = e.args[0]
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            self.__tracer.error("error connecting to %s:%d: %s", \
+                client.addr[0], client.addr[1], str(err))
+            sd.close()
+            client.retry_at = digitime.real_clock() + RECONNECT_DELAY
+            return
+        client.attach(sd, connecting=(err != 0))
+        if err == 0:
+            self.__connected(client)
+
+    def __connected(self, client):
+        if client.connecting:
+            err = client.sd.getsockopt(SOL_SOCKET, SO_ERROR)
+            if err:
+                self.__tracer.error("error connecting to %s:%d: %s", \
+                    client.addr[0], client.addr[1], str(err))
+                client.close()
+                client.retry_at = digitime.real_clock() + RECONNECT_DELAY
+                return
+        client.connecting = False
+        self.__tracer.info("connected to %s:%d", client.addr[0],
+                           client.addr[1])
+        client.push(self.__snapshot())
+
+    def __accept(self, listen_sd, clients, buffer_size, coalesce):
+        try:
+            sd, addr = listen_sd.accept()
+        except error:
+            return
+        sd.setblocking(0)
+        self.__tracer.info("accepted peer %s:%d", addr[0], addr[1])
+        client = CSVClient(addr, buffer_size, coalesce, outbound=False)
+        client.attach(sd, connecting=False)
+        client.push(self.__snapshot())
+        clients.append(client)
+
+    def __drop(self, client, clients, reason):
+        self.__tracer.warning("peer %s:%d lost: %s", client.addr[0],
+                              client.addr[1], reason)
+        client.close()
+        if client.outbound:
+            client.retry_at = digitime.real_clock() + RECONNECT_DELAY
+        else:
+            clients.remove(client)
+
+
+class CSVClient(object):
+    """
+    One stream mode peer and its bounded send buffer.
+
+    Rows which do not fit in the buffer are either kept in a per-channel
+    table, so that only the latest row of a channel is sent once the
+    peer catches up, or dropped.
+    """
+
+    def __init__(self, addr, buffer_size, coalesce, outbound):
+        self.addr = addr
+        self.outbound = outbound
+        self.sd = None
+        self.connecting = False
+        self.retry_at = 0
+        self.dropped = 0
+
+        self.__buffer_size = buffer_size
+        self.__coalesce = coalesce
+        self.__wbuf = []
+        self.__wbuf_len = 0
+        self.__coalesced = {}
+
+    def attach(self, sd, connecting):
+        self.sd = sd
+        self.connecting = connecting
+
+    def close(self):
+        if self.sd is not None:
+            try:
+                self.sd.close()
+            except:
+                pass
+        self.sd = None
+        self.connecting = False
+        self.__wbuf = []
+        self.__wbuf_len = 0
+        self.__coalesced.clear()
+
+    def pending(self):
+        return self.__wbuf_len > 0 or len(self.__coalesced) > 0
+
+    def push(self, data):
+        """Queue data regardless of the buffer limit."""
+        if data:
+            self.__wbuf.append(data)
+            self.__wbuf_len += len(data)
+
+    def enqueue(self, channel_name, row):
+        """Queue a channel row, subject to the slow consumer policy."""
+        if (not self.__coalesced and
+            self.__wbuf_len + len(row) <= self.__buffer_size):
+            self.push(row)
+        elif self.__coalesce:
+            self.__coalesced[channel_name] = row
+        else:
+            self.dropped += 1
+
+    def send(self):
+        """Send as much as the socket accepts without blocking."""
+        if self.__wbuf:
+            data = ''.join(self.__wbuf)
+            try:
+                sent = self.sd.send(data)
+            except error, e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+            data = data[sent:]
+            if data:
+                self.__wbuf = [ data ]
+            else:
+                self.__wbuf = []
+            self.__wbuf_len = len(data)
+
+        # refill from the coalesced rows as room becomes available:
+        while self.__coalesced:
+            channel_name, row = self.__coalesced.popitem()
+            if self.__wbuf_len + len(row) > self.__buffer_size:
+                self.__coalesced[channel_name] = row
+                break
+            self.push(row)
+
+
+# internal functions & classes
+def _parse_peer(peer):
+    """Parse a "host:port" string into an address tuple."""
+    try:
+        host, port = peer.rsplit(':', 1)
+        port = int(port)
+    except (ValueError, AttributeError):
+        raise ValueError("peer must be given as host:port")
+    if not host or not 0 < port <= 65535:
+        raise ValueError("peer must be given as host:port")
+    return (host, port)
@@ -68,6 +68,9 @@ class Sample(object):
 
        An integer defining trustworthiness or quality of the `value`
 
+    A sample read from a channel is shared by all the readers of the
+    channel: it must not be modified.  Create a new sample instead.
+
     """
 
     # Using slots saves memory by keeping __dict__ undefined.
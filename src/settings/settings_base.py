@@ -128,6 +128,7 @@ Thankfully, in most instances, bindings will be managed by the system.
 import sys, traceback
 from copy import copy, deepcopy
 from threading import RLock
+import digitime
 
 # constants
 REG_PENDING = 0
@@ -226,6 +227,97 @@ class Setting:
         return parsed_value
 
 
+class SettingsSnapshot(object):
+    """
+    An immutable view of the running settings of a :class:`SettingsBase`
+    instance.
+
+    Settings are read as attributes (or by subscript), which costs a
+    single attribute lookup.  A new snapshot is published by
+    :meth:`SettingsBase.commit_settings` each time settings are
+    committed, so a reference to a snapshot always sees one consistent
+    set of values even while the object is being reconfigured.
+
+    """
+    def __init__(self, settings):
+        self.__dict__.update(settings)
+
+    def __setattr__(self, name, value):
+        raise AttributeError, "settings snapshot is read-only"
+
+    def __delattr__(self, name):
+        raise AttributeError, "settings snapshot is read-only"
+
+    def __getitem__(self, name):
+        try:
+            return self.__dict__[name]
+        except KeyError:
+            raise SettingNotFound, "setting '%s' not found" % (name)
+
+    def __contains__(self, name):
+        return name in self.__dict__
+
+    def __repr__(self):
+        return "SettingsSnapshot(%r)" % (self.__dict__)
+
+
+class PendingBindings:
+    """
+    The set of bindings with changed settings.
+
+    Bindings are bucketed by depth (the length of the binding tuple)
+    so that they may be iterated breadth first, and in insertion order
+    within a depth.  Membership tests, insertion and removal are O(1).
+
+    """
+    def __init__(self):
+        self.__buckets = { }    # depth -> {binding -> insertion sequence}
+        self.__sequence = 0
+
+    def add(self, binding):
+        """Mark `binding` pending, if it is not already."""
+        bucket = self.__buckets.setdefault(len(binding), { })
+        if binding not in bucket:
+            bucket[binding] = self.__sequence
+            self.__sequence += 1
+
+    def discard(self, binding):
+        """Remove `binding` from the set, if present."""
+        bucket = self.__buckets.get(len(binding))
+        if bucket is not None and binding in bucket:
+            del bucket[binding]
+            if not bucket:
+                del self.__buckets[len(binding)]
+
+    def ordered(self):
+        """
+        Return a list of the pending bindings, shallowest first and
+        in insertion order within a depth.
+
+        """
+        result = [ ]
+        depths = self.__buckets.keys()
+        depths.sort()
+        for depth in depths:
+            bucket = self.__buckets[depth]
+            bindings = [ (sequence, binding)
+                         for binding, sequence in bucket.iteritems() ]
+            bindings.sort()
+            result.extend([ binding for sequence, binding in bindings ])
+        return result
+
+    def __contains__(self, binding):
+        bucket = self.__buckets.get(len(binding))
+        return bucket is not None and binding in bucket
+
+    def __len__(self):
+        return reduce(lambda n, bucket: n + len(bucket),
+                      self.__buckets.itervalues(), 0)
+
+    def __iter__(self):
+        return iter(self.ordered())
+
+
 class SettingsBase(object):
     """
     A settings implementation, base class.
@@ -259,9 +351,15 @@ class SettingsBase(object):
     _settings_global_pending_registry = {}  # all pending settings
     _settings_global_running_registry = {}  # all active settings
     _settings_global_bindings = {}          # bindings -> settings instances
-    _settings_global_pending_bindings = [ ] # bindings with changed settings
+    _settings_global_pending_bindings = PendingBindings()
+                                            # bindings with changed settings
+    _settings_global_apply_timings = {}     # binding name -> seconds of
+                                            # the last globally applied
     _settings_global_serializers = {}       # serializer name -> serializer
     _settings_global_lock = RLock()         # global lock
+    _settings_global_apply_depth = 0        # nested globally applied settings
+    _settings_global_applied_calls = []     # (function, args) to call once
+                                            # they have been applied
 
     def __init__(self, binding=(), setting_defs = []):
         # Add the binding:
@@ -274,6 +372,8 @@ class SettingsBase(object):
         # Local (non-shared state) variables:
         self._settings_binding = binding
         self._settings_definitions = { }
+        # replaced on each commit_settings:
+        self._settings_snapshot = SettingsSnapshot({ })
         self._settings_running_registry = \
             self._settings_global_running_registry
         self._settings_pending_registry = \
@@ -403,8 +503,7 @@ class SettingsBase(object):
 
         self._settings_definitions[name].try_value(value)
         self._settings_pending_registry[name] = value
-        if self._settings_binding not in self._settings_global_pending_bindings:
-            self._settings_global_pending_bindings.append(self._settings_binding)
+        self._settings_global_pending_bindings.add(self._settings_binding)
 
     def get_setting(self, name):
         """Return a setting value from the active settings registry."""
@@ -415,6 +514,17 @@ class SettingsBase(object):
 
         return self._settings_running_registry[name]
 
+    def get_settings_snapshot(self):
+        """
+        Return the :class:`SettingsSnapshot` of the active settings.
+
+        Code on hot paths should read settings from the snapshot
+        (directly through `self._settings_snapshot` in subclasses)
+        rather than through :meth:`get_setting`.
+
+        """
+        return self._settings_snapshot
+
     def get_setting_definition(self, name):
         """
         Returns the definition for an individual setting.
@@ -534,11 +644,17 @@ class SettingsBase(object):
                                     continue
                                 target_instance_match[key] = \
                                     source_instance[key]
-            if self._settings_binding in \
-                   self._settings_global_pending_bindings:
-                # Mark these settings as having been applied:
-                self._settings_global_pending_bindings.remove(
-                    self._settings_binding)
+            # Publish the new settings:
+            running = self._settings_running_registry
+            snapshot = { }
+            for setting_name in self._settings_definitions:
+                if setting_name in running:
+                    snapshot[setting_name] = running[setting_name]
+            self._settings_snapshot = SettingsSnapshot(snapshot)
+
+            # Mark these settings as having been applied:
+            self._settings_global_pending_bindings.discard(
+                self._settings_binding)
         finally:
             self._settings_global_lock.release()
 
@@ -667,20 +783,25 @@ class SettingsBase(object):
                'dot.delimited.binding.1': { ... },
             }
 
+        The time spent applying the settings of each binding is
+        available afterwards from :meth:`get_apply_timings`.
+
         """
 
         return_dict = { }
+        apply_timings = { }
 
         self._settings_global_lock.acquire()
+        SettingsBase._settings_global_apply_depth += 1
         try:
-            self._settings_global_pending_bindings.sort(lambda p, q: cmp(len(p),len(q)))
-            # the pending bindings list will be modified by commit_settings,
-            # so we must create a copy of it here for our iteration:
-            pending_bindings = copy(self._settings_global_pending_bindings)
+            # the pending bindings set will be modified by commit_settings,
+            # so we iterate over an ordered copy of it:
+            pending_bindings = self._settings_global_pending_bindings.ordered()
             for binding in pending_bindings:
                 binding_name = self.binding_to_str(binding)
                 if binding not in self._settings_global_bindings:
                     continue
+                started = digitime.time()
                 for settings_obj in self._settings_global_bindings[binding]:
                     return_dict[binding_name] = {}
                     try:
@@ -694,39 +815,183 @@ class SettingsBase(object):
                                  " processing settings on '%s': %s", \
                                    binding_name, str(e))
                         self.__tracer.debug(traceback.format_exc())
+                elapsed = digitime.time() - started
+                apply_timings[binding_name] = elapsed
+                self.__tracer.debug("settings applied on '%s' in %.3fs",
+                                    binding_name, elapsed)
+            SettingsBase._settings_global_apply_timings = apply_timings
         finally:
+            SettingsBase._settings_global_apply_depth -= 1
             self._settings_global_lock.release()
 
+        self.__run_applied_calls()
+
         return return_dict
 
+    def get_apply_timings(self):
+        """
+        Return the time spent applying settings by the last call to
+        :meth:`globally_apply_settings`, as a dictionary of seconds by
+        dot delimited binding.
+
+        """
+        return dict(SettingsBase._settings_global_apply_timings)
+
+    def call_when_applied(self, function, *args):
+        """
+        Call `function` with `args` once the settings being globally
+        applied have been, and the global lock has been released; at
+        once if no settings are being applied.
+
+        Used by :meth:`apply_settings` implementations for work which
+        must not run under the global lock, such as starting instances
+        from other threads, whose own :meth:`apply_settings` would wait
+        for it.
+
+        """
+        self._settings_global_lock.acquire()
+        try:
+            if SettingsBase._settings_global_apply_depth:
+                self._settings_global_applied_calls.append((function, args))
+                return
+        finally:
+            self._settings_global_lock.release()
+
+        function(*args)
+
+    def __run_applied_calls(self):
+        self._settings_global_lock.acquire()
+        try:
+            if SettingsBase._settings_global_apply_depth:
+                # still within an outer application of settings:
+                return
+            calls = self._settings_global_applied_calls[:]
+            del self._settings_global_applied_calls[:]
+        finally:
+            self._settings_global_lock.release()
+
+        for function, args in calls:
+            try:
+                function(*args)
+            except Exception, e:
+                self.__tracer.error("caught exception after applying " +
+                                    "settings: %s", str(e))
+                self.__tracer.debug(traceback.format_exc())
+
+    def __changed_bindings(self, raw_settings):
+        """
+        Return the list of bindings owning a value which would change if
+        `raw_settings` were loaded into the pending registry.
+
+        A value is owned by the deepest binding on its path; the
+        members of an instance list are owned by the binding of the
+        instance list itself (adding, removing or reordering members
+        changes it), except for their sub-trees bound elsewhere.
+
+        """
+        bindings = self._settings_global_bindings
+        changed = { }
+
+        def _mark(owner):
+            if owner is not None:
+                changed[owner] = True
+
+        def _walk(new, old, path, owner):
+            if path in bindings:
+                owner = path
+            if not isinstance(new, dict):
+                if new != old:
+                    _mark(owner)
+                return
+            if not isinstance(old, dict):
+                _mark(owner)
+                old = { }
+            for key in new:
+                if (key == 'instance_list' and
+                    isinstance(new[key], list)):
+                    old_list = old.get(key)
+                    if not isinstance(old_list, list):
+                        old_list = [ ]
+                    old_members = { }
+                    old_names = [ ]
+                    for member in old_list:
+                        if isinstance(member, dict) and 'name' in member:
+                            old_members[member['name']] = member
+                            old_names.append(member['name'])
+                    new_names = [ ]
+                    for member in new[key]:
+                        if isinstance(member, dict) and 'name' in member:
+                            new_names.append(member['name'])
+                            _walk(member, old_members.get(member['name']),
+                                  path + ((member['name'],),), owner)
+                    if (new_names != old_names or
+                        len(new[key]) != len(old_list)):
+                        _mark(owner)
+                elif key in old:
+                    _walk(new[key], old[key], path + (key,), owner)
+                else:
+                    _mark(owner)
+                    _walk(new[key], None, path + (key,), owner)
+
+        _walk(raw_settings, self._settings_global_pending_registry, (), None)
+        return changed.keys()
+
     def __do_load(self, raw_settings):
         def _recursive_load(to_registry, from_registry):
             if isinstance(from_registry, dict):
                 for key in from_registry:
-                    if key in to_registry and isinstance(to_registry[key], dict):
-                        to_registry[key].update(from_registry[key])
+                    new = from_registry[key]
+                    old = to_registry.get(key)
+                    if isinstance(new, dict) and isinstance(old, dict):
+                        _recursive_load(old, new)
+                    elif (key == 'instance_list' and
+                          isinstance(new, list) and isinstance(old, list)):
+                        _load_instance_list(old, new)
                     else:
-                        to_registry[key] = from_registry[key]
-                    _recursive_load(to_registry[key], from_registry[key])
+                        to_registry[key] = new
+
+        def _load_instance_list(to_list, from_list):
+            # Keep the existing members (and the list itself), they are
+            # the registries bound by the running instances:
+            old_members = { }
+            for member in to_list:
+                if isinstance(member, dict) and 'name' in member:
+                    old_members[member['name']] = member
+            merged = [ ]
+            for member in from_list:
+                if (isinstance(member, dict) and
+                    member.get('name') in old_members):
+                    old = old_members[member['name']]
+                    _recursive_load(old, member)
+                    merged.append(old)
+                else:
+                    merged.append(member)
+            to_list[:] = merged
 
         self._settings_global_lock.acquire()
+        SettingsBase._settings_global_apply_depth += 1
         try:
+            # Only the bindings whose settings differ from the ones
+            # already loaded need to be applied again:
+            changed_bindings = self.__changed_bindings(raw_settings)
+
             # This load will preserve existing references, which is
             # important for classes sharing this module to keep their
             # presently bound view on their settings:
             _recursive_load(self._settings_global_pending_registry,
                                 raw_settings)
 
-            # Assume all settings have been changed, dirty all bindings:
-            for binding in self._settings_global_bindings:
-                if binding not in self._settings_global_pending_bindings:
-                    self._settings_global_pending_bindings.append(binding)
+            for binding in changed_bindings:
+                self._settings_global_pending_bindings.add(binding)
 
             # Apply the settings, breadth first:
             self.globally_apply_settings()
         finally:
+            SettingsBase._settings_global_apply_depth -= 1
             self._settings_global_lock.release()
 
+        self.__run_applied_calls()
+
 
     def load(self, flo, serializer_name):
         """
@@ -757,6 +1022,18 @@ class SettingsBase(object):
         raw_settings = serializer.loads(string)
         self.__do_load(raw_settings)
 
+    def load_tree(self, raw_settings):
+        """
+        Globally Load an already deserialized settings tree.
+
+        Parameters:
+
+        * `raw_settings`: a dictionary of dictionaries, as returned by
+          the `loads` method of a settings serializer
+
+        """
+        self.__do_load(raw_settings)
+
     def save(self, flo, serializer_name, registry_def=REG_RUNNING):
         """
         Save all system settings to a file like object using a
@@ -930,10 +1207,7 @@ class SettingsContext:
             try:
                 update_to.update(raw_settings)
                 # dirty pending settings binding:
-                if self.__cur_binding not in \
-                  sbi._settings_global_pending_bindings:
-                    sbi._settings_global_pending_bindings.append(
-                      self.__cur_binding)
+                sbi._settings_global_pending_bindings.add(self.__cur_binding)
             finally:
                 sbi._settings_global_lock.release()
             return
@@ -952,9 +1226,7 @@ class SettingsContext:
         try:
             update_to[key] = raw_settings
             # dirty the appropriate binding:
-            if penultimate_binding not in sbi._settings_global_pending_bindings:
-                sbi._settings_global_pending_bindings.append(
-                  penultimate_binding)
+            sbi._settings_global_pending_bindings.add(penultimate_binding)
             # update our local reference to new object:
             self.__cur_pending_registry = update_to[key]
         finally:
@@ -0,0 +1,176 @@
+############################################################################
+#                                                                          #
+# Copyright (c)2008-2012, Digi International (Digi). All Rights Reserved.  #
+#                                                                          #
+# Permission to use, copy, modify, and distribute this software and its    #
+# documentation, without fee and without a signed licensing agreement, is  #
+# hereby granted, provided that the software is used on Digi products only #
+# and that the software contain this copyright notice,  and the following  #
+# two paragraphs appear in all copies, modifications, and distributions as #
+# well. Contact Product Management, Digi International, Inc., 11001 Bren   #
+# Road East, Minnetonka, MN, +1 952-912-3444, for commercial licensing     #
+# opportunities for non-Digi products.                                     #
+#                                                                          #
+# DIGI SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED   #
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A          #
+# PARTICULAR PURPOSE. THE SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, #
+# PROVIDED HEREUNDER IS PROVIDED "AS IS" AND WITHOUT WARRANTY OF ANY KIND. #
+# DIGI HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,         #
+# ENHANCEMENTS, OR MODIFICATIONS.                                          #
+#                                                                          #
+# IN NO EVENT SHALL DIGI BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT,      #
+# SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS,   #
+# ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF   #
+# DIGI HAS BEEN ADVISED OF THE POSSIBILITY OF SUCH DAMAGES.                #
+#                                                                          #
+############################################################################
+
+"""\
+Compiled settings cache.
+
+Parsing the settings file with the pure-Python YAML parser is a large
+part of the DIA start up time on Digi devices.  This module stores the
+dictionary-of-dictionaries produced by a settings serializer in a
+binary form (:mod:`marshal`, or :mod:`pickle` for trees holding other
+than built-in types) next to the settings file, so that it may be
+loaded instead of parsed again as long as the settings text does not
+change.
+
+Cache entries are keyed by a digest of the settings text, the
+serializer name and its `version` attribute, and the Python version.
+"""
+
+# imports
+import os
+import sys
+import marshal
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+try:
+    from hashlib import md5 as _digest
+except ImportError:
+    from md5 import new as _digest
+
+# constants
+CACHE_FILE_EXT = ".cache"
+
+# format of the cache file itself:
+CACHE_FORMAT_VERSION = 1
+
+FORMAT_MARSHAL = 'M'
+FORMAT_PICKLE = 'P'
+
+# exception classes
+
+# interface functions
+
+# classes
+class SettingsCache:
+    """\
+    Stores and retrieves parsed settings trees for a settings file.
+
+    Parameters:
+
+    * `settings_filename` - the settings file the cache is kept for.
+      The cache file is stored beside it.
+
+    All operations are best effort: any failure to read or write the
+    cache is reported as a cache miss and never prevents the settings
+    from being loaded the regular way.
+    """
+    def __init__(self, settings_filename):
+        self.__cache_filename = settings_filename + CACHE_FILE_EXT
+
+    def filename(self):
+        """Return the name of the cache file."""
+        return self.__cache_filename
+
+    def key(self, settings_text, serializer_name, serializer):
+        """\
+        Compute the cache key of `settings_text` when parsed by
+        `serializer`, registered as `serializer_name`.
+        """
+        digest = _digest(settings_text)
+        digest.update("\0%s\0%s\0%s\0%d" %
+                      (serializer_name,
+                       getattr(serializer, 'version', 0),
+                       sys.version, marshal.version))
+        return digest.hexdigest()
+
+    def load(self, key):
+        """\
+        Return the settings tree stored under `key`, or None if the
+        cache is missing, stale or unreadable.
+        """
+        try:
+            flo = open(self.__cache_filename, 'rb')
+            try:
+                data = flo.read()
+            finally:
+                flo.close()
+        except (IOError, OSError):
+            return None
+
+        try:
+            fmt, payload = data[0], data[1:]
+            if fmt == FORMAT_MARSHAL:
+                entry = marshal.loads(payload)
+            elif fmt == FORMAT_PICKLE:
+                entry = pickle.loads(payload)
+            else:
+                return None
+            cache_format, cache_key, tree = entry
+        except Exception:
+            return None
+
+        if cache_format != CACHE_FORMAT_VERSION or cache_key != key:
+            return None
+
+        return tree
+
+    def store(self, key, tree):
+        """\
+        Store `tree` under `key`, replacing any previous entry.
+
+        Returns True if the cache file was written.
+        """
+        entry = (CACHE_FORMAT_VERSION, key, tree)
+        try:
+            data = FORMAT_MARSHAL + marshal.dumps(entry)
+        except ValueError:
+            # tree holds objects marshal does not support:
+            try:
+                data = FORMAT_PICKLE + pickle.dumps(entry, 2)
+            except Exception:
+                return False
+
+        tmp_filename = self.__cache_filename + ".tmp"
+        try:
+            flo = open(tmp_filename, 'wb')
+            try:
+                flo.write(data)
+            finally:
+                flo.close()
+            if os.path.exists(self.__cache_filename):
+                # rename() does not replace existing files on every platform
+                os.remove(self.__cache_filename)
+            os.rename(tmp_filename, self.__cache_filename)
+        except (IOError, OSError):
+            try:
+                os.remove(tmp_filename)
+            except (IOError, OSError):
+                pass
+            return False
+
+        return True
+
+    def invalidate(self):
+        """Remove the cache file, if any."""
+        try:
+            os.remove(self.__cache_filename)
+        except (IOError, OSError):
+            pass
+
+# internal functions & classes
@@ -91,6 +91,11 @@ class SettingsSerializerBase:
         <instance_lists>` definition.
         
         """
+    # Version of the tree produced by the serializer.  Bump it when
+    # the resulting tree changes for the same input so that cached
+    # parses (see :mod:`settings.settings_cache`) are discarded.
+    version = 1
+
     def load(self, flo):
         """
         Load serialized settings from a file like object.
@@ -43,7 +43,6 @@ YAML Settings Serializer for DIA.
 
 # imports
 from copy import copy
-import lib.yaml as yaml
 from settings_serializer_base import SettingsSerializerBase
 from common.types.boolean import Boolean
 
@@ -224,17 +223,30 @@ class SettingsSerializerYaml(SettingsSerializerBase):
         # expand tabs to 8 characters:
         a_string =  a_string.expandtabs(8)
 
-        return self.__reparse_instances(yaml.load(a_string))
+        return self.__reparse_instances(_yaml().load(a_string))
 
     def saves(self, dict_of_dicts):
-        return yaml.dump(self.__remove_instances(dict_of_dicts))
+        return _yaml().dump(self.__remove_instances(dict_of_dicts))
 
     def serialize_application_result(self, application_result):
-        return yaml.dump(application_result)
+        return _yaml().dump(application_result)
     
 
 # internal functions & classes
 
+# The YAML library is large and, when the parsed settings are loaded
+# from the settings cache, not needed at all: it is only imported on
+# first use.
+_yaml_module = None
+
+def _yaml():
+    global _yaml_module
+    if _yaml_module is None:
+        import lib.yaml as yaml
+        yaml.add_representer(Boolean, Boolean_representer)
+        _yaml_module = yaml
+    return _yaml_module
+
 def Boolean_representer(dumper, data):
     # Kind of a kludge.  All drivers, and the Boolean class itself can
     # parse the strings that result and configure a Boolean so the
@@ -250,7 +262,5 @@ def Boolean_representer(dumper, data):
     # constructor.
 
     # We do have a 
-    return dumper.represent_str(str(data))
-
-yaml.add_representer(Boolean, Boolean_representer)    
+    return dumper.represent_str(str(data))    
 